@@ -0,0 +1,281 @@
+import csv
+import json
+import math
+import time
+import logging
+import numpy as np
+from constants import *
+from spatial import NeighborIndex, torus_distances
+from profiler import PROFILER
+
+# 時系列として出力する1回分のスカラーの列
+ANALYTICS_COLUMNS = ('tick', 'count', 'polarization', 'cluster_polarization', 'angular_momentum',
+                     'nn_mean', 'nn_median', 'nn_p10', 'nn_p90', 'isolated', 'clusters', 'largest_cluster')
+
+
+def density_histogram(x, y, width, height, bins=ANALYTICS_DENSITY_BINS):
+    """世界をbins=(列, 行)のマスに分けた、マスごとのメダカの数（形は(列, 行)）"""
+    cols, rows = bins
+    cell_x = np.clip((np.asarray(x) * (cols / width)).astype(np.int64), 0, cols - 1)
+    cell_y = np.clip((np.asarray(y) * (rows / height)).astype(np.int64), 0, rows - 1)
+    return np.bincount(cell_x * rows + cell_y, minlength=cols * rows).reshape(cols, rows)
+
+
+def unit_headings(dx, dy):
+    """向きの単位ベクトル（向きのないメダカは0）"""
+    dx = np.asarray(dx, dtype=np.float64)
+    dy = np.asarray(dy, dtype=np.float64)
+    length = np.hypot(dx, dy)
+    moving = length > 0
+    ux = np.divide(dx, length, out=np.zeros_like(dx), where=moving)
+    uy = np.divide(dy, length, out=np.zeros_like(dy), where=moving)
+    return ux, uy
+
+
+def polarization(dx, dy):
+    """分極（向きの単位ベクトルの平均の長さ。全員が同じ向きなら1、ばらばらなら0に近い）"""
+    ux, uy = unit_headings(dx, dy)
+    if len(ux) == 0:
+        return 0.0
+    return float(math.hypot(ux.mean(), uy.mean()))
+
+
+def _union(parent, first, second):
+    """親の配列parentで、first[k]とsecond[k]の属する木を小さい番号の根へつなぐ（戻り値は根まで縮めたparent）"""
+    while len(first):
+        root_first, root_second = parent[first], parent[second]
+        linked = root_first != root_second
+        if not linked.any():
+            break
+        first, second = first[linked], second[linked]
+        smaller = np.minimum(root_first[linked], root_second[linked])
+        np.minimum.at(parent, root_first[linked], smaller)
+        np.minimum.at(parent, root_second[linked], smaller)
+        parent = _compress(parent)
+    return parent
+
+
+def _compress(parent):
+    """ポインタジャンプで全ての要素の親を根にする"""
+    while True:
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            return parent
+        parent = jumped
+
+
+def cluster_labels(x, y, width=WORLD_WIDTH, height=WORLD_HEIGHT, link_distance=ANALYTICS_LINK_DISTANCE,
+                   max_pairs=4_000_000):
+    """距離link_distance以内のメダカを辿ってつながる集まりごとの番号（0から、大きい集まりほど小さい番号）
+
+    対角線がlink_distance以下のセルに分けると同じセルのメダカは必ずつながるため、セルを単位にまとめ、
+    まだつながっていない近くのセルの組についてだけメダカどうしの距離を調べる（密集していても全ての組を作らない）。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    count = len(x)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    cell_size = link_distance / math.sqrt(2)
+    cols = max(1, math.ceil(width / cell_size))
+    rows = max(1, math.ceil(height / cell_size))
+    cell_width, cell_height = width / cols, height / rows
+    keys = (np.floor(x / cell_width).astype(np.int64) % cols) * rows + np.floor(y / cell_height).astype(np.int64) % rows
+    cells, fish_cell = np.unique(keys, return_inverse=True)
+    order = np.argsort(fish_cell, kind='stable')
+    counts = np.bincount(fish_cell, minlength=len(cells))
+    starts = np.cumsum(counts) - counts
+    cell_x, cell_y = cells // rows, cells % rows
+    parent = np.arange(len(cells))
+
+    # 近い順にセルのずれを調べる（向きが逆のずれは同じ組なので片方だけ）
+    reach_x, reach_y = min(math.ceil(link_distance / cell_width), cols), min(math.ceil(link_distance / cell_height), rows)
+    offsets = sorted(((offset_x, offset_y) for offset_x in range(0, reach_x + 1) for offset_y in range(-reach_y, reach_y + 1)
+                      if (offset_x > 0 or offset_y > 0)
+                      and math.hypot(max(offset_x - 1, 0) * cell_width, max(abs(offset_y) - 1, 0) * cell_height) <= link_distance),
+                     key=lambda offset: math.hypot(*offset))
+    for offset_x, offset_y in offsets:
+        neighbor_keys = ((cell_x + offset_x) % cols) * rows + (cell_y + offset_y) % rows
+        position = np.minimum(np.searchsorted(cells, neighbor_keys), len(cells) - 1)
+        source = np.flatnonzero(cells[position] == neighbor_keys)
+        target = position[source]
+        pending = (parent[source] != parent[target]) & (source != target)
+        source, target = source[pending], target[pending]
+        if len(source) == 0:
+            continue
+        # セルの組ごとに全てのメダカの組を作り、距離がlink_distance以内の組が1つでもあればつなぐ
+        pair_counts = counts[source] * counts[target]
+        cumulative = np.cumsum(pair_counts)
+        block_start = 0
+        while block_start < len(source):
+            base = cumulative[block_start - 1] if block_start > 0 else 0
+            block_end = max(int(np.searchsorted(cumulative, base + max_pairs, side='right')), block_start + 1)
+            block_counts = pair_counts[block_start:block_end]
+            pair = np.repeat(np.arange(block_start, block_end), block_counts)
+            within = np.arange(int(block_counts.sum())) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+            i_idx = order[starts[source[pair]] + within // counts[target[pair]]]
+            j_idx = order[starts[target[pair]] + within % counts[target[pair]]]
+            linked = np.unique(pair[torus_distances(x[i_idx], y[i_idx], x[j_idx], y[j_idx], width, height)
+                                    <= link_distance])
+            parent = _union(parent, source[linked], target[linked])
+            block_start = block_end
+
+    _, labels, sizes = np.unique(parent[fish_cell], return_inverse=True, return_counts=True)
+    # 大きい集まり順に番号を振り直す
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+    return rank[labels]
+
+
+def _cluster_order_parameters(x, y, ux, uy, labels, members, width, height):
+    """集まりごとの分極と、集まりの中心（トーラス上の円周平均）まわりの角運動量を、大きさで重み付けした平均"""
+    x, y, ux, uy, labels = x[members], y[members], ux[members], uy[members], labels[members]
+    if len(labels) == 0:
+        return 0.0, 0.0
+    sizes = np.bincount(labels)
+    present = sizes > 0
+    polar = np.hypot(np.bincount(labels, ux), np.bincount(labels, uy))
+    centers = []
+    for values, size in ((x, width), (y, height)):
+        angle = values * (2 * math.pi / size)
+        mean_angle = np.arctan2(np.bincount(labels, np.sin(angle)), np.bincount(labels, np.cos(angle)))
+        centers.append((mean_angle % (2 * math.pi)) * (size / (2 * math.pi)))
+    rel_x = x - centers[0][labels]
+    rel_y = y - centers[1][labels]
+    rel_x -= width * np.round(rel_x / width)
+    rel_y -= height * np.round(rel_y / height)
+    radius = np.hypot(rel_x, rel_y)
+    cross = np.divide(rel_x * uy - rel_y * ux, radius, out=np.zeros_like(radius), where=radius > 0)
+    milling = np.abs(np.bincount(labels, cross))
+    total = sizes[present].sum()
+    return float(polar[present].sum() / total), float(milling[present].sum() / total)
+
+
+def compute_analytics(x, y, dx, dy, width=WORLD_WIDTH, height=WORLD_HEIGHT, index=None,
+                      link_distance=ANALYTICS_LINK_DISTANCE, bins=ANALYTICS_DENSITY_BINS,
+                      min_cluster=ANALYTICS_MIN_CLUSTER, nn_max_distance=ANALYTICS_NN_MAX_DISTANCE,
+                      nn_bins=ANALYTICS_NN_BINS):
+    """群れの秩序変数をまとめて計算する（indexに作り済みのセルリストを渡すと使い回す）
+
+    分極は群れ全体の向きの揃い方、cluster_polarization・angular_momentumはmin_cluster匹以上の集まりごとに
+    求めて大きさで重み付けした平均（トーラス上に複数の群れがあっても、群れ全体の重心に引きずられない）。
+    最近傍距離はnn_max_distanceまで探し、それより遠いメダカは孤立（isolated）として数える。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if index is None:
+        index = NeighborIndex(x, y, width=width, height=height)
+    count = len(x)
+    ux, uy = unit_headings(dx, dy)
+    result = {'count': count, 'density': density_histogram(x, y, width, height, bins)}
+
+    edges = np.linspace(0.0, nn_max_distance, nn_bins + 1)
+    if count < 2:
+        result.update({'polarization': polarization(dx, dy), 'cluster_polarization': 0.0, 'angular_momentum': 0.0,
+                       'nn_mean': 0.0, 'nn_median': 0.0, 'nn_p10': 0.0, 'nn_p90': 0.0, 'isolated': float(count),
+                       'clusters': 0, 'largest_cluster': 0,
+                       'nn_histogram': np.zeros(nn_bins, dtype=np.int64), 'nn_edges': edges})
+        return result
+
+    _, nearest = index.query_nearest(1, nn_max_distance)
+    nearest = nearest[:, 0]
+    found = nearest[np.isfinite(nearest)]
+    if len(found):
+        p10, median, p90 = np.percentile(found, (10, 50, 90))
+        nn_mean = float(found.mean())
+    else:
+        p10 = median = p90 = nn_mean = 0.0
+
+    labels = cluster_labels(x, y, width, height, link_distance)
+    sizes = np.bincount(labels)
+    members = sizes[labels] >= min_cluster
+    cluster_polar, milling = _cluster_order_parameters(x, y, ux, uy, labels, members, width, height)
+    result.update({
+        'polarization': float(math.hypot(ux.mean(), uy.mean())),
+        'cluster_polarization': cluster_polar,
+        'angular_momentum': milling,
+        'nn_mean': nn_mean,
+        'nn_median': float(median),
+        'nn_p10': float(p10),
+        'nn_p90': float(p90),
+        'isolated': float(count - len(found)) / count,
+        'clusters': int(np.count_nonzero(sizes >= min_cluster)),
+        'largest_cluster': int(sizes.max()),
+        'nn_histogram': np.histogram(found, bins=edges)[0],
+        'nn_edges': edges
+    })
+    return result
+
+
+class SchoolAnalytics:
+    """interval ティックごとに群れの秩序変数を計算し、直近の結果（描画用）と時系列（出力用）を保持する"""
+
+    def __init__(self, interval=ANALYTICS_INTERVAL, link_distance=ANALYTICS_LINK_DISTANCE, bins=ANALYTICS_DENSITY_BINS):
+        self.interval = max(1, int(interval))
+        self.link_distance = link_distance
+        self.bins = bins
+        self.ticks = 0
+        self.latest = None   # 直近の計算結果（密度のヒストグラム・最近傍距離の分布を含む）
+        self.history = []    # 計算ごとのANALYTICS_COLUMNSの辞書
+        self.logger = logging.getLogger('FishSimulator.Analytics')
+
+    def observe(self, school, tick=None):
+        """1ティックごとに呼ぶ（tick省略時は呼んだ回数で数える）。計算したティックなら結果を、それ以外はNoneを返す"""
+        self.ticks = self.ticks + 1 if tick is None else tick
+        if self.ticks % self.interval != 0:
+            return None
+        start_time = time.perf_counter()
+        state = school.get_state_arrays()
+        width, height = school.world_size
+        result = compute_analytics(state['x'], state['y'], state['dx'], state['dy'], width, height,
+                                   index=school.get_neighbor_index(), link_distance=self.link_distance,
+                                   bins=self.bins)
+        result['tick'] = self.ticks
+        self.latest = result
+        self.history.append({column: result[column] for column in ANALYTICS_COLUMNS})
+        duration = time.perf_counter() - start_time
+        PROFILER.add('analytics', duration)
+        self.logger.debug(f"Analytics at tick {self.ticks} in {duration:.4f}s: "
+                          f"polarization={result['polarization']:.3f}, clusters={result['clusters']}")
+        return result
+
+    def format_lines(self):
+        """直近の結果を画面に表示するテキストの行で返す"""
+        if self.latest is None:
+            return ["Analytics: waiting"]
+        result = self.latest
+        return [
+            f"Analytics (tick {result['tick']}, every {self.interval})",
+            f"Polarization: {result['polarization']:.3f} (clusters {result['cluster_polarization']:.3f})",
+            f"Angular momentum: {result['angular_momentum']:.3f}",
+            f"NN distance: {result['nn_median']:.1f} (p10 {result['nn_p10']:.1f}, p90 {result['nn_p90']:.1f})",
+            f"Clusters: {result['clusters']} (largest {result['largest_cluster']}, isolated {result['isolated']:.1%})"
+        ]
+
+    def to_csv(self, path):
+        """時系列をCSV（1行1回分）で書き出す"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=ANALYTICS_COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.history)
+
+    def to_json(self, path):
+        """時系列と、直近の密度のヒストグラム・最近傍距離の分布をJSONで書き出す"""
+        report = {'interval': self.interval, 'link_distance': self.link_distance, 'history': self.history}
+        if self.latest is not None:
+            report['latest'] = {
+                'tick': self.latest['tick'],
+                'density': self.latest['density'].tolist(),
+                'nn_histogram': self.latest['nn_histogram'].tolist(),
+                'nn_edges': self.latest['nn_edges'].tolist()
+            }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    def export(self, path):
+        """拡張子（.csvならCSV、それ以外はJSON）に応じて書き出す"""
+        if path.lower().endswith('.csv'):
+            self.to_csv(path)
+        else:
+            self.to_json(path)
+        self.logger.info(f"Analytics exported to {path} ({len(self.history)} samples)")
@@ -0,0 +1,492 @@
+import logging
+import time
+import numpy as np
+from fish import Fish
+from school import School
+from constants import *
+from spatial import vision_candidate_pairs, get_vision_rays_array, rays_visible, NeighborIndex
+import utils
+from utils import log_school_state, log_performance
+from profiler import PROFILER
+import kernels
+
+
+class FishView:
+    """ArraySchoolの配列上の1匹を指すビュー（描画・テスト用にFishと同じ属性を提供）"""
+
+    __slots__ = ('_school', '_index')
+
+    def __init__(self, school, index):
+        self._school = school
+        self._index = index
+
+    def _get(name):
+        def getter(self):
+            return getattr(self._school, name)[self._index].item()
+
+        def setter(self, value):
+            getattr(self._school, name)[self._index] = value
+            self._school._derived.clear()
+
+        return property(getter, setter)
+
+    x = _get('_x')
+    y = _get('_y')
+    dx = _get('_dx')
+    dy = _get('_dy')
+    energy = _get('_energy')
+    age = _get('_age')
+    id = property(lambda self: self._school._ids[self._index].item())
+    del _get
+
+    @property
+    def gender_code(self):
+        return self._school._gender[self._index].item()
+
+    @property
+    def gender(self):
+        return GENDERS[self._school._gender[self._index]]
+
+    @gender.setter
+    def gender(self, value):
+        self._school._gender[self._index] = GENDERS.index(value)
+        self._school._derived.clear()
+
+    def __eq__(self, other):
+        return (isinstance(other, FishView) and other._school is self._school
+                and other._index == self._index)
+
+    def __hash__(self):
+        return hash((id(self._school), self._index))
+
+    # 位置・方向の取得と描画はFishの実装をそのまま使う
+    get_position = Fish.get_position
+    get_direction = Fish.get_direction
+    draw = Fish.draw
+
+
+def compute_steering(x, y, dx, dy, vision_range, query_indices=None):
+    """query_indicesのメダカ（省略時は全員）について、視界内の全員からの分離・整列・結合の力をまとめて計算"""
+    count = len(x)
+    rays = get_vision_rays_array(dx, dy)
+
+    sep_x = np.zeros(count)
+    sep_y = np.zeros(count)
+    sum_dx = np.zeros(count)
+    sum_dy = np.zeros(count)
+    sum_x = np.zeros(count)
+    sum_y = np.zeros(count)
+    neighbors = np.zeros(count)
+
+    # 視線のチェック範囲に掛かるセルだけから候補の組を作り、正確な判定で絞り込む
+    for i_idx, j_idx in vision_candidate_pairs(x, y, dx, dy, vision_range, query_indices=query_indices):
+        rel_x = x[j_idx] - x[i_idx]
+        rel_y = y[j_idx] - y[i_idx]
+        visible = np.zeros(len(i_idx), dtype=bool)
+        for k in range(3):
+            visible |= rays_visible(rel_x, rel_y, rays[i_idx, k, 0], rays[i_idx, k, 1], vision_range)
+        i_idx = i_idx[visible]
+        j_idx = j_idx[visible]
+        rel_x = rel_x[visible]
+        rel_y = rel_y[visible]
+
+        # 分離（距離が近いほど強い力で離れる）
+        distance = np.sqrt(rel_x**2 + rel_y**2)
+        force = np.divide(1.0, distance, out=np.zeros_like(distance), where=distance > 0)
+        sep_x += np.bincount(i_idx, weights=-rel_x * force, minlength=count)
+        sep_y += np.bincount(i_idx, weights=-rel_y * force, minlength=count)
+        # 整列・結合用の合計
+        sum_dx += np.bincount(i_idx, weights=dx[j_idx], minlength=count)
+        sum_dy += np.bincount(i_idx, weights=dy[j_idx], minlength=count)
+        sum_x += np.bincount(i_idx, weights=x[j_idx], minlength=count)
+        sum_y += np.bincount(i_idx, weights=y[j_idx], minlength=count)
+        neighbors += np.bincount(i_idx, minlength=count)
+
+    if query_indices is not None:
+        sep_x, sep_y, sum_dx, sum_dy, sum_x, sum_y, neighbors, x, y = (
+            array[query_indices] for array in (sep_x, sep_y, sum_dx, sum_dy, sum_x, sum_y, neighbors, x, y))
+    seen = neighbors > 0
+    safe = np.where(seen, neighbors, 1)
+    align_x = np.where(seen, sum_dx / safe, 0)
+    align_y = np.where(seen, sum_dy / safe, 0)
+    coh_x = np.where(seen, sum_x / safe - x, 0)
+    coh_y = np.where(seen, sum_y / safe - y, 0)
+    return (sep_x, sep_y), (align_x, align_y), (coh_x, coh_y)
+
+
+def apply_steering(x, y, dx, dy, steering, noise, params, width=WORLD_WIDTH, height=WORLD_HEIGHT):
+    """分離・整列・結合の力と慣性・ランダム性を重み付けで合成し、次の位置と向き（新しい配列）を返す（世界は幅width・高さheight）"""
+    (sep_x, sep_y), (align_x, align_y), (coh_x, coh_y) = steering
+    new_dx = (sep_x * params.get('separation_weight', SEPARATION_WEIGHT) +
+              align_x * params.get('alignment_weight', ALIGNMENT_WEIGHT) +
+              coh_x * params.get('cohesion_weight', COHESION_WEIGHT) +
+              noise[0] * params.get('random_weight', RANDOM_WEIGHT) +
+              dx * params.get('inertia_weight', INERTIA_WEIGHT))
+    new_dy = (sep_y * params.get('separation_weight', SEPARATION_WEIGHT) +
+              align_y * params.get('alignment_weight', ALIGNMENT_WEIGHT) +
+              coh_y * params.get('cohesion_weight', COHESION_WEIGHT) +
+              noise[1] * params.get('random_weight', RANDOM_WEIGHT) +
+              dy * params.get('inertia_weight', INERTIA_WEIGHT))
+
+    # 方向を正規化（長さ0なら前の向きを保つ）
+    length = np.sqrt(new_dx**2 + new_dy**2)
+    moving = length > 0
+    next_dx = np.array(dx, dtype=np.float64)
+    next_dy = np.array(dy, dtype=np.float64)
+    next_dx[moving] = new_dx[moving] / length[moving]
+    next_dy[moving] = new_dy[moving] / length[moving]
+
+    # 移動と境界処理（トーラス状の世界）
+    fish_speed = params.get('fish_speed', FISH_SPEED)
+    return (x + next_dx * fish_speed) % width, (y + next_dy * fish_speed) % height, next_dx, next_dy
+
+
+class ArraySchool(School):
+    """メダカの状態をNumPy配列（構造体配列ではなく配列の構造体）で保持し、全体をベクトル演算で更新する群れ"""
+
+    def __init__(self, fish_count=DEFAULT_FISH_COUNT, seed=None, kernel='numpy', world_size=None):
+        self.fish_count = 0
+        # 世界（トーラス）の大きさ（画面の大きさとは別）
+        self.world_width, self.world_height = world_size or (WORLD_WIDTH, WORLD_HEIGHT)
+        self.school_id = id(self)  # 群れのユニークID
+        self.spatial_hash = None
+        self.renderer = None
+        # ティックごとに1回だけ計算する派生値（中心・密度）のキャッシュ
+        self._derived = {}
+        self.logger = logging.getLogger('FishSimulator.School')
+        # 群れごとの乱数生成器（同じシードなら同じ結果を再現できる）
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        # 配列版は常に全員がティック開始時の状態を読んで一斉に更新する
+        self.update_mode = 'synchronous'
+        self.kernel, self._kernel = self._select_kernel(kernel)
+        self._next_id = 0
+        self._allocate(max(16, fish_count))
+
+        self.logger.info(f"ArraySchool {self.school_id} created with {fish_count} fish (seed={seed}, kernel={self.kernel})")
+        self._initial_count = fish_count
+        self.initialize_fish()
+
+    def _select_kernel(self, kernel):
+        """計算カーネルを選ぶ（Numbaが無い場合はNumPyのベクトル演算に切り替える）"""
+        if kernel not in kernels.KERNELS:
+            raise ValueError(f"Unknown kernel: {kernel}")
+        if kernel == 'numpy':
+            return kernel, None
+        if not kernels.NUMBA_AVAILABLE:
+            self.logger.warning(f"numba is not installed; falling back from {kernel} to numpy kernel")
+            return 'numpy', None
+        return kernel, kernels.get_kernel(kernel)
+
+    def _allocate(self, capacity):
+        """配列の容量を確保（既存の値は引き継ぐ）"""
+        count = self.fish_count
+        old = getattr(self, '_x', None)
+        fields = {
+            '_x': np.float64, '_y': np.float64, '_dx': np.float64, '_dy': np.float64,
+            '_energy': np.float64, '_age': np.int64, '_gender': np.int8, '_ids': np.int64,
+        }
+        for name, dtype in fields.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                array[:count] = getattr(self, name)[:count]
+            setattr(self, name, array)
+
+    @property
+    def x(self):
+        return self._x[:self.fish_count]
+
+    @property
+    def y(self):
+        return self._y[:self.fish_count]
+
+    @property
+    def dx(self):
+        return self._dx[:self.fish_count]
+
+    @property
+    def dy(self):
+        return self._dy[:self.fish_count]
+
+    @property
+    def energy(self):
+        return self._energy[:self.fish_count]
+
+    @property
+    def age(self):
+        return self._age[:self.fish_count]
+
+    @property
+    def gender(self):
+        return self._gender[:self.fish_count]
+
+    @property
+    def fish_list(self):
+        """Fish互換のビューのリスト"""
+        return [FishView(self, i) for i in range(self.fish_count)]
+
+    def _append_fish(self, x, y):
+        """メダカを配列の末尾に追加（Fish.__init__と同じ規則で向きと性別を決める）"""
+        count = len(x)
+        needed = self.fish_count + count
+        if needed > len(self._x):
+            self._allocate(max(needed, 2 * len(self._x)))
+
+        dx = self.rng.choice([-1, 0, 1], size=count).astype(np.float64)
+        dy = self.rng.choice([-1, 0, 1], size=count).astype(np.float64)
+        length = np.sqrt(dx**2 + dy**2)
+        moving = length > 0
+        dx[moving] /= length[moving]
+        dy[moving] /= length[moving]
+
+        new = slice(self.fish_count, needed)
+        self._x[new] = x
+        self._y[new] = y
+        self._dx[new] = dx
+        self._dy[new] = dy
+        self._energy[new] = 100
+        self._age[new] = 0
+        self._gender[new] = self.rng.integers(0, 2, size=count)
+        self._ids[new] = np.arange(self._next_id, self._next_id + count)
+        self._next_id += count
+        self.fish_count = needed
+        self._derived.clear()
+
+    def initialize_fish(self):
+        """メダカを初期化"""
+        start_time = time.time()
+
+        count = self._initial_count
+        self._append_fish(self.rng.integers(0, self.world_width, size=count),
+                          self.rng.integers(0, self.world_height, size=count))
+
+        duration = time.time() - start_time
+        log_performance("School initialization", duration)
+        self.logger.info(f"Initialized {count} fish in {duration:.4f}s")
+
+    def get_nearby_fish(self, fish, max_distance=50):
+        """指定されたメダカの近くにいるメダカを取得"""
+        # セルリストが作成済みなら、近くのセルだけを調べる
+        if 'neighbor_index' in self._derived:
+            neighbors = self._derived['neighbor_index'].query_radius(max_distance, [fish._index])[0]
+            return [FishView(self, i) for i in neighbors]
+        dx = np.abs(self.x - fish.x)
+        dy = np.abs(self.y - fish.y)
+        dx = np.minimum(dx, self.world_width - dx)
+        dy = np.minimum(dy, self.world_height - dy)
+        mask = np.sqrt(dx**2 + dy**2) <= max_distance
+        mask[fish._index] = False
+        return [FishView(self, i) for i in np.flatnonzero(mask)]
+
+    def get_neighbor_index(self):
+        """近傍検索用のセルリストを取得（次に状態が変わるまではキャッシュを返す）"""
+        if 'neighbor_index' not in self._derived:
+            self._derived['neighbor_index'] = NeighborIndex(self.x, self.y, width=self.world_width, height=self.world_height)
+        return self._derived['neighbor_index']
+
+    def _draw_index(self):
+        """描画の絞り込みに使える作り済みのセルリスト（作っていなければNone）"""
+        index = self._derived.get('neighbor_index')
+        return (index, 0.0) if index is not None else None
+
+    def _draw_state(self, candidates=None):
+        """描画に使う状態の配列と、その中で調べるメダカの添字（配列は添字で引けるため、全員分をそのまま渡す）"""
+        return self.get_state_arrays(), candidates
+
+    def get_fish_in_vision(self, fish, vision_range=None):
+        """メダカの視界範囲内のメダカを取得（前方のマスをざっくり認識）"""
+        if vision_range is None:
+            vision_range = VISION_RANGE
+        rays = get_vision_rays_array(np.array([fish.dx]), np.array([fish.dy]))[0]
+        rel_x = self.x - fish.x
+        rel_y = self.y - fish.y
+        mask = np.zeros(self.fish_count, dtype=bool)
+        for ray_x, ray_y in rays:
+            mask |= rays_visible(rel_x, rel_y, ray_x, ray_y, vision_range)
+        mask[fish._index] = False
+        return [FishView(self, i) for i in np.flatnonzero(mask)]
+
+    def update_all_fish(self, params=None):
+        """全てのメダカを更新（全員がティック開始時の状態を読むベクトル演算）"""
+        start_time = time.time()
+        if params is None:
+            params = {}
+        vision_range = params.get('vision_range', VISION_RANGE)
+        count = self.fish_count
+
+        noise = self.rng.uniform(-1, 1, size=(2, count))
+        neighbor_time = 0.0  # コンパイル済みカーネルでは検索と更新を分けられないため全てupdateに入れる
+        if self._kernel is not None:
+            # コンパイル済みカーネルで視界内の検索から移動までをまとめて計算
+            new_x, new_y, new_dx, new_dy = kernels.run_boids_step(
+                self._kernel, self.x, self.y, self.dx, self.dy, noise, params, self.world_size)
+            self.x[:] = new_x
+            self.y[:] = new_y
+            self.dx[:] = new_dx
+            self.dy[:] = new_dy
+        else:
+            search_start = time.time()
+            steering = compute_steering(self.x, self.y, self.dx, self.dy, vision_range)
+            neighbor_time = time.time() - search_start
+            new_x, new_y, new_dx, new_dy = apply_steering(self.x, self.y, self.dx, self.dy, steering, noise, params,
+                                                          self.world_width, self.world_height)
+            self.x[:] = new_x
+            self.y[:] = new_y
+            self.dx[:] = new_dx
+            self.dy[:] = new_dy
+
+        # 年齢と体力の更新
+        self.age[:] += 1
+        np.maximum(self.energy - 0.1, 0, out=self.energy)
+        self._derived.clear()
+
+        duration = time.time() - start_time
+        log_performance("Update all fish", duration)
+        if self._kernel is None:
+            PROFILER.add('neighbors', neighbor_time)
+        PROFILER.add('update', duration - neighbor_time)
+        stats_start = time.time()
+        log_school_state(self.school_id, self.fish_count, self.get_school_density(), self.get_school_center())
+        PROFILER.add('stats', time.time() - stats_start)
+        if utils.TRACE_ENABLED:
+            self.logger.debug(f"Updated all {self.fish_count} fish in {duration:.4f}s")
+
+    def steer(self, force_x, force_y):
+        """外からの力（メダカの並び順の配列）を全てのメダカの向きに加えて正規化する（位置は変えない）"""
+        new_dx = self.dx + force_x
+        new_dy = self.dy + force_y
+        length = np.sqrt(new_dx**2 + new_dy**2)
+        moving = length > 0
+        self.dx[moving] = new_dx[moving] / length[moving]
+        self.dy[moving] = new_dy[moving] / length[moving]
+
+    def add_fish(self, x=None, y=None):
+        """新しいメダカを追加"""
+        if x is None:
+            x = int(self.rng.integers(0, self.world_width))
+        if y is None:
+            y = int(self.rng.integers(0, self.world_height))
+        self._append_fish(np.array([x]), np.array([y]))
+        self.logger.info(f"Added fish {self._ids[self.fish_count - 1]} at position ({x}, {y}). Total fish: {self.fish_count}")
+
+    def remove_fish(self, fish):
+        """メダカを削除（後ろのメダカのビューは添字が詰まるため取り直すこと）"""
+        if not isinstance(fish, FishView) or fish._school is not self or fish._index >= self.fish_count:
+            self.logger.warning(f"Attempted to remove fish {fish.id} that is not in the school")
+            return
+        fish_id = fish.id
+        index = fish._index
+        for name in ('_x', '_y', '_dx', '_dy', '_energy', '_age', '_gender', '_ids'):
+            array = getattr(self, name)
+            array[index:self.fish_count - 1] = array[index + 1:self.fish_count]
+        self.fish_count -= 1
+        self._derived.clear()
+        self.logger.info(f"Removed fish {fish_id}. Total fish: {self.fish_count}")
+
+    def reset_fish_positions(self):
+        """全てのメダカの位置をランダムに再配置"""
+        start_time = time.time()
+        count = self.fish_count
+
+        self.x[:] = self.rng.integers(0, self.world_width, size=count)
+        self.y[:] = self.rng.integers(0, self.world_height, size=count)
+        dx = self.rng.uniform(-1, 1, size=count)
+        dy = self.rng.uniform(-1, 1, size=count)
+        length = np.sqrt(dx**2 + dy**2)
+        moving = length > 0
+        dx[moving] /= length[moving]
+        dy[moving] /= length[moving]
+        self.dx[:] = dx
+        self.dy[:] = dy
+        self._derived.clear()
+
+        duration = time.time() - start_time
+        log_performance("Fish position reset", duration)
+        self.logger.info(f"Reset positions of all {self.fish_count} fish in {duration:.4f}s")
+        log_school_state(self.school_id, self.fish_count, self.get_school_density(), self.get_school_center())
+
+    def get_all_fish(self):
+        """全てのメダカ（ビュー）を取得"""
+        return self.fish_list
+
+    def get_fish_positions(self):
+        """全てのメダカの位置を取得"""
+        return list(zip(self.x.tolist(), self.y.tolist()))
+
+    def get_fish_directions(self):
+        """全てのメダカの方向を取得"""
+        return list(zip(self.dx.tolist(), self.dy.tolist()))
+
+    def get_state_arrays(self):
+        """全てのメダカの状態をNumPy配列の辞書で取得（配列のビューなので書き換えないこと）"""
+        return {
+            'x': self.x, 'y': self.y, 'dx': self.dx, 'dy': self.dy,
+            'energy': self.energy, 'age': self.age, 'gender': self.gender, 'id': self._ids[:self.fish_count]
+        }
+
+    def load_state(self, state):
+        """get_state_arraysと同じ形式の状態で全てのメダカを置き換える"""
+        count = len(state['x'])
+        self.fish_count = 0
+        self._allocate(max(16, count))
+        for name in ('x', 'y', 'dx', 'dy', 'energy', 'age', 'gender'):
+            getattr(self, '_' + name)[:count] = state[name]
+        self._ids[:count] = state['id']
+        self._next_id = int(self._ids[:count].max()) + 1 if count else 0
+        self.fish_count = count
+        self._derived.clear()
+        self.logger.info(f"ArraySchool {self.school_id} loaded {count} fish")
+
+    def get_school_center(self):
+        """群れの中心を取得（次に状態が変わるまではキャッシュを返す）"""
+        if 'center' not in self._derived:
+            if self.fish_count == 0:
+                self._derived['center'] = (self.world_width // 2, self.world_height // 2)
+            else:
+                self._derived['center'] = (float(self.x.mean()), float(self.y.mean()))
+        return self._derived['center']
+
+    def get_school_density(self):
+        """群れの密度を取得（次に状態が変わるまではキャッシュを返す）"""
+        if 'density' not in self._derived:
+            if self.fish_count == 0:
+                self._derived['density'] = 0
+            else:
+                center_x, center_y = self.get_school_center()
+                avg_distance = float(np.sqrt((self.x - center_x)**2 + (self.y - center_y)**2).mean())
+                self._derived['density'] = 1.0 / (avg_distance + 1)
+        return self._derived['density']
+
+    def invalidate_statistics(self):
+        """配列を直接書き換えた後に、キャッシュした統計量を破棄する"""
+        self._derived.clear()
+
+    def get_school_statistics(self):
+        """群れの統計情報を取得（次に状態が変わるまではキャッシュを返す）"""
+        if 'statistics' not in self._derived:
+            if self.fish_count == 0:
+                stats = {
+                    'count': 0,
+                    'density': 0,
+                    'center': self.get_school_center(),
+                    'avg_energy': 0,
+                    'avg_age': 0,
+                    'gender_ratio': {'male': 0, 'female': 0}
+                }
+            else:
+                male_count = int(np.count_nonzero(self.gender == 0))
+                stats = {
+                    'count': self.fish_count,
+                    'density': self.get_school_density(),
+                    'center': self.get_school_center(),
+                    'avg_energy': float(self.energy.mean()),
+                    'avg_age': float(self.age.mean()),
+                    'gender_ratio': {
+                        'male': male_count / self.fish_count,
+                        'female': (self.fish_count - male_count) / self.fish_count
+                    }
+                }
+            self._derived['statistics'] = stats
+            if utils.TRACE_ENABLED:
+                self.logger.debug(f"School statistics: {stats}")
+        return self._derived['statistics']
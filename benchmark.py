@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+シミュレーションのホットパスのベンチマーク（結果をJSONで出力し、基準値と比較する）
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import numpy as np
+from constants import *
+from utils import get_default_parameters
+from headless import ENGINES, create_school
+
+BENCHMARK_SEED = 12345
+DEFAULT_SIZES = [30, 300, 3000, 30000, 100000]
+
+def _bench_fish_in_vision(school, params):
+    """get_fish_in_vision（1匹分）"""
+    fish_list = school.get_all_fish()
+    fish = fish_list[len(fish_list) // 2]
+    return lambda: school.get_fish_in_vision(fish, params['vision_range'])
+
+def _bench_nearby_fish(school, params):
+    """get_nearby_fish（1匹分）"""
+    fish_list = school.get_all_fish()
+    fish = fish_list[len(fish_list) // 2]
+    return lambda: school.get_nearby_fish(fish)
+
+def _bench_all_nearby_fish(school, params):
+    """get_all_nearby_fish（全メダカ分、セルリストの作成を含む）"""
+    def run():
+        school.invalidate_statistics()
+        return school.get_all_nearby_fish()
+    return run
+
+def _bench_all_nearest_fish(school, params):
+    """get_all_nearest_fish（全メダカ分、セルリストの作成を含む）"""
+    def run():
+        school.invalidate_statistics()
+        return school.get_all_nearest_fish()
+    return run
+
+def _bench_fish_update(school, params):
+    """Fish.update（1匹分、視界内のメダカは事前に取得）"""
+    fish_list = school.get_all_fish()
+    fish = fish_list[len(fish_list) // 2]
+    nearby_fish = fish_list[:min(10, len(fish_list))]
+    return lambda: fish.update(nearby_fish, params, (0.0, 0.0))
+
+def _bench_update_all_fish(school, params):
+    """update_all_fish（1ティック分）"""
+    return lambda: school.update_all_fish(params)
+
+def _bench_school_density(school, params):
+    """get_school_density"""
+    return school.get_school_density
+
+def _bench_school_statistics(school, params):
+    """get_school_statistics"""
+    return school.get_school_statistics
+
+def _bench_draw_all_fish(school, params):
+    """draw_all_fish（画面外のSurfaceに描画）"""
+    import pygame
+    surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+    return lambda: school.draw_all_fish(surface)
+
+def _bench_draw_all_fish_lod(school, params):
+    """draw_all_fish（カメラで画面外を除き、混み具合に応じて点・ヒートマップで描画）"""
+    import pygame
+    from camera import Camera
+    surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+    camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT, *school.world_size)
+    return lambda: school.draw_all_fish(surface, camera)
+
+# 名前: (準備関数, 対象エンジン, エンジンごとの最大メダカ数)
+BENCHMARKS = {
+    'get_fish_in_vision': (_bench_fish_in_vision, {'python': 3000, 'numpy': 100000}),
+    'get_nearby_fish': (_bench_nearby_fish, {'python': 30000, 'numpy': 100000}),
+    'get_all_nearby_fish': (_bench_all_nearby_fish, {'python': 30000, 'numpy': 30000}),
+    'get_all_nearest_fish': (_bench_all_nearest_fish, {'python': 100000, 'numpy': 100000}),
+    'fish_update': (_bench_fish_update, {'python': 100000}),
+    'update_all_fish': (_bench_update_all_fish, {'python': 3000, 'numpy': 100000, 'numba': 100000, 'numba_parallel': 100000,
+                                                'domain': 100000}),
+    'get_school_density': (_bench_school_density, {'python': 100000, 'numpy': 100000}),
+    'get_school_statistics': (_bench_school_statistics, {'python': 100000, 'numpy': 100000}),
+    'draw_all_fish': (_bench_draw_all_fish, {'python': 30000, 'numpy': 30000}),
+    'draw_all_fish_lod': (_bench_draw_all_fish_lod, {'python': 30000, 'numpy': 100000}),
+}
+
+def time_function(func, repeat=5, budget=2.0):
+    """関数を最大repeat回（合計budget秒まで）実行し、各回の所要時間を返す"""
+    timings = []
+    total_start = time.perf_counter()
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        if time.perf_counter() - total_start > budget:
+            break
+    return timings
+
+def run_benchmarks(sizes=None, engines=ENGINES, names=None, repeat=5, budget=2.0):
+    """ベンチマークを実行し、結果の行のリストを返す"""
+    sizes = sizes or DEFAULT_SIZES
+    names = names or list(BENCHMARKS)
+    params = get_default_parameters()
+    results = []
+
+    for engine in engines:
+        for fish_count in sizes:
+            for name in names:
+                setup, limits = BENCHMARKS[name]
+                if fish_count > limits.get(engine, 0):
+                    continue
+                school = create_school(fish_count, engine, BENCHMARK_SEED)
+                try:
+                    func = setup(school, params)
+                except ImportError as e:
+                    print(f"skip {name}: {e}", file=sys.stderr)
+                    continue
+                timings = time_function(func, repeat, budget)
+                results.append({
+                    'name': name,
+                    'engine': engine,
+                    'fish': fish_count,
+                    'runs': len(timings),
+                    'median': statistics.median(timings),
+                    'min': min(timings),
+                    'mean': statistics.fmean(timings)
+                })
+                print(f"{name:24s} {engine:14s} {fish_count:7d} fish: "
+                      f"median {results[-1]['median'] * 1000:10.3f} ms ({len(timings)} runs)", file=sys.stderr)
+    return results
+
+def measure_memory(sizes=None, engines=ENGINES):
+    """群れの作成で確保されたメモリを測り、メダカ1匹あたりのバイト数の行のリストを返す"""
+    sizes = sizes or DEFAULT_SIZES
+    results = []
+    for engine in engines:
+        # エンジンのモジュールの読み込みを計測に含めないように、先に小さな群れを作っておく
+        create_school(1, engine, BENCHMARK_SEED)
+        for fish_count in sizes:
+            tracemalloc.start()
+            try:
+                school = create_school(fish_count, engine, BENCHMARK_SEED)
+                allocated, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            results.append({
+                'engine': engine,
+                'fish': fish_count,
+                'bytes': allocated,
+                'bytes_per_fish': allocated / fish_count if fish_count else 0
+            })
+            print(f"{'memory':24s} {engine:14s} {fish_count:7d} fish: "
+                  f"{results[-1]['bytes_per_fish']:10.1f} bytes/fish", file=sys.stderr)
+            del school
+    return results
+
+def compare_results(results, baseline, tolerance=0.25):
+    """基準値と比べて中央値がtolerance以上遅くなった項目を返す"""
+    baseline_index = {(row['name'], row['engine'], row['fish']): row for row in baseline}
+    regressions = []
+    for row in results:
+        base = baseline_index.get((row['name'], row['engine'], row['fish']))
+        if base is None:
+            continue
+        ratio = row['median'] / base['median'] if base['median'] > 0 else float('inf')
+        if ratio > 1 + tolerance:
+            regressions.append(dict(row, baseline_median=base['median'], ratio=ratio))
+    return regressions
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Fish School Simulator benchmarks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="メダカの数")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help="計算エンジン")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=None, help="実行するベンチマーク")
+    parser.add_argument('--repeat', type=int, default=5, help="各項目の最大実行回数")
+    parser.add_argument('--budget', type=float, default=2.0, help="各項目の最大計測時間（秒）")
+    parser.add_argument('--output', default=None, help="結果JSONの出力先（省略時は標準出力）")
+    parser.add_argument('--memory', action='store_true', help="メダカ1匹あたりのメモリ使用量も測る")
+    parser.add_argument('--baseline', default=None, help="比較する基準値のJSON")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="許容する遅延の割合")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """ベンチマークのエントリポイント（基準値より遅くなった項目があれば終了コード1）"""
+    args = parse_args(argv)
+    results = run_benchmarks(args.sizes, args.engines, args.only, args.repeat, args.budget)
+    report = {
+        'meta': {
+            'seed': BENCHMARK_SEED,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results': results
+    }
+    if args.memory:
+        report['memory'] = measure_memory(args.sizes, args.engines)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_results(results, baseline, args.tolerance)
+        for row in regressions:
+            print(f"REGRESSION {row['name']} {row['engine']} {row['fish']} fish: "
+                  f"{row['baseline_median'] * 1000:.3f} ms -> {row['median'] * 1000:.3f} ms "
+                  f"(x{row['ratio']:.2f})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import logging
+import numpy as np
+from constants import *
+import utils
+
+
+class Camera:
+    """トーラス状の世界のうち画面に映す範囲（画面中央に映す世界座標と拡大率）
+
+    世界座標から画面座標への変換では、カメラの中心から見て最も近い位置（端をまたいだ側を含む）に映すため、
+    世界が画面より大きくても小さくても、メダカは画面上に1回だけ描かれる。
+    """
+
+    def __init__(self, screen_width=SCREEN_WIDTH, screen_height=SCREEN_HEIGHT,
+                 world_width=WORLD_WIDTH, world_height=WORLD_HEIGHT):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.logger = logging.getLogger('FishSimulator.Camera')
+        self.set_world_size(world_width, world_height)
+
+    def set_world_size(self, world_width, world_height):
+        """世界の大きさを変えて、表示を初期状態に戻す"""
+        self.world_width = world_width
+        self.world_height = world_height
+        self.reset()
+
+    def reset(self):
+        """世界の中心を拡大率1で映す（世界と画面が同じ大きさなら、世界座標がそのまま画面座標になる）"""
+        self.center_x = self.world_width / 2
+        self.center_y = self.world_height / 2
+        self.zoom = max(1.0, self.min_zoom)
+
+    @property
+    def min_zoom(self):
+        """世界全体が画面に収まる拡大率（世界が画面より小さければ1）"""
+        return min(1.0, self.screen_width / self.world_width, self.screen_height / self.world_height)
+
+    def fit(self):
+        """世界全体を映す"""
+        self.center_x = self.world_width / 2
+        self.center_y = self.world_height / 2
+        self.zoom = self.min_zoom
+
+    def pan(self, screen_dx, screen_dy):
+        """画面上でscreen_dx, screen_dyピクセルだけ映す範囲をずらす（ドラッグした方向に世界が動く）"""
+        self.center_x = (self.center_x - screen_dx / self.zoom) % self.world_width
+        self.center_y = (self.center_y - screen_dy / self.zoom) % self.world_height
+
+    def zoom_at(self, factor, screen_x, screen_y):
+        """画面上の(screen_x, screen_y)に映っている位置を動かさずに、拡大率をfactor倍する"""
+        world_x, world_y = self.screen_to_world(screen_x, screen_y)
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), CAMERA_MAX_ZOOM)
+        # 拡大後も同じ世界座標がカーソルの下に来るように中心を合わせる
+        self.center_x = (world_x - (screen_x - self.screen_width / 2) / self.zoom) % self.world_width
+        self.center_y = (world_y - (screen_y - self.screen_height / 2) / self.zoom) % self.world_height
+        if utils.TRACE_ENABLED:
+            self.logger.debug(f"Camera zoom {self.zoom:.3f} at ({world_x:.1f}, {world_y:.1f})")
+
+    def view_fraction(self):
+        """画面に映っている範囲の、世界全体に対する面積の割合（1を超えることもある）"""
+        return (self.screen_width * self.screen_height) / (self.zoom ** 2 * self.world_width * self.world_height)
+
+    def visible_rect(self, margin=FISH_SIZE * 2):
+        """画面（とその外側margin以内）に映る世界の矩形(left, top, right, bottom)（端をまたぐと世界の外の座標になる）"""
+        half_width = (self.screen_width / 2 + margin) / self.zoom
+        half_height = (self.screen_height / 2 + margin) / self.zoom
+        return (self.center_x - half_width, self.center_y - half_height,
+                self.center_x + half_width, self.center_y + half_height)
+
+    def screen_to_world(self, screen_x, screen_y):
+        """画面座標を世界座標に変換"""
+        world_x = (screen_x - self.screen_width / 2) / self.zoom + self.center_x
+        world_y = (screen_y - self.screen_height / 2) / self.zoom + self.center_y
+        return world_x % self.world_width, world_y % self.world_height
+
+    def world_to_screen(self, x, y):
+        """世界座標（スカラーまたは配列）を画面座標に変換（端をまたいだ側も含め、カメラの中心に最も近い位置に映す）"""
+        rel_x = (np.asarray(x, dtype=np.float64) - self.center_x + self.world_width / 2) % self.world_width - self.world_width / 2
+        rel_y = (np.asarray(y, dtype=np.float64) - self.center_y + self.world_height / 2) % self.world_height - self.world_height / 2
+        return rel_x * self.zoom + self.screen_width / 2, rel_y * self.zoom + self.screen_height / 2
+
+    def _relative(self, values, center, screen_size, world_size, margin):
+        """1軸分の、カメラの中心から最も近い位置へのずれ（世界座標）と、画面（と外側margin以内）に映るかどうか
+        （この軸では全て映るならNone）"""
+        half = (screen_size / 2 + margin) / self.zoom
+        relative = values - center
+        if half <= center <= world_size - half:
+            # 映る範囲が世界の端をまたがなければ、ずらさなくても映るメダカの位置は決まる
+            return relative, np.abs(relative) <= half
+        # 座標は世界の中[0, world_size)にあるため、剰余を取らずに1回ずらすだけで最も近い位置になる
+        relative[relative >= world_size / 2] -= world_size
+        relative[relative < -world_size / 2] += world_size
+        return relative, (None if 2 * half >= world_size else np.abs(relative) <= half)
+
+    def project(self, x, y, margin=FISH_SIZE * 2, candidates=None):
+        """画面（とその外側margin以内）に映るメダカの添字と画面座標を返す（映らないメダカは描画前に除く）
+
+        x, yは世界の中の座標とする。candidatesに添字の配列（近傍検索のセルリストで引いた画面付近のメダカなど）を渡すと、その中だけを調べる。
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if candidates is not None:
+            x, y = x[candidates], y[candidates]
+        rel_x, inside_x = self._relative(x, self.center_x, self.screen_width, self.world_width, margin)
+        rel_y, inside_y = self._relative(y, self.center_y, self.screen_height, self.world_height, margin)
+        if inside_x is None and inside_y is None:
+            # 世界全体が映っていれば絞り込まない
+            visible = np.arange(len(x))
+        else:
+            visible = np.flatnonzero(inside_y if inside_x is None else inside_x if inside_y is None else inside_x & inside_y)
+            rel_x, rel_y = rel_x[visible], rel_y[visible]
+        screen_x = rel_x * self.zoom + self.screen_width / 2
+        screen_y = rel_y * self.zoom + self.screen_height / 2
+        return (visible if candidates is None else candidates[visible]), screen_x, screen_y
+
+    def describe(self):
+        """画面に表示するカメラの状態"""
+        return f"View: ({self.center_x:.0f}, {self.center_y:.0f}) x{self.zoom:.2f} of {self.world_width}x{self.world_height}"
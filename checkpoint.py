@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import numpy as np
+from constants import *
+from utils import log_world_event, log_performance
+
+CHECKPOINT_VERSION = 1
+# 保存するメダカごとの配列（get_state_arraysの名前）
+CHECKPOINT_FIELDS = ('x', 'y', 'dx', 'dy', 'energy', 'age', 'gender', 'id')
+
+
+def _fsync_directory(directory):
+    """ファイルの置き換え（ディレクトリのエントリ）をディスクに書き出す（ディレクトリを開けないWindowsでは何もしない）"""
+    if os.name == 'nt':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def save_checkpoint(path, school, params, metadata=None):
+    """群れの全状態・乱数生成器の状態・パラメータを保存（一時ファイルに書いてから置き換え、ディレクトリもfsyncするため、
+    途中で落ちたり電源が切れたりしても前の保存か新しい保存のどちらかが残る）"""
+    logger = logging.getLogger('FishSimulator.Checkpoint')
+    start_time = time.time()
+
+    state = school.get_state_arrays()
+    header = {
+        'version': CHECKPOINT_VERSION,
+        'engine': getattr(school, 'kernel', 'python'),
+        'update_mode': school.update_mode,
+        'vision_backend': getattr(school, 'vision_backend', 'spatial_hash'),
+        'seed': school.seed,
+        'rng_state': school.rng.bit_generator.state,
+        'params': dict(params),
+        'screen': [SCREEN_WIDTH, SCREEN_HEIGHT],
+        'world': list(school.world_size),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    header.update(metadata or {})
+    arrays = {name: np.ascontiguousarray(state[name]) for name in CHECKPOINT_FIELDS}
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.checkpoint-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, header=np.array(json.dumps(header)), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _fsync_directory(directory)
+
+    duration = time.time() - start_time
+    log_performance("Checkpoint save", duration)
+    logger.info(f"Checkpoint saved: {path} ({school.get_fish_count()} fish in {duration:.4f}s)")
+    log_world_event("CHECKPOINT_SAVED", f"{path}: {school.get_fish_count()} fish")
+    return header
+
+
+def load_checkpoint(path, engine=None):
+    """チェックポイントから群れを作り直し、(群れ, パラメータ, ヘッダー)を返す（engineを省略すると保存時と同じ計算エンジン）"""
+    from headless import create_school
+    logger = logging.getLogger('FishSimulator.Checkpoint')
+    start_time = time.time()
+
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data['header']))
+        if header.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {header.get('version')}: {path}")
+        state = {name: data[name] for name in CHECKPOINT_FIELDS}
+
+    school = create_school(0, engine or header['engine'], seed=header['seed'],
+                           update_mode=header.get('update_mode', 'sequential'),
+                           vision_backend=header.get('vision_backend', 'spatial_hash'),
+                           world_size=tuple(header.get('world', header['screen'])))
+    school.load_state(state)
+    school.rng.bit_generator.state = header['rng_state']
+
+    duration = time.time() - start_time
+    log_performance("Checkpoint load", duration)
+    logger.info(f"Checkpoint loaded: {path} ({school.get_fish_count()} fish in {duration:.4f}s)")
+    log_world_event("CHECKPOINT_LOADED", f"{path}: {school.get_fish_count()} fish")
+    return school, header['params'], header
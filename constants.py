@@ -3,13 +3,32 @@ SCREEN_WIDTH = 1600
 SCREEN_HEIGHT = 900
 FPS = 60
 
+# 世界（メダカが泳ぐトーラス）の大きさ。画面とは別に指定でき、画面より大きい世界はカメラで一部を映す
+WORLD_WIDTH = SCREEN_WIDTH
+WORLD_HEIGHT = SCREEN_HEIGHT
+# カメラの拡大率の上限と、マウスホイール1段あたりの倍率
+CAMERA_MAX_ZOOM = 8.0
+CAMERA_ZOOM_STEP = 1.25
+# 映る範囲が世界のこの割合未満なら、作り済みの近傍検索のセルリストから画面内の候補だけを引いて描く
+CULL_INDEX_FRACTION = 0.25
+
+# 描画の詳細度（LOD）。三角形は拡大率LOD_SPRITE_MIN_ZOOM以上で、画面上の平均間隔がFISH_SIZE以上のときだけ描き、
+# 詰まっていれば1ピクセルの点、平均間隔がLOD_HEATMAP_SPACING未満なら密度のヒートマップにする
+LOD_SPRITE_MIN_ZOOM = 0.5
+LOD_MAX_SPRITES = 10000  # 1フレームに三角形で描く最大数（超えたら点）
+LOD_HEATMAP_SPACING = 1.5
+LOD_HEATMAP_CELL = 4  # ヒートマップの1マスの大きさ（ピクセル）
+
 # メダカ設定
 DEFAULT_FISH_COUNT = 30
 FISH_SIZE = 8  # サイズを2倍に
 FISH_SPEED = 20
+GENDERS = ('male', 'female')  # 性別（性別コードは0: male, 1: female）
 
 # 視界設定
 VISION_RANGE = 100  # 前方・斜め前の3方向にVISION_RANGEマスずつ（10倍に拡大）
+VISION_TOLERANCE = 10  # 視界チェック位置の許容誤差（±ピクセル）
+NEIGHBOR_CELL_SIZE = 50  # 近傍検索用のセルリストのセルサイズ（ピクセル）
 
 # 群れ行動の重み（初期値）
 SEPARATION_WEIGHT = 1.5
@@ -18,6 +37,19 @@ COHESION_WEIGHT = 0.8
 RANDOM_WEIGHT = 0.1
 INERTIA_WEIGHT = 20.0
 
+# 秩序変数の計算（analytics.py）。ANALYTICS_INTERVALティックごとに、世界をANALYTICS_DENSITY_BINSのマスに分けた密度と、
+# ANALYTICS_LINK_DISTANCE以内でつながるANALYTICS_MIN_CLUSTER匹以上の集まりを群れとして数える
+ANALYTICS_INTERVAL = 10
+ANALYTICS_DENSITY_BINS = (64, 36)
+ANALYTICS_LINK_DISTANCE = 30
+ANALYTICS_MIN_CLUSTER = 3
+ANALYTICS_NN_MAX_DISTANCE = 200  # 最近傍距離を探す上限（これより遠ければ孤立）
+ANALYTICS_NN_BINS = 20
+
+# 他の群れのメダカを避ける重みと距離（Tankで複数の群れを動かすときに使い、群れごとのパラメータで変えられる）
+AVOID_WEIGHT = 0.5
+AVOID_RANGE = 40
+
 # 色設定
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -26,6 +58,14 @@ LIGHT_BLUE = (100, 150, 255)
 GREEN = (0, 255, 0)
 RED = (255, 0, 0)
 
+# 群れごとの色（オス, メス）。Tankでは追加した順に割り当てる
+SCHOOL_COLORS = [
+    (LIGHT_BLUE, BLUE),
+    ((255, 180, 100), (230, 120, 40)),
+    ((150, 230, 130), (60, 180, 60)),
+    ((235, 140, 225), (180, 70, 180))
+]
+
 # 方向ベクトル（8方向）
 DIRECTIONS = [
     (-1, -1), (-1, 0), (-1, 1),
@@ -0,0 +1,346 @@
+import os
+import math
+import time
+import logging
+import weakref
+import multiprocessing
+from threading import BrokenBarrierError
+from multiprocessing import shared_memory
+import numpy as np
+from array_school import ArraySchool, compute_steering, apply_steering
+from constants import *
+from profiler import PROFILER
+import utils
+from utils import log_school_state, log_performance, log_world_event
+
+# ワーカーに毎ティック渡すパラメータの順（共有メモリの制御配列に並べる）
+DOMAIN_PARAMETERS = ('separation_weight', 'alignment_weight', 'cohesion_weight', 'random_weight',
+                     'inertia_weight', 'fish_speed', 'vision_range')
+# ワーカーの応答を待つ最大秒数（これを超えたら止まったものとして扱う）
+DOMAIN_TIMEOUT = 60.0
+
+
+def tile_grid(workers, width=WORLD_WIDTH, height=WORLD_HEIGHT):
+    """workers個のタイルへの分け方(横の数, 縦の数)を、タイルが正方形に近くなるように選ぶ"""
+    best = (workers, 1)
+    for columns in range(1, workers + 1):
+        if workers % columns == 0:
+            rows = workers // columns
+            if abs(math.log((width / columns) / (height / rows))) < abs(math.log((width / best[0]) / (height / best[1]))):
+                best = (columns, rows)
+    return best
+
+
+class TileLayout:
+    """トーラス状の世界をcolumns×rowsのタイルに分けたときの、位置とタイルの対応"""
+
+    def __init__(self, columns, rows, width=WORLD_WIDTH, height=WORLD_HEIGHT):
+        self.columns = columns
+        self.rows = rows
+        self.width = width
+        self.height = height
+        self.tile_width = width / columns
+        self.tile_height = height / rows
+
+    def __len__(self):
+        return self.columns * self.rows
+
+    def tile_of(self, x, y):
+        """位置の配列が属するタイルの番号（横方向の番号 * rows + 縦方向の番号）"""
+        column = np.minimum((np.asarray(x) // self.tile_width).astype(np.int64), self.columns - 1)
+        row = np.minimum((np.asarray(y) // self.tile_height).astype(np.int64), self.rows - 1)
+        return column * self.rows + row
+
+    def bounds(self, tile):
+        """タイルの範囲(左, 上, 右, 下)"""
+        column, row = divmod(tile, self.rows)
+        return (column * self.tile_width, row * self.tile_height,
+                (column + 1) * self.tile_width, (row + 1) * self.tile_height)
+
+    def halo_tiles(self, tile, margin):
+        """タイルの範囲をmarginだけ広げた範囲に重なる他のタイル（視界は画面端で折り返さないため、端をまたがない）"""
+        left, top, right, bottom = self.bounds(tile)
+        columns = range(max(0, int((left - margin) // self.tile_width)),
+                        min(self.columns - 1, int((right + margin) // self.tile_width)) + 1)
+        rows = range(max(0, int((top - margin) // self.tile_height)),
+                     min(self.rows - 1, int((bottom + margin) // self.tile_height)) + 1)
+        return [column * self.rows + row for column in columns for row in rows if column * self.rows + row != tile]
+
+
+def _attach(name):
+    """作成済みの共有メモリを開く（後始末は作成したプロセスが行う）"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python 3.12以前はtrackを指定できない
+        return shared_memory.SharedMemory(name=name)
+
+
+def _shared_arrays(blocks, count, tiles):
+    """共有メモリのブロックから配列を作る（作成側とワーカーで同じ形にする）"""
+    shapes = {
+        'state': ((2, 4, count), np.float64),      # ダブルバッファのx, y, dx, dy（メダカの番号順）
+        'energy': ((count,), np.float64),
+        'age': ((count,), np.int64),
+        'noise': ((2, count), np.float64),         # 調整役がティックごとに引くランダム成分
+        'owner': ((count,), np.int64),             # 現在の位置で決まる各メダカの担当タイル
+        'order': ((count,), np.int64),             # 担当タイル順に並べたメダカの番号（タイル内は昇順）
+        'offsets': ((tiles + 1,), np.int64),       # タイルtの担当はorder[offsets[t]:offsets[t + 1]]
+        'control': ((len(DOMAIN_PARAMETERS),), np.float64),  # ティックごとのパラメータ
+    }
+    return {name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf) for name, (shape, dtype) in shapes.items()}
+
+
+def _domain_worker(tile, names, count, layout, start_barrier, stop):
+    """1つのタイルを担当するワーカープロセスの本体（共有メモリを開いて_run_tileを回す）"""
+    blocks = {name: _attach(block_name) for name, block_name in names.items()}
+    try:
+        _run_tile(tile, _shared_arrays(blocks, count, len(layout)), layout, start_barrier, stop)
+    except BrokenBarrierError:
+        pass
+    except BaseException:
+        # 他のワーカーと調整役が待ち続けないようにする
+        start_barrier.abort()
+        raise
+    finally:
+        for block in blocks.values():
+            try:
+                block.close()
+            except BufferError:  # 例外がビューを参照している場合（プロセスの終了で解放される）
+                pass
+
+
+def _run_tile(tile, arrays, layout, start_barrier, stop):
+    """1つのタイルを1ティックずつ進める
+
+    1ティックでは、隣のタイルから視界の届く範囲にいるメダカ（ハロー）を共有メモリから集め、担当のメダカの次の状態を
+    もう一方のバッファに、移動後の位置で決まる担当タイルをownerに書く。調整役とはstart_barrierで揃え、
+    調整役がティックの間にownerをタイル順に並べ直して次のティックの担当（order, offsets）にする（移動の受け渡し）。
+    """
+    state, order, offsets = arrays['state'], arrays['order'], arrays['offsets']
+    left, top, right, bottom = layout.bounds(tile)
+    tick = 0
+    while True:
+        start_barrier.wait()
+        if stop.is_set():
+            return
+        params = dict(zip(DOMAIN_PARAMETERS, arrays['control'].tolist()))
+        params['vision_range'] = int(params['vision_range'])
+        current, following = tick % 2, 1 - tick % 2
+
+        # 担当のメダカとハローを並べ、担当の分だけ次の状態と移動後の担当タイルを計算
+        owned = order[offsets[tile]:offsets[tile + 1]]
+        margin = params['vision_range'] + VISION_TOLERANCE
+        local = [owned]
+        for other in layout.halo_tiles(tile, margin):
+            candidates = order[offsets[other]:offsets[other + 1]]
+            other_x, other_y = state[current, 0, candidates], state[current, 1, candidates]
+            near = ((other_x >= left - margin) & (other_x < right + margin)
+                    & (other_y >= top - margin) & (other_y < bottom + margin))
+            local.append(candidates[near])
+        local = np.concatenate(local)
+        x, y, dx, dy = (state[current, k, local] for k in range(4))
+        if len(owned):
+            size = len(owned)
+            steering = compute_steering(x, y, dx, dy, params['vision_range'], np.arange(size))
+            new_state = apply_steering(x[:size], y[:size], dx[:size], dy[:size], steering,
+                                       arrays['noise'][:, owned], params, layout.width, layout.height)
+            for k in range(4):
+                state[following, k, owned] = new_state[k]
+            arrays['age'][owned] += 1
+            arrays['energy'][owned] = np.maximum(arrays['energy'][owned] - 0.1, 0)
+            arrays['owner'][owned] = layout.tile_of(new_state[0], new_state[1])
+        start_barrier.wait()
+        tick += 1
+
+
+def _shutdown_domain(processes, blocks, start_barrier, stop):
+    """ワーカーを止めて共有メモリを解放する（weakref.finalizeから、または明示的に呼ばれる）"""
+    stop.set()
+    if all(process.is_alive() for process in processes) and not start_barrier.broken:
+        try:
+            start_barrier.wait(DOMAIN_TIMEOUT)
+        except BrokenBarrierError:
+            pass
+    for process in processes:
+        process.join(DOMAIN_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+    for block in blocks.values():
+        try:
+            block.close()
+        except BufferError:  # まだビューが残っている場合（プロセスの終了で解放される）
+            pass
+        block.unlink()
+
+
+class TileDomain:
+    """メダカの状態を共有メモリに置き、タイルごとのワーカープロセスで1ティックずつ進める"""
+
+    def __init__(self, state, energy, age, workers, width=WORLD_WIDTH, height=WORLD_HEIGHT):
+        self.count = len(energy)
+        self.layout = TileLayout(*tile_grid(workers, width, height), width, height)
+        self.tick = 0
+        self.logger = logging.getLogger('FishSimulator.Domain')
+
+        # 空の配列でも共有メモリは1バイト以上必要
+        sizes = {
+            'state': 2 * 4 * self.count * 8, 'energy': self.count * 8, 'age': self.count * 8,
+            'noise': 2 * self.count * 8, 'owner': self.count * 8, 'order': self.count * 8,
+            'offsets': (len(self.layout) + 1) * 8, 'control': len(DOMAIN_PARAMETERS) * 8,
+        }
+        self._blocks = {name: shared_memory.SharedMemory(create=True, size=max(1, size)) for name, size in sizes.items()}
+        self.arrays = _shared_arrays(self._blocks, self.count, len(self.layout))
+        self.arrays['state'][0] = state
+        self.arrays['energy'][:] = energy
+        self.arrays['age'][:] = age
+        self.assign_tiles()
+
+        context = multiprocessing.get_context()
+        self._start_barrier = context.Barrier(len(self.layout) + 1)
+        self._stop = context.Event()
+        names = {name: block.name for name, block in self._blocks.items()}
+        self._processes = [
+            context.Process(target=_domain_worker, name=f'DomainWorker-{tile}', daemon=True,
+                            args=(tile, names, self.count, self.layout,
+                                  self._start_barrier, self._stop))
+            for tile in range(len(self.layout))
+        ]
+        for process in self._processes:
+            process.start()
+        self._finalizer = weakref.finalize(self, _shutdown_domain, self._processes, self._blocks,
+                                           self._start_barrier, self._stop)
+        self.logger.info(f"Domain started: {self.count} fish on {self.layout.columns}x{self.layout.rows} tiles")
+
+    @property
+    def state(self):
+        """現在のティックの状態（形状(4, メダカ数)の共有メモリのビュー）"""
+        return self.arrays['state'][self.tick % 2]
+
+    def assign_tiles(self):
+        """現在の位置から各タイルの担当を決め直す（ワーカーが待機中のときだけ呼ぶ）"""
+        self.arrays['owner'][:] = self.layout.tile_of(self.state[0], self.state[1])
+        self._sort_tiles()
+
+    def _sort_tiles(self):
+        """ownerをタイル順に並べ、タイルごとの担当（order, offsets）にする（ワーカーが待機中のときだけ呼ぶ）"""
+        owner = self.arrays['owner']
+        self.arrays['order'][:] = np.argsort(owner, kind='stable')
+        self.arrays['offsets'][0] = 0
+        np.cumsum(np.bincount(owner, minlength=len(self.layout)), out=self.arrays['offsets'][1:])
+
+    def tile_members(self, tile):
+        """タイルが現在担当するメダカの番号（昇順）"""
+        return self.arrays['order'][self.arrays['offsets'][tile]:self.arrays['offsets'][tile + 1]]
+
+    def step(self, noise, params):
+        """ランダム成分noise（形状(2, メダカ数)）とパラメータで全てのワーカーを1ティック進める"""
+        self.arrays['noise'][:] = noise
+        self.arrays['control'][:] = [params.get(name, default) for name, default in zip(
+            DOMAIN_PARAMETERS, (SEPARATION_WEIGHT, ALIGNMENT_WEIGHT, COHESION_WEIGHT, RANDOM_WEIGHT,
+                                INERTIA_WEIGHT, FISH_SPEED, VISION_RANGE))]
+        try:
+            self._start_barrier.wait(DOMAIN_TIMEOUT)
+            self._start_barrier.wait(DOMAIN_TIMEOUT)
+        except BrokenBarrierError:
+            raise RuntimeError("A domain worker failed or timed out") from None
+        self.tick += 1
+        self._sort_tiles()
+
+    def close(self):
+        """ワーカーを止めて共有メモリを解放（以降は配列を使えない）"""
+        self.arrays = None
+        self._finalizer()
+        self.logger.info(f"Domain stopped after {self.tick} ticks")
+
+
+class DomainSchool(ArraySchool):
+    """ArraySchool（numpyカーネル）と同じ規則の群れを、世界をタイルに分けた複数のワーカープロセスで更新する
+
+    状態は共有メモリに置き、ワーカーは隣のタイルのメダカのうち視界の届く範囲だけを読む。ランダム成分はこのプロセスで
+    ArraySchoolと同じ順に引くため、同じシードならArraySchoolと同じ結果になる（合計の順序による丸め誤差を除く）。
+    メダカの追加・削除などで数が変わったときはワーカーを作り直す。
+    """
+
+    def __init__(self, fish_count=DEFAULT_FISH_COUNT, seed=None, workers=None, world_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._domain = None
+        super().__init__(fish_count, seed, kernel='numpy', world_size=world_size)
+        self.kernel = 'domain'
+        self._start_domain()
+
+    def _start_domain(self):
+        """現在の配列を共有メモリに写してワーカーを起動し、配列をそのビューに差し替える"""
+        count = self.fish_count
+        state = np.stack((self.x, self.y, self.dx, self.dy))
+        energy, age = self.energy.copy(), self.age.copy()
+        self.close()
+        self._domain = TileDomain(state, energy, age, self.workers, self.world_width, self.world_height)
+        # 性別とIDはワーカーが使わないため、このプロセスの配列のまま
+        self._gender = self._gender[:count].copy()
+        self._ids = self._ids[:count].copy()
+        self._energy = self._domain.arrays['energy']
+        self._age = self._domain.arrays['age']
+        self._bind_state()
+        log_world_event("DOMAIN_START", f"{count} fish on {len(self._domain.layout)} tiles")
+
+    def _bind_state(self):
+        """x, y, dx, dyを現在のティックの共有メモリのビューにする"""
+        self._x, self._y, self._dx, self._dy = self._domain.state
+
+    def update_all_fish(self, params=None):
+        """全てのメダカを更新（タイルごとのワーカーが並行に計算する）"""
+        start_time = time.time()
+        if params is None:
+            params = {}
+        noise = self.rng.uniform(-1, 1, size=(2, self.fish_count))
+        self._domain.step(noise, params)
+        self._bind_state()
+        self._derived.clear()
+
+        duration = time.time() - start_time
+        log_performance("Update all fish", duration)
+        PROFILER.add('update', duration)
+        stats_start = time.time()
+        log_school_state(self.school_id, self.fish_count, self.get_school_density(), self.get_school_center())
+        PROFILER.add('stats', time.time() - stats_start)
+        if utils.TRACE_ENABLED:
+            self.logger.debug(f"Updated all {self.fish_count} fish in {duration:.4f}s on {len(self._domain.layout)} tiles")
+
+    def add_fish(self, x=None, y=None):
+        """新しいメダカを追加（ワーカーを作り直す）"""
+        super().add_fish(x, y)
+        self._start_domain()
+
+    def remove_fish(self, fish):
+        """メダカを削除（ワーカーを作り直す）"""
+        count = self.fish_count
+        super().remove_fish(fish)
+        if self.fish_count != count:
+            self._start_domain()
+
+    def load_state(self, state):
+        """get_state_arraysと同じ形式の状態で全てのメダカを置き換える（ワーカーを作り直す）"""
+        self.close()
+        super().load_state(state)
+        self._start_domain()
+
+    def reset_fish_positions(self):
+        """全てのメダカの位置をランダムに再配置（タイルの担当を決め直す）"""
+        super().reset_fish_positions()
+        self._domain.assign_tiles()
+
+    def invalidate_statistics(self):
+        """配列を直接書き換えた後に、キャッシュした統計量を破棄してタイルの担当を決め直す"""
+        super().invalidate_statistics()
+        if self._domain is not None:
+            self._domain.assign_tiles()
+
+    def close(self):
+        """ワーカーを止めて共有メモリを解放（状態はこのプロセスの配列に写して残す）"""
+        if self._domain is None:
+            return
+        count = self.fish_count
+        for name in ('_x', '_y', '_dx', '_dy', '_energy', '_age'):
+            setattr(self, name, getattr(self, name)[:count].copy())
+        self._domain.close()
+        self._domain = None
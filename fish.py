@@ -3,25 +3,64 @@ import math
 import numpy as np
 import logging
 import time
+import itertools
 from constants import *
-from utils import log_fish_behavior
+import utils
+from utils import log_fish_behavior, random_choice, random_uniform
+from spatial import get_vision_probes
+
+# メダカのIDの採番（id(self)と違い、削除されたメダカのIDが再利用されない）
+_fish_ids = itertools.count()
+
+def reserve_fish_ids(next_id):
+    """next_id未満のIDを採番済みにする（チェックポイントから復元したメダカとIDが重ならないように）"""
+    global _fish_ids
+    _fish_ids = itertools.count(max(next(_fish_ids), next_id))
 
 class Fish:
-    def __init__(self, x, y, dx=0, dy=0):
+    # __dict__を持たせず、1匹あたりのメモリを減らす
+    __slots__ = ('x', 'y', 'dx', 'dy', 'energy', 'age', 'gender_code', 'id')
+    
+    def __init__(self, x, y, dx=0, dy=0, rng=None):
+        # rngは群れごとの乱数生成器（numpy.random.Generator）。省略時はrandomモジュールを使う
         self.x = x
         self.y = y
-        self.dx = dx if dx != 0 else random.choice([-1, 0, 1])
-        self.dy = dy if dy != 0 else random.choice([-1, 0, 1])
+        self.dx = dx if dx != 0 else random_choice([-1, 0, 1], rng)
+        self.dy = dy if dy != 0 else random_choice([-1, 0, 1], rng)
         self.energy = 100
         self.age = 0
-        self.gender = random.choice(['male', 'female'])
-        self.id = id(self)  # ユニークID
+        self.gender_code = random_choice((0, 1), rng)  # 性別コード（GENDERSの添字）
+        self.id = next(_fish_ids)  # ユニークID
         
         # 方向を正規化
         self._normalize_direction()
         
         # ログ出力
-        log_fish_behavior(self.id, "CREATED", f"Position=({x}, {y}), Direction=({self.dx:.2f}, {self.dy:.2f}), Gender={self.gender}")
+        if utils.TRACE_ENABLED:
+            log_fish_behavior(self.id, "CREATED", f"Position=({x}, {y}), Direction=({self.dx:.2f}, {self.dy:.2f}), Gender={self.gender}")
+    
+    @classmethod
+    def from_state(cls, x, y, dx, dy, energy, age, gender_code, fish_id):
+        """保存した状態からメダカを作る（乱数・正規化・ログ出力を行わない）"""
+        fish = cls.__new__(cls)
+        fish.x = x
+        fish.y = y
+        fish.dx = dx
+        fish.dy = dy
+        fish.energy = energy
+        fish.age = age
+        fish.gender_code = gender_code
+        fish.id = fish_id
+        return fish
+    
+    @property
+    def gender(self):
+        """性別（'male'または'female'）"""
+        return GENDERS[self.gender_code]
+    
+    @gender.setter
+    def gender(self, value):
+        self.gender_code = GENDERS.index(value)
     
     def _normalize_direction(self):
         """方向ベクトルを正規化する"""
@@ -29,7 +68,8 @@ class Fish:
         if length > 0:
             self.dx /= length
             self.dy /= length
-            log_fish_behavior(self.id, "NORMALIZE", f"Direction normalized to ({self.dx:.2f}, {self.dy:.2f})")
+            if utils.TRACE_ENABLED:
+                log_fish_behavior(self.id, "NORMALIZE", f"Direction normalized to ({self.dx:.2f}, {self.dy:.2f})")
     
     def get_position(self):
         """現在位置を返す"""
@@ -39,48 +79,30 @@ class Fish:
         """現在の方向を返す"""
         return (self.dx, self.dy)
     
-    def get_vision_area(self):
-        """視界範囲の座標を返す（前方・斜め前の3方向）"""
-        vision_coords = []
-        
+    def get_vision_area(self, rng=None, vision_range=VISION_RANGE):
+        """視界範囲の座標を返す（前方・斜め前の3方向の視線の先端。群れの視界判定と同じ表を使う）"""
         # 現在の方向に基づいて前方・斜め前の3方向を計算
         if self.dx == 0 and self.dy == 0:
             # 方向が未設定の場合はランダムに設定
-            self.dx = random.choice([-1, 0, 1])
-            self.dy = random.choice([-1, 0, 1])
+            self.dx = random_choice([-1, 0, 1], rng)
+            self.dy = random_choice([-1, 0, 1], rng)
             self._normalize_direction()
-            log_fish_behavior(self.id, "RANDOM_DIRECTION", f"Set random direction to ({self.dx:.2f}, {self.dy:.2f})")
-        
-        # 方向ベクトルを正規化
-        length = math.sqrt(self.dx**2 + self.dy**2)
-        if length > 0:
-            dx_norm = self.dx / length
-            dy_norm = self.dy / length
-        else:
-            dx_norm, dy_norm = 0, 0
+            if utils.TRACE_ENABLED:
+                log_fish_behavior(self.id, "RANDOM_DIRECTION", f"Set random direction to ({self.dx:.2f}, {self.dy:.2f})")
         
-        # 前方（進行方向）
-        front_x = int(self.x + dx_norm * VISION_RANGE)
-        front_y = int(self.y + dy_norm * VISION_RANGE)
-        vision_coords.append((front_x, front_y))
+        # 前方・左・右の順
+        tips = get_vision_probes(self.dx, self.dy, vision_range)[-1].tolist()
+        vision_coords = [(int(self.x + tip_x), int(self.y + tip_y)) for tip_x, tip_y in tips]
         
-        # 斜め前（左）- 90度回転してから前方
-        left_x = int(self.x + (-dy_norm) * VISION_RANGE * 0.5 + dx_norm * VISION_RANGE)
-        left_y = int(self.y + dx_norm * VISION_RANGE * 0.5 + dy_norm * VISION_RANGE)
-        vision_coords.append((left_x, left_y))
-        
-        # 斜め前（右）- -90度回転してから前方
-        right_x = int(self.x + dy_norm * VISION_RANGE * 0.5 + dx_norm * VISION_RANGE)
-        right_y = int(self.y + (-dx_norm) * VISION_RANGE * 0.5 + dy_norm * VISION_RANGE)
-        vision_coords.append((right_x, right_y))
-        
-        log_fish_behavior(self.id, "VISION_AREA", f"Vision coords: {vision_coords}")
+        if utils.TRACE_ENABLED:
+            log_fish_behavior(self.id, "VISION_AREA", f"Vision coords: {vision_coords}")
         return vision_coords
     
     def calculate_separation(self, nearby_fish):
         """分離行動を計算"""
         if not nearby_fish:
-            log_fish_behavior(self.id, "SEPARATION", "No nearby fish")
+            if utils.TRACE_ENABLED:
+                log_fish_behavior(self.id, "SEPARATION", "No nearby fish")
             return 0, 0
         
         separation_x = 0
@@ -98,25 +120,29 @@ class Fish:
                 separation_x += dx * force
                 separation_y += dy * force
         
-        log_fish_behavior(self.id, "SEPARATION", f"Force=({separation_x:.2f}, {separation_y:.2f}), Nearby={len(nearby_fish)}")
+        if utils.TRACE_ENABLED:
+            log_fish_behavior(self.id, "SEPARATION", f"Force=({separation_x:.2f}, {separation_y:.2f}), Nearby={len(nearby_fish)}")
         return separation_x, separation_y
     
     def calculate_alignment(self, nearby_fish):
         """整列行動を計算"""
         if not nearby_fish:
-            log_fish_behavior(self.id, "ALIGNMENT", "No nearby fish")
+            if utils.TRACE_ENABLED:
+                log_fish_behavior(self.id, "ALIGNMENT", "No nearby fish")
             return 0, 0
         
         avg_dx = sum(fish.dx for fish in nearby_fish) / len(nearby_fish)
         avg_dy = sum(fish.dy for fish in nearby_fish) / len(nearby_fish)
         
-        log_fish_behavior(self.id, "ALIGNMENT", f"Average direction=({avg_dx:.2f}, {avg_dy:.2f}), Nearby={len(nearby_fish)}")
+        if utils.TRACE_ENABLED:
+            log_fish_behavior(self.id, "ALIGNMENT", f"Average direction=({avg_dx:.2f}, {avg_dy:.2f}), Nearby={len(nearby_fish)}")
         return avg_dx, avg_dy
     
     def calculate_cohesion(self, nearby_fish):
         """結合行動を計算"""
         if not nearby_fish:
-            log_fish_behavior(self.id, "COHESION", "No nearby fish")
+            if utils.TRACE_ENABLED:
+                log_fish_behavior(self.id, "COHESION", "No nearby fish")
             return 0, 0
         
         # 群れの中心を計算
@@ -127,13 +153,24 @@ class Fish:
         cohesion_x = center_x - self.x
         cohesion_y = center_y - self.y
         
-        log_fish_behavior(self.id, "COHESION", f"Center=({center_x:.1f}, {center_y:.1f}), Force=({cohesion_x:.2f}, {cohesion_y:.2f})")
+        if utils.TRACE_ENABLED:
+            log_fish_behavior(self.id, "COHESION", f"Center=({center_x:.1f}, {center_y:.1f}), Force=({cohesion_x:.2f}, {cohesion_y:.2f})")
         return cohesion_x, cohesion_y
     
-    def update(self, nearby_fish, params=None):
-        """メダカの状態を更新"""
-        start_time = time.time()
+    def update(self, nearby_fish, params=None, noise=None, rng=None, world_size=None):
+        """メダカの状態を更新（noiseは群れがまとめて引いたランダム成分(x, y)、world_sizeは世界の(幅, 高さ)）"""
+        if utils.TRACE_ENABLED:
+            start_time = time.time()
+        
+        self.set_state(self.compute_next_state(nearby_fish, params, noise, rng, world_size))
         
+        # ログ出力
+        if utils.TRACE_ENABLED:
+            duration = time.time() - start_time
+            log_fish_behavior(self.id, "UPDATE", f"Position=({self.x:.1f}, {self.y:.1f}), Direction=({self.dx:.2f}, {self.dy:.2f}), Age={self.age}, Energy={self.energy:.1f}, Duration={duration:.4f}s")
+    
+    def compute_next_state(self, nearby_fish, params=None, noise=None, rng=None, world_size=None):
+        """次のティックの状態 (x, y, dx, dy, age, energy) を計算（自分も周りのメダカも変更しない）"""
         # パラメータを取得（デフォルト値を使用）
         if params is None:
             params = {
@@ -145,6 +182,10 @@ class Fish:
                 'fish_speed': FISH_SPEED
             }
         
+        # ランダム成分（群れから渡されなければここで引く）
+        if noise is None:
+            noise = (random_uniform(-1, 1, rng), random_uniform(-1, 1, rng))
+        
         # 群れ行動を計算
         sep_x, sep_y = self.calculate_separation(nearby_fish)
         align_x, align_y = self.calculate_alignment(nearby_fish)
@@ -154,48 +195,47 @@ class Fish:
         new_dx = (sep_x * params['separation_weight'] + 
                  align_x * params['alignment_weight'] + 
                  coh_x * params['cohesion_weight'] + 
-                 random.uniform(-1, 1) * params['random_weight'] +
+                 noise[0] * params['random_weight'] +
                  self.dx * params['inertia_weight'])
         
         new_dy = (sep_y * params['separation_weight'] + 
                  align_y * params['alignment_weight'] + 
                  coh_y * params['cohesion_weight'] + 
-                 random.uniform(-1, 1) * params['random_weight'] +
+                 noise[1] * params['random_weight'] +
                  self.dy * params['inertia_weight'])
         
         # 方向を正規化
+        dx, dy = self.dx, self.dy
         length = math.sqrt(new_dx**2 + new_dy**2)
         if length > 0:
-            self.dx = new_dx / length
-            self.dy = new_dy / length
-        
-        # 移動前の位置を記録
-        old_x, old_y = self.x, self.y
+            dx = new_dx / length
+            dy = new_dy / length
         
         # 移動
-        self.x += self.dx * params['fish_speed']
-        self.y += self.dy * params['fish_speed']
+        x = self.x + dx * params['fish_speed']
+        y = self.y + dy * params['fish_speed']
         
         # 境界処理（トーラス状の世界）
-        if self.x < 0 or self.x >= SCREEN_WIDTH or self.y < 0 or self.y >= SCREEN_HEIGHT:
-            self.x = self.x % SCREEN_WIDTH
-            self.y = self.y % SCREEN_HEIGHT
-            log_fish_behavior(self.id, "BOUNDARY_WRAP", f"Wrapped from ({old_x:.1f}, {old_y:.1f}) to ({self.x:.1f}, {self.y:.1f})")
+        world_width, world_height = world_size or (WORLD_WIDTH, WORLD_HEIGHT)
+        if x < 0 or x >= world_width or y < 0 or y >= world_height:
+            x = x % world_width
+            y = y % world_height
+            if utils.TRACE_ENABLED:
+                log_fish_behavior(self.id, "BOUNDARY_WRAP", f"Wrapped from ({self.x:.1f}, {self.y:.1f}) to ({x:.1f}, {y:.1f})")
         
         # 年齢と体力の更新
-        self.age += 1
-        self.energy = max(0, self.energy - 0.1)
-        
-        # ログ出力
-        duration = time.time() - start_time
-        log_fish_behavior(self.id, "UPDATE", f"Position=({self.x:.1f}, {self.y:.1f}), Direction=({self.dx:.2f}, {self.dy:.2f}), Age={self.age}, Energy={self.energy:.1f}, Duration={duration:.4f}s")
+        return (x, y, dx, dy, self.age + 1, max(0, self.energy - 0.1))
+    
+    def set_state(self, state):
+        """compute_next_stateで計算した状態を反映"""
+        self.x, self.y, self.dx, self.dy, self.age, self.energy = state
     
     def draw(self, screen):
         """メダカを描画"""
         import pygame
         
         # メダカの色（性別によって少し変える）
-        color = LIGHT_BLUE if self.gender == 'male' else BLUE
+        color = LIGHT_BLUE if self.gender_code == 0 else BLUE
         
         # メダカの位置
         pos_x = int(self.x)
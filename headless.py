@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+画面なし（pygameを使わない）でシミュレーションを実行するバッチ用エントリポイント
+"""
+
+import argparse
+import logging
+import time
+from school import School, UPDATE_MODES, VISION_BACKENDS
+from constants import *
+from utils import setup_logging, shutdown_logging, get_default_parameters
+from profiler import PROFILER
+
+# 利用可能な計算エンジン
+ENGINES = ('python', 'numpy', 'numba', 'numba_parallel', 'domain')
+
+PARAMETER_OPTIONS = {
+    'separation_weight': float,
+    'alignment_weight': float,
+    'cohesion_weight': float,
+    'random_weight': float,
+    'inertia_weight': float,
+    'fish_speed': float,
+    'vision_range': int
+}
+
+def create_school(fish_count=DEFAULT_FISH_COUNT, engine='python', seed=None, update_mode='sequential',
+                  vision_backend='spatial_hash', workers=None, world_size=None):
+    """計算エンジンとシードを指定して群れを作成（python以外のエンジンは常に同時更新で、視界検索も独自の配列処理。
+    domainは世界をworkers個（省略時はCPUコア数）のタイルに分けてプロセスごとに更新する。
+    world_sizeは世界の(幅, 高さ)で、省略時はWORLD_WIDTH x WORLD_HEIGHT）"""
+    if engine == 'python':
+        return School(fish_count, seed=seed, update_mode=update_mode, vision_backend=vision_backend,
+                      world_size=world_size)
+    if engine in ('numpy', 'numba', 'numba_parallel'):
+        from array_school import ArraySchool
+        return ArraySchool(fish_count, seed=seed, kernel=engine, world_size=world_size)
+    if engine == 'domain':
+        from domain import DomainSchool
+        return DomainSchool(fish_count, seed=seed, workers=workers, world_size=world_size)
+    raise ValueError(f"Unknown engine: {engine}")
+
+def run_headless(school, params, ticks, recorder=None, checkpoint=None, checkpoint_every=0, start_tick=0,
+                 analytics=None):
+    """描画せずにticks回だけ群れを更新し、速度を返す（recorderを渡すと毎ティックの状態を記録し、
+    checkpointを渡すとcheckpoint_everyティックごとと終了時にチェックポイントを保存し、
+    analytics（SchoolAnalytics）を渡すと一定のティックごとに秩序変数を計算する）"""
+    logger = logging.getLogger('FishSimulator.Headless')
+    if checkpoint is not None:
+        from checkpoint import save_checkpoint
+    start_time = time.perf_counter()
+
+    for tick in range(ticks):
+        tick_start = time.perf_counter()
+        school.update_all_fish(params)
+        if recorder is not None:
+            with PROFILER.stage('record'):
+                recorder.append(school)
+        if checkpoint is not None and checkpoint_every > 0 and (tick + 1) % checkpoint_every == 0:
+            with PROFILER.stage('checkpoint'):
+                save_checkpoint(checkpoint, school, params, {'tick': start_tick + tick + 1})
+        if analytics is not None:
+            analytics.observe(school, start_tick + tick + 1)
+        # プロファイラが有効なら1ティックを1フレームとして記録する
+        PROFILER.add('frame', time.perf_counter() - tick_start)
+        PROFILER.end_frame()
+
+    elapsed = time.perf_counter() - start_time
+    if checkpoint is not None:
+        save_checkpoint(checkpoint, school, params, {'tick': start_tick + ticks})
+    result = {
+        'ticks': ticks,
+        'fish_count': school.get_fish_count(),
+        'elapsed': elapsed,
+        'ticks_per_sec': ticks / elapsed if elapsed > 0 else float('inf')
+    }
+    logger.info(f"Headless run finished: {result}")
+    return result
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Fish School Simulator (headless)")
+    parser.add_argument('--fish', type=int, default=DEFAULT_FISH_COUNT, help="メダカの数")
+    parser.add_argument('--ticks', type=int, default=1000, help="更新回数")
+    parser.add_argument('--engine', choices=ENGINES, default=None,
+                        help="計算エンジン（省略時はpython、--resume時は保存時と同じ）")
+    parser.add_argument('--update-mode', choices=UPDATE_MODES, default='sequential',
+                        help="pythonエンジンの更新方式（synchronousはダブルバッファで順序に依存しない）")
+    parser.add_argument('--vision-backend', choices=tuple(VISION_BACKENDS), default='spatial_hash',
+                        help="pythonエンジンの視界検索の索引（occupancyは密集した群れ向け）")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="domainエンジンのワーカープロセス（タイル）の数（省略時はCPUコア数）")
+    parser.add_argument('--world-width', type=int, default=WORLD_WIDTH, help="世界の幅（画面より大きくできる）")
+    parser.add_argument('--world-height', type=int, default=WORLD_HEIGHT, help="世界の高さ")
+    parser.add_argument('--seed', type=int, default=None, help="乱数シード（同じシードなら同じ結果を再現）")
+    parser.add_argument('--trace', action='store_true', help="メダカ単位の詳細ログを出力する")
+    parser.add_argument('--record', default=None, metavar='PATH', help="毎ティックの位置・方向を軌跡ファイルに記録する")
+    parser.add_argument('--checkpoint', default=None, metavar='PATH', help="終了時（と--checkpoint-everyごと）に全状態を保存する")
+    parser.add_argument('--checkpoint-every', type=int, default=0, metavar='TICKS', help="チェックポイントを保存する間隔")
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help="段階ごとの処理時間を計測してJSON（拡張子.csvならCSV）で書き出す")
+    parser.add_argument('--analytics', default=None, metavar='PATH',
+                        help="一定のティックごとに秩序変数（分極・回転・最近傍距離・クラスタ）を計算してJSON（拡張子.csvならCSV）で書き出す")
+    parser.add_argument('--analytics-every', type=int, default=ANALYTICS_INTERVAL, metavar='TICKS',
+                        help="秩序変数を計算する間隔")
+    parser.add_argument('--resume', default=None, metavar='PATH', help="チェックポイントから再開する（--fish・--seedは無視）")
+    for name, value_type in PARAMETER_OPTIONS.items():
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, type=value_type, default=None)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """ヘッドレス実行のエントリポイント"""
+    args = parse_args(argv)
+    logger = setup_logging(trace=args.trace)
+
+    params = get_default_parameters()
+    if args.profile:
+        PROFILER.reset()
+        PROFILER.enabled = True
+    try:
+        start_tick = 0
+        if args.resume:
+            from checkpoint import load_checkpoint
+            school, saved_params, header = load_checkpoint(args.resume, args.engine)
+            params.update(saved_params)
+            start_tick = header.get('tick', 0)
+        else:
+            school = create_school(args.fish, args.engine or 'python', args.seed, args.update_mode, args.vision_backend,
+                                   args.workers, (args.world_width, args.world_height))
+        engine = getattr(school, 'kernel', 'python')
+        for name in PARAMETER_OPTIONS:
+            if getattr(args, name) is not None:
+                params[name] = getattr(args, name)
+
+        logger.info(f"Headless run started: engine={engine}, fish={school.get_fish_count()}, ticks={args.ticks}, "
+                    f"seed={school.seed}, start_tick={start_tick}, params={params}")
+        options = {'checkpoint': args.checkpoint, 'checkpoint_every': args.checkpoint_every, 'start_tick': start_tick}
+        if args.analytics:
+            from analytics import SchoolAnalytics
+            options['analytics'] = SchoolAnalytics(args.analytics_every)
+        if args.record:
+            from trajectory import TrajectoryWriter
+            with TrajectoryWriter(args.record, school.get_fish_count(), params, school.seed, {'engine': engine},
+                                  capacity=args.ticks, world_size=school.world_size) as recorder:
+                result = run_headless(school, params, args.ticks, recorder, **options)
+        else:
+            result = run_headless(school, params, args.ticks, **options)
+        print(f"ticks: {result['ticks']}, メダカ数: {result['fish_count']}, "
+              f"経過時間: {result['elapsed']:.2f}秒, ticks/sec: {result['ticks_per_sec']:.1f}")
+        if args.profile:
+            PROFILER.export(args.profile)
+            print("\n".join(PROFILER.format_lines()))
+        if args.analytics:
+            options['analytics'].export(args.analytics)
+            print("\n".join(options['analytics'].format_lines()))
+        return result
+    finally:
+        shutdown_logging()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import math
+import logging
+import numpy as np
+from constants import *
+from spatial import CellGrid
+
+# Numbaは任意の依存関係（無い場合はArraySchoolがNumPyのベクトル演算に切り替える）
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+    prange = numba.prange
+except ImportError:
+    numba = None
+    NUMBA_AVAILABLE = False
+    prange = range
+
+# ArraySchoolで選べる計算カーネル
+KERNELS = ('numpy', 'numba', 'numba_parallel')
+# カーネルで使うセルのサイズ（視界チェックの許容範囲±VISION_TOLERANCEと同じ幅）
+KERNEL_CELL_SIZE = VISION_TOLERANCE
+
+logger = logging.getLogger('FishSimulator.Kernels')
+
+
+def on_ray(rel_x, rel_y, ray_x, ray_y, vision_range, tolerance):
+    """相対位置(rel_x, rel_y)が視線(ray_x, ray_y)上のいずれかのチェック位置に入るかを判定（spatial.rays_visibleのスカラー版）"""
+    lo = 1.0
+    hi = float(vision_range)
+    if ray_x == 0:
+        if abs(rel_x) > tolerance:
+            return False
+    else:
+        a = (rel_x - tolerance) * ray_x
+        b = (rel_x + tolerance) * ray_x
+        lo = max(lo, math.ceil(min(a, b)))
+        hi = min(hi, math.floor(max(a, b)))
+    if ray_y == 0:
+        if abs(rel_y) > tolerance:
+            return False
+    else:
+        a = (rel_y - tolerance) * ray_y
+        b = (rel_y + tolerance) * ray_y
+        lo = max(lo, math.ceil(min(a, b)))
+        hi = min(hi, math.floor(max(a, b)))
+    return lo <= hi
+
+
+# Numbaがあればコンパイルしておく（カーネルからはコンパイル済みの関数しか呼べない）
+_on_ray = numba.njit(on_ray, cache=True) if NUMBA_AVAILABLE else on_ray
+
+
+def boids_step(x, y, dx, dy, noise_x, noise_y, cell_keys, starts, counts, cols, rows, origin_x, origin_y,
+               cell_size, vision_range, tolerance, weights, fish_speed, width, height,
+               out_x, out_y, out_dx, out_dy):
+    """視界内のメダカの検索から分離・整列・結合・合成・移動までを1匹ずつ計算し、out_*に書き込む
+
+    全てのメダカがティック開始時の状態(x, y, dx, dy)を読むため、メダカごとに独立に（並列にも）計算できる。
+    配列はセル順に並べ替えておく（cell_keysはメダカのいるセルの番号の昇順で、
+    k番目のセルのメダカはstarts[k]からcounts[k]匹）。
+    weightsは(分離, 整列, 結合, ランダム性, 慣性)の重み。
+    """
+    separation_weight, alignment_weight, cohesion_weight, random_weight, inertia_weight = (
+        weights[0], weights[1], weights[2], weights[3], weights[4])
+    for i in prange(len(x)):
+        fish_x = x[i]
+        fish_y = y[i]
+        fish_dx = dx[i]
+        fish_dy = dy[i]
+
+        # 方向を8方向に丸め、前方・斜め前（左右）の3本の視線を決める（spatial.get_vision_raysと同じ規則）
+        sign_x = 1 if fish_dx > 0 else -1
+        sign_y = 1 if fish_dy > 0 else -1
+        front_x = 0 if abs(fish_dy) > abs(fish_dx) else sign_x
+        front_y = 0 if abs(fish_dx) > abs(fish_dy) else sign_y
+        if front_x != 0 and front_y != 0:
+            rays = ((front_x, front_y), (front_x, 0), (0, front_y))
+        elif front_x != 0:
+            rays = ((front_x, front_y), (front_x, -1), (front_x, 1))
+        else:
+            rays = ((front_x, front_y), (-1, front_y), (1, front_y))
+
+        sep_x = 0.0
+        sep_y = 0.0
+        sum_dx = 0.0
+        sum_dy = 0.0
+        sum_x = 0.0
+        sum_y = 0.0
+        neighbors = 0
+        for ray_index in range(3):
+            ray_x, ray_y = rays[ray_index]
+            # 視線のチェック範囲（各距離の位置±tolerance）が掛かるセルを列ごとに調べる
+            first_col = max(0, int(math.floor((fish_x + min(ray_x, ray_x * vision_range) - tolerance) / cell_size)) - origin_x)
+            last_col = min(cols - 1, int(math.floor((fish_x + max(ray_x, ray_x * vision_range) + tolerance) / cell_size)) - origin_x)
+            for col in range(first_col, last_col + 1):
+                # この列にチェック位置が掛かる距離の範囲
+                d_lo = 1.0
+                d_hi = float(vision_range)
+                if ray_x != 0:
+                    left = (col + origin_x) * cell_size - tolerance - fish_x
+                    right = (col + origin_x + 1) * cell_size + tolerance - fish_x
+                    d_lo = max(d_lo, min(left * ray_x, right * ray_x))
+                    d_hi = min(d_hi, max(left * ray_x, right * ray_x))
+                    if d_lo > d_hi:
+                        continue
+                top = fish_y + min(ray_y * d_lo, ray_y * d_hi) - tolerance
+                bottom = fish_y + max(ray_y * d_lo, ray_y * d_hi) + tolerance
+                first_row = max(0, int(math.floor(top / cell_size)) - origin_y)
+                last_row = min(rows - 1, int(math.floor(bottom / cell_size)) - origin_y)
+                # この列のfirst_row〜last_rowのセルは番号が連続するため、メダカのいるセルを1回の二分探索で見つける
+                last_key = col * rows + last_row
+                position = np.searchsorted(cell_keys, col * rows + first_row)
+                while position < len(cell_keys) and cell_keys[position] <= last_key:
+                    start = starts[position]
+                    end = start + counts[position]
+                    position += 1
+                    for j in range(start, end):
+                        if j == i:
+                            continue
+                        rel_x = x[j] - fish_x
+                        rel_y = y[j] - fish_y
+                        # この視線上のチェック位置に入り、それより前の視線では数えていないものだけを数える
+                        # （spatial.rays_visibleと同じ判定）
+                        if not _on_ray(rel_x, rel_y, ray_x, ray_y, vision_range, tolerance):
+                            continue
+                        counted = False
+                        for earlier in range(ray_index):
+                            if _on_ray(rel_x, rel_y, rays[earlier][0], rays[earlier][1], vision_range, tolerance):
+                                counted = True
+                                break
+                        if counted:
+                            continue
+
+                        # 分離（距離が近いほど強い力で離れる）と、整列・結合用の合計
+                        distance = math.sqrt(rel_x * rel_x + rel_y * rel_y)
+                        if distance > 0:
+                            force = 1.0 / distance
+                            sep_x -= rel_x * force
+                            sep_y -= rel_y * force
+                        sum_dx += dx[j]
+                        sum_dy += dy[j]
+                        sum_x += x[j]
+                        sum_y += y[j]
+                        neighbors += 1
+
+        align_x = 0.0
+        align_y = 0.0
+        coh_x = 0.0
+        coh_y = 0.0
+        if neighbors > 0:
+            align_x = sum_dx / neighbors
+            align_y = sum_dy / neighbors
+            coh_x = sum_x / neighbors - fish_x
+            coh_y = sum_y / neighbors - fish_y
+
+        # 重み付けで合成し、方向を正規化（長さ0なら前の向きを保つ）
+        new_dx = (sep_x * separation_weight + align_x * alignment_weight + coh_x * cohesion_weight +
+                  noise_x[i] * random_weight + fish_dx * inertia_weight)
+        new_dy = (sep_y * separation_weight + align_y * alignment_weight + coh_y * cohesion_weight +
+                  noise_y[i] * random_weight + fish_dy * inertia_weight)
+        length = math.sqrt(new_dx * new_dx + new_dy * new_dy)
+        if length > 0:
+            fish_dx = new_dx / length
+            fish_dy = new_dy / length
+
+        # 移動と境界処理（トーラス状の世界）
+        out_dx[i] = fish_dx
+        out_dy[i] = fish_dy
+        out_x[i] = (fish_x + fish_dx * fish_speed) % width
+        out_y[i] = (fish_y + fish_dy * fish_speed) % height
+
+
+# コンパイル済みのカーネル（名前ごとに1回だけコンパイルする）
+_compiled = {}
+
+
+def get_kernel(name):
+    """名前に対応するコンパイル済みのboids_stepを返す（初回はJITコンパイルする）
+
+    カーネルはGILを解放して走る（nogil）ため、シミュレーションスレッドで計算している間も描画スレッドが止まらない。
+    """
+    if name not in ('numba', 'numba_parallel'):
+        raise ValueError(f"Unknown kernel: {name}")
+    if not NUMBA_AVAILABLE:
+        raise ImportError("numba is not installed")
+    if name not in _compiled:
+        logger.info(f"Compiling {name} kernel")
+        _compiled[name] = numba.njit(boids_step, parallel=(name == 'numba_parallel'), nogil=True, cache=True)
+    return _compiled[name]
+
+
+def run_boids_step(kernel, x, y, dx, dy, noise, params, world_size=None):
+    """カーネルで1ティック分の新しい位置と方向(x, y, dx, dy)を計算（kernelはget_kernelの戻り値かboids_step、world_sizeは世界の(幅, 高さ)）"""
+    world_width, world_height = world_size or (WORLD_WIDTH, WORLD_HEIGHT)
+    vision_range = int(params.get('vision_range', VISION_RANGE))
+    grid = CellGrid(x, y, KERNEL_CELL_SIZE)
+    weights = np.array([
+        params.get('separation_weight', SEPARATION_WEIGHT),
+        params.get('alignment_weight', ALIGNMENT_WEIGHT),
+        params.get('cohesion_weight', COHESION_WEIGHT),
+        params.get('random_weight', RANDOM_WEIGHT),
+        params.get('inertia_weight', INERTIA_WEIGHT),
+    ], dtype=np.float64)
+    # 同じセルのメダカがメモリ上で隣り合うように並べ替えてから計算し、元の順に戻す
+    order = grid.order
+    sorted_out = [np.empty(len(x)) for k in range(4)]
+    kernel(x[order], y[order], dx[order], dy[order], noise[0][order], noise[1][order],
+           grid.cell_keys, grid.starts, grid.counts, grid.cols, grid.rows, grid.origin_x, grid.origin_y,
+           float(KERNEL_CELL_SIZE), vision_range, float(VISION_TOLERANCE), weights, float(params.get('fish_speed', FISH_SPEED)),
+           float(world_width), float(world_height), *sorted_out)
+    out = [np.empty(len(x)) for k in range(4)]
+    for target, source in zip(out, sorted_out):
+        target[order] = source
+    return tuple(out)
@@ -4,33 +4,134 @@
 import sys
 import time
 import logging
+import argparse
 from world import World
-from school import School
+from headless import ENGINES, create_school
 from constants import *
-from utils import setup_logging, log_world_event, log_performance
+from profiler import PROFILER
+from analytics import SchoolAnalytics
+from utils import setup_logging, shutdown_logging, log_world_event, log_performance
 
-def main():
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Fish School Simulator")
+    parser.add_argument('--trace', action='store_true',
+                        help="メダカ単位の詳細ログ（DEBUG）をfish_simulator.logに出力する")
+    parser.add_argument('--record', default=None, metavar='PATH',
+                        help="毎フレームの位置・方向を軌跡ファイルに記録する")
+    parser.add_argument('--record-max-fish', type=int, default=1000,
+                        help="軌跡ファイルに記録するメダカの最大数")
+    parser.add_argument('--replay', default=None, metavar='PATH',
+                        help="シミュレーションせずに軌跡ファイルを再生する")
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help="再生速度の倍率（1で記録1ティックを1フレームとして再生）")
+    parser.add_argument('--threaded', action='store_true',
+                        help="群れの更新を別スレッドで固定ティックレートで回し、描画と切り離す")
+    parser.add_argument('--tick-rate', type=float, default=FPS,
+                        help="--threaded時の1秒あたりのティック数")
+    parser.add_argument('--no-interpolate', action='store_true',
+                        help="--threaded時にティック間の位置を補間しない")
+    parser.add_argument('--checkpoint', default='checkpoint.npz', metavar='PATH',
+                        help="F5で保存・F9で読み込むチェックポイントファイル")
+    parser.add_argument('--resume', default=None, metavar='PATH',
+                        help="チェックポイントから群れとパラメータを復元して開始する")
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help="段階ごとの処理時間を計測し、終了時にJSON（拡張子.csvならCSV）で書き出す")
+    parser.add_argument('--analytics', default=None, metavar='PATH',
+                       help="終了時に秩序変数の時系列を書き出す（.csvならCSV、それ以外はJSON）")
+    parser.add_argument('--analytics-every', type=int, default=ANALYTICS_INTERVAL, metavar='TICKS',
+                       help="秩序変数を計算する間隔（Lキーで表示）")
+    parser.add_argument('--fish', type=int, default=DEFAULT_FISH_COUNT, help="メダカの数")
+    parser.add_argument('--world-width', type=int, default=WORLD_WIDTH,
+                       help="世界の幅（画面より大きければ右ドラッグとホイールで見る範囲を動かす）")
+    parser.add_argument('--world-height', type=int, default=WORLD_HEIGHT, help="世界の高さ")
+    parser.add_argument('--engine', choices=ENGINES, default='python', help="計算エンジン")
+    parser.add_argument('--schools', type=int, default=1,
+                        help="1つの水槽で動かす群れの数（2以上で群れごとにパラメータを持ち、他の群れを避ける）")
+    parser.add_argument('--avoid-weight', type=float, default=AVOID_WEIGHT, help="他の群れを避ける重み")
+    args = parser.parse_args(argv)
+    # 複数の群れでは記録もスレッドモードも使えない（記録ファイルを作る前に止める）
+    if args.schools > 1 and (args.record or args.threaded):
+        parser.error("--record and --threaded cannot be used with --schools > 1")
+    # 再生中の軌跡ファイルを記録で上書きしない
+    if args.replay and args.record:
+        parser.error("--record cannot be used with --replay")
+    return args
+
+def main(argv=None):
     """メインゲームループ"""
+    args = parse_args(argv)
+    
     # ログ設定を初期化
-    logger = setup_logging()
+    logger = setup_logging(trace=args.trace)
     logger.info("=== Fish School Simulator Starting ===")
     
     print("Fish School Simulator を開始します...")
     
-    # 世界と群れを初期化
-    world = World()
-    school = School(DEFAULT_FISH_COUNT)
+    # 世界を初期化
+    world_size = (args.world_width, args.world_height)
+    world = World(world_size=world_size)
+    PROFILER.enabled = args.profile is not None
+    recorder = None
+    analytics = SchoolAnalytics(args.analytics_every)
     
     try:
         # pygameを初期化
         world.initialize()
         print(f"画面サイズ: {world.width}x{world.height}")
+        
+        # 再生モード（update_all_fishを呼ばずに記録済みのティックを表示するため、群れも記録も作らない）
+        if args.replay:
+            from replay import run_replay
+            print(f"軌跡ファイルを再生します: {args.replay}")
+            frame_count = run_replay(world, args.replay, args.replay_speed)
+            logger.info(f"Replay ended after {frame_count} frames")
+            return
+        
+        # 群れを初期化
+        if args.resume:
+            from checkpoint import load_checkpoint
+            school, params, _ = load_checkpoint(args.resume)
+            world.set_parameters(params)
+            world.set_world_size(*school.world_size)
+        else:
+            school = create_school(args.fish, args.engine, world_size=world_size)
+        if args.record:
+            from trajectory import TrajectoryWriter
+            recorder = TrajectoryWriter(args.record, args.record_max_fish, world.get_parameters(), school.seed,
+                                        world_size=school.world_size)
         print(f"メダカの数: {school.get_fish_count()}")
         print("ゲーム開始！")
         
         logger.info(f"Game started with {school.get_fish_count()} fish on {world.width}x{world.height} screen")
         log_world_event("GAME_START", f"Fish count: {school.get_fish_count()}")
         
+        # 複数の群れ（群れごとのパラメータ、全ての群れで共有するセルリスト、群れごとの並行更新）
+        if args.schools > 1:
+            from tank import Tank, run_tank
+            tank = Tank()
+            tank.add_school(school, dict(world.get_simulation_parameters(), avoid_weight=args.avoid_weight))
+            for _ in range(args.schools - 1):
+                tank.add_school(create_school(args.fish, args.engine, world_size=school.world_size),
+                                dict(world.get_simulation_parameters(), avoid_weight=args.avoid_weight))
+            frame_count = run_tank(world, tank)
+            logger.info(f"Game ended after {frame_count} frames with {len(tank.schools)} schools "
+                        f"and {tank.get_fish_count()} fish")
+            log_world_event("GAME_END", f"Total frames: {frame_count}, Schools: {len(tank.schools)}")
+            print("ゲーム終了")
+            return
+        
+        # スレッドモード（群れの更新は固定ティックレートの別スレッド、描画は最新のスナップショット）
+        if args.threaded:
+            from simulation_thread import run_threaded
+            frame_count, simulation = run_threaded(world, school, world.get_simulation_parameters(),
+                                                   args.tick_rate, not args.no_interpolate, recorder, args.checkpoint)
+            logger.info(f"Game ended after {frame_count} frames and {simulation.ticks} ticks "
+                        f"({simulation.dropped_ticks} dropped). Final statistics: {simulation.school.get_school_statistics()}")
+            log_world_event("GAME_END", f"Total frames: {frame_count}, Total ticks: {simulation.ticks}")
+            print("ゲーム終了")
+            return
+        
         # メインループ
         running = True
         frame_count = 0
@@ -57,34 +158,50 @@ def main():
                 school.reset_fish_positions()
                 print(f"メダカの位置をリセットしました: {school.get_fish_count()}匹")
                 logger.info(f"Fish positions reset for {school.get_fish_count()} fish")
+            elif isinstance(event_result, tuple) and event_result[0] == "save_checkpoint":
+                # チェックポイントを保存
+                from checkpoint import save_checkpoint
+                save_checkpoint(args.checkpoint, school, world.get_simulation_parameters())
+                print(f"チェックポイントを保存しました: {args.checkpoint}")
+            elif isinstance(event_result, tuple) and event_result[0] == "load_checkpoint":
+                # チェックポイントから群れとパラメータを復元
+                from checkpoint import load_checkpoint
+                try:
+                    school, params, _ = load_checkpoint(args.checkpoint)
+                    world.set_parameters(params)
+                    world.set_world_size(*school.world_size)
+                    print(f"チェックポイントを読み込みました: {args.checkpoint}")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Failed to load checkpoint {args.checkpoint}: {e}")
+                    print(f"チェックポイントを読み込めません: {e}")
             
             # 群れの更新
             # Worldクラスから現在のパラメータを取得
-            params = {
-                'separation_weight': world.separation_weight,
-                'alignment_weight': world.alignment_weight,
-                'cohesion_weight': world.cohesion_weight,
-                'random_weight': world.random_weight,
-                'inertia_weight': world.inertia_weight,
-                'fish_speed': world.fish_speed,
-                'vision_range': world.vision_range
-            }
+            params = world.get_simulation_parameters()
             school.update_all_fish(params)
+            if recorder is not None:
+                recorder.append(school)
+            # 秩序変数（表示中か書き出すときだけ、一定のティックごとに計算）
+            if world.show_analytics or args.analytics:
+                analytics.observe(school)
             
             # 描画
             world.draw_background()
-            school.draw_all_fish(world.screen)
+            school.draw_all_fish(world.screen, world.camera)
             
             # 追加情報の描画
             world.draw_info(school)
             world.draw_vision_areas(school)
             world.draw_school_center(school)
+            world.draw_analytics(analytics)
             
             # 画面更新
             world.update_display()
+            PROFILER.add('frame', time.time() - loop_start_time)
             
             # フレームレート制御
             world.tick()
+            PROFILER.end_frame()
             
             # 統計情報
             frame_count += 1
@@ -139,6 +256,12 @@ def main():
         traceback.print_exc()
     finally:
         # クリーンアップ
+        if recorder is not None:
+            recorder.close()
+        if args.profile:
+            PROFILER.export(args.profile)
+        if args.analytics:
+            analytics.export(args.analytics)
         try:
             world.quit()
             logger.info("Pygame shutdown completed")
@@ -146,6 +269,7 @@ def main():
             logger.error(f"Error during pygame shutdown: {e}")
         
         logger.info("=== Fish School Simulator Shutdown Complete ===")
+        shutdown_logging()
         print("プログラムを終了します")
 
 if __name__ == "__main__":
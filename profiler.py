@@ -0,0 +1,119 @@
+import csv
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# 集計する直近のフレーム数
+PROFILER_WINDOW = 600
+# 表示・出力する段階の順（これ以外の名前も記録できる）
+PROFILER_STAGES = ('events', 'neighbors', 'update', 'stats', 'background', 'fish_draw', 'overlays', 'flip', 'frame')
+# 出力する統計量（ミリ秒）
+PROFILER_COLUMNS = ('count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+
+
+class Profiler:
+    """段階ごとの処理時間を1フレーム分ずつ合計し、直近PROFILER_WINDOWフレームのパーセンタイルを出す"""
+
+    def __init__(self, window=PROFILER_WINDOW, enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self.logger = logging.getLogger('FishSimulator.Profiler')
+        self._lock = threading.Lock()  # スレッドモードではシミュレーションスレッドからも加算される
+        self.reset()
+
+    def reset(self):
+        """記録を全て消す"""
+        self.frames = 0
+        self._current = {}
+        self._samples = {}  # 段階名 -> 直近windowフレーム分のリングバッファ（秒）
+        self._counts = {}
+
+    def add(self, stage, duration):
+        """現在のフレームの段階stageにduration秒を加える（同じフレーム内で何度呼んでもよい）"""
+        if self.enabled:
+            with self._lock:
+                self._current[stage] = self._current.get(stage, 0.0) + duration
+
+    @contextmanager
+    def stage(self, name):
+        """with文の中の処理時間を段階nameに加える"""
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def end_frame(self):
+        """現在のフレームの合計を各段階の1サンプルとして確定する"""
+        if not self.enabled:
+            return
+        with self._lock:
+            current, self._current = self._current, {}
+        for stage, duration in current.items():
+            if stage not in self._samples:
+                self._samples[stage] = np.zeros(self.window)
+                self._counts[stage] = 0
+            self._samples[stage][self._counts[stage] % self.window] = duration
+            self._counts[stage] += 1
+        self.frames += 1
+
+    def stages(self):
+        """記録のある段階名（PROFILER_STAGESの順、その後に他の段階）"""
+        known = [stage for stage in PROFILER_STAGES if stage in self._samples]
+        return known + sorted(stage for stage in self._samples if stage not in PROFILER_STAGES)
+
+    def summary(self):
+        """段階ごとの直近の統計量（ミリ秒）の辞書"""
+        result = {}
+        for stage in self.stages():
+            count = min(self._counts[stage], self.window)
+            samples = self._samples[stage][:count] * 1000.0
+            p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+            result[stage] = {
+                'count': count,
+                'mean_ms': float(samples.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(samples.max())
+            }
+        return result
+
+    def to_json(self, path):
+        """統計量をJSONで書き出す"""
+        report = {'frames': self.frames, 'window': self.window, 'stages': self.summary()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    def to_csv(self, path):
+        """統計量をCSV（1行1段階）で書き出す"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(('stage',) + PROFILER_COLUMNS)
+            for stage, stats in self.summary().items():
+                writer.writerow([stage] + [stats[column] for column in PROFILER_COLUMNS])
+
+    def export(self, path):
+        """拡張子（.csvならCSV、それ以外はJSON）に応じて書き出す"""
+        if path.lower().endswith('.csv'):
+            self.to_csv(path)
+        else:
+            self.to_json(path)
+        self.logger.info(f"Profile exported to {path} ({self.frames} frames)")
+
+    def format_lines(self):
+        """段階ごとのp50/p95/p99（ミリ秒）の表をテキストの行で返す"""
+        lines = [f"{'Profile (ms)':<14}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for stage, stats in self.summary().items():
+            lines.append(f"{stage:<14}{stats['p50_ms']:>7.2f}{stats['p95_ms']:>7.2f}{stats['p99_ms']:>7.2f}")
+        return lines
+
+
+# アプリケーション全体で共有するプロファイラ（既定では無効で、addはほぼ何もしない）
+PROFILER = Profiler()
@@ -0,0 +1,161 @@
+import math
+import time
+import numpy as np
+from constants import *
+import utils
+from utils import log_performance
+
+# 性別コード（0: male, 1: female）ごとの色
+GENDER_COLORS = (LIGHT_BLUE, BLUE)
+# スプライトの透過色（カラーキー転送はアルファ転送より大幅に速い）
+SPRITE_COLORKEY = (255, 0, 255)
+# 描画の詳細度（三角形・1ピクセルの点・密度のヒートマップ）
+LOD_LEVELS = ('sprites', 'points', 'heatmap')
+
+
+def choose_lod(count, zoom=1.0, area=SCREEN_WIDTH * SCREEN_HEIGHT):
+    """画面に映るcount匹を面積areaの画面に描くときの詳細度（拡大率と画面上の平均間隔で決める）"""
+    if count == 0:
+        return 'sprites'
+    spacing = math.sqrt(area / count)
+    if spacing < LOD_HEATMAP_SPACING:
+        return 'heatmap'
+    if zoom < LOD_SPRITE_MIN_ZOOM or spacing < FISH_SIZE or count > LOD_MAX_SPRITES:
+        return 'points'
+    return 'sprites'
+
+
+class FishRenderer:
+    """向きを量子化した三角形スプライトを事前に作り、Surface.blitsでまとめて描画する
+
+    拡大率が小さいときやメダカが詰まっているときは、三角形の代わりに画素配列へ1ピクセルの点を書き込み、
+    さらに詰まっていれば一定の大きさのマスごとの数を数えた密度のヒートマップを加算合成で重ねる。
+    """
+
+    def __init__(self, direction_buckets=64, fish_size=FISH_SIZE, colors=GENDER_COLORS):
+        self.direction_buckets = direction_buckets
+        self.fish_size = fish_size
+        self.colors = colors
+        # 回転キャッシュ: [色][向きの区分]のスプライト（最後の区分は向きなしの円）
+        self._sprites = None
+        self._center = fish_size + 1
+        self._heat_colors = None
+        self.last_lod = None  # 直前の描画で使った詳細度
+
+    def _new_sprite(self, size):
+        """透過色で塗りつぶしたスプライト用のSurfaceを作成"""
+        import pygame
+
+        surface = pygame.Surface((size, size))
+        surface.fill(SPRITE_COLORKEY)
+        surface.set_colorkey(SPRITE_COLORKEY, pygame.RLEACCEL)
+        return surface
+
+    def _build_sprites(self):
+        """向きの区分と色ごとのスプライトを作成"""
+        import pygame
+
+        size = 2 * self._center + 1
+        center = self._center
+        sprites = np.empty((len(self.colors), self.direction_buckets + 1), dtype=object)
+        for color_index, color in enumerate(self.colors):
+            for bucket in range(self.direction_buckets):
+                angle = 2 * math.pi * bucket / self.direction_buckets
+                dx_norm, dy_norm = math.cos(angle), math.sin(angle)
+                perp_x = -dy_norm * self.fish_size * 0.5
+                perp_y = dx_norm * self.fish_size * 0.5
+
+                # Fish.drawと同じ形の三角形（先端・左右の底辺）
+                surface = self._new_sprite(size)
+                pygame.draw.polygon(surface, color, [
+                    (center + dx_norm * self.fish_size, center + dy_norm * self.fish_size),
+                    (center + perp_x, center + perp_y),
+                    (center - perp_x, center - perp_y)
+                ])
+                sprites[color_index, bucket] = surface
+
+            # 方向が未設定の場合は円
+            surface = self._new_sprite(size)
+            pygame.draw.circle(surface, color, (center, center), self.fish_size)
+            sprites[color_index, self.direction_buckets] = surface
+        self._sprites = sprites
+
+    def draw(self, screen, x, y, dx, dy, gender=None, zoom=1.0, lod=None):
+        """配列で与えたメダカをまとめて描画（genderは性別コードの配列、省略時は全てmaleの色。
+        lodを省略すると画面上の数と拡大率zoomから詳細度を選ぶ）"""
+        start_time = time.time()
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) == 0:
+            return
+        colors = np.zeros(len(x), dtype=np.int64) if gender is None else np.asarray(gender, dtype=np.int64)
+        width, height = screen.get_size()
+        lod = lod or choose_lod(len(x), zoom, width * height)
+        self.last_lod = lod
+
+        if lod == 'heatmap':
+            self._draw_heatmap(screen, x, y)
+        elif lod == 'points':
+            self._draw_points(screen, x, y, colors)
+        else:
+            self._draw_sprites(screen, x, y, np.asarray(dx, dtype=np.float64), np.asarray(dy, dtype=np.float64), colors)
+
+        if utils.TRACE_ENABLED:
+            duration = time.time() - start_time
+            log_performance(f"Batched fish drawing ({lod})", duration)
+
+    def _draw_sprites(self, screen, x, y, dx, dy, colors):
+        """向きの区分ごとの三角形スプライトをまとめて転送"""
+        if self._sprites is None:
+            self._build_sprites()
+
+        # 向きを区分に量子化
+        angle = np.arctan2(dy, dx)
+        buckets = np.rint(angle / (2 * math.pi) * self.direction_buckets).astype(np.int64) % self.direction_buckets
+        buckets[(dx == 0) & (dy == 0)] = self.direction_buckets
+
+        sprites = self._sprites[colors, buckets]
+        positions = np.stack([x.astype(np.int64) - self._center, y.astype(np.int64) - self._center], axis=1)
+        screen.blits(list(zip(sprites.tolist(), positions.tolist())), doreturn=False)
+
+    def _draw_points(self, screen, x, y, colors):
+        """画面の画素配列にメダカの位置を1ピクセルずつ書き込む"""
+        import pygame
+
+        width, height = screen.get_size()
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        if not inside.all():
+            inside = np.flatnonzero(inside)
+            x, y, colors = x[inside], y[inside], colors[inside]
+        mapped = np.array([screen.map_rgb(color) for color in self.colors])
+        pixels = pygame.surfarray.pixels2d(screen)
+        try:
+            pixels[x.astype(np.intp), y.astype(np.intp)] = mapped[colors]
+        finally:
+            # 画素配列を手放して画面のロックを解く
+            del pixels
+
+    def _draw_heatmap(self, screen, x, y):
+        """LOD_HEATMAP_CELLピクセル四方のマスごとのメダカの数を、対数の明るさで加算合成する"""
+        import pygame
+
+        if self._heat_colors is None:
+            # 黒 -> 1色目 -> 白の256段階
+            ramp = np.linspace(0.0, 2.0, 256)[:, None]
+            base = np.array(self.colors[0], dtype=np.float64)
+            self._heat_colors = np.where(ramp <= 1, ramp * base, base + (ramp - 1) * (255 - base)).astype(np.uint8)
+        width, height = screen.get_size()
+        cols = -(-width // LOD_HEATMAP_CELL)
+        rows = -(-height // LOD_HEATMAP_CELL)
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        if not inside.all():
+            inside = np.flatnonzero(inside)
+            x, y = x[inside], y[inside]
+        keys = (x * (1 / LOD_HEATMAP_CELL)).astype(np.intp) * rows + (y * (1 / LOD_HEATMAP_CELL)).astype(np.intp)
+        counts = np.bincount(keys, minlength=cols * rows).reshape(cols, rows)
+        if not counts.any():
+            return
+        levels = (np.log1p(counts) * (255 / np.log1p(counts.max()))).astype(np.int64)
+        surface = pygame.surfarray.make_surface(self._heat_colors[levels])
+        surface = pygame.transform.scale(surface, (cols * LOD_HEATMAP_CELL, rows * LOD_HEATMAP_CELL))
+        screen.blit(surface, (0, 0), special_flags=pygame.BLEND_ADD)
@@ -0,0 +1,155 @@
+import time
+import logging
+import numpy as np
+from snapshot import SnapshotSchool
+from constants import *
+from profiler import PROFILER
+from trajectory import TrajectoryReader
+from utils import log_world_event, log_performance
+
+# 再生速度の範囲（記録1ティックを1フレームとした倍率）
+MIN_REPLAY_SPEED = 1 / 16
+MAX_REPLAY_SPEED = 256
+
+
+class ReplaySchool(SnapshotSchool):
+    """軌跡ファイルの1ティック分を、Schoolと同じ取得・描画メソッドで見せる読み取り専用の群れ"""
+
+    def __init__(self, reader):
+        super().__init__(np.zeros((0, 4)), world_size=reader.world_size)
+        self.reader = reader
+        self.seed = reader.seed
+        self.logger = logging.getLogger('FishSimulator.Replay')
+        self.tick = None
+        self.seek(0)
+
+    def seek(self, tick):
+        """表示するティックを変更（範囲外は端に丸める）"""
+        tick = min(max(0, int(tick)), max(0, len(self.reader) - 1))
+        if tick != self.tick:
+            self.tick = tick
+            self.set_state(self.reader[tick] if len(self.reader) else np.zeros((0, 4)))
+        return self.tick
+
+    def update_all_fish(self, params=None):
+        raise TypeError("ReplaySchool is read-only; use ReplayPlayer to advance")
+
+
+class ReplayPlayer:
+    """再生位置・一時停止・再生速度を管理し、経過時間に応じて表示するティックを決める"""
+
+    def __init__(self, school, fps=FPS, speed=1.0):
+        self.school = school
+        self.fps = fps
+        self.speed = speed
+        self.paused = False
+        self.position = float(school.tick)  # 小数部分は次のティックまでの途中
+        self.logger = logging.getLogger('FishSimulator.Replay')
+
+    @property
+    def tick(self):
+        return self.school.tick
+
+    @property
+    def last_tick(self):
+        return max(0, len(self.school.reader) - 1)
+
+    def advance(self, elapsed):
+        """elapsed秒分だけ再生を進める（描画が間に合わなければ途中のティックを飛ばす）"""
+        if self.paused:
+            return self.tick
+        self.position = min(self.position + elapsed * self.fps * self.speed, self.last_tick)
+        if self.position >= self.last_tick:
+            self.paused = True
+            self.logger.info(f"Replay reached the last tick {self.last_tick}")
+        return self.school.seek(self.position)
+
+    def seek(self, tick):
+        """指定したティックに移動"""
+        self.position = float(self.school.seek(tick))
+        return self.tick
+
+    def step(self, ticks):
+        """ticksだけ前後に移動（一時停止中のコマ送り用）"""
+        return self.seek(self.tick + ticks)
+
+    def toggle_pause(self):
+        """一時停止を切り替える（最後まで再生していたら最初から）"""
+        self.paused = not self.paused
+        if not self.paused and self.tick >= self.last_tick:
+            self.seek(0)
+        return self.paused
+
+    def change_speed(self, factor):
+        """再生速度をfactor倍にする"""
+        self.speed = min(max(self.speed * factor, MIN_REPLAY_SPEED), MAX_REPLAY_SPEED)
+        return self.speed
+
+    def handle_event(self, event_result):
+        """World.handle_eventsの再生操作を反映（再生操作でなければFalse）"""
+        if not isinstance(event_result, tuple):
+            return False
+        action = event_result[0]
+        if action == "replay_pause":
+            self.toggle_pause()
+        elif action == "replay_step":
+            self.paused = True
+            self.step(event_result[1])
+        elif action == "replay_speed":
+            self.change_speed(event_result[1])
+        elif action == "replay_seek":
+            self.seek(event_result[1] if event_result[1] >= 0 else self.last_tick)
+        else:
+            return False
+        self.logger.info(f"Replay {action}: tick={self.tick}, speed={self.speed}, paused={self.paused}")
+        log_world_event("REPLAY", f"{action}: tick={self.tick}, speed={self.speed:g}, paused={self.paused}")
+        return True
+
+    def status(self):
+        """画面に表示する再生状態"""
+        state = "PAUSED" if self.paused else "PLAYING"
+        return f"Replay {state} tick {self.tick}/{self.last_tick} x{self.speed:g}"
+
+
+def run_replay(world, path, speed=1.0):
+    """軌跡ファイルを再生するループ（worldは初期化済み）。再生したフレーム数を返す"""
+    logger = logging.getLogger('FishSimulator.Replay')
+    reader = TrajectoryReader(path)
+    school = ReplaySchool(reader)
+    player = ReplayPlayer(school, speed=speed)
+    world.set_world_size(*school.world_size)
+    logger.info(f"Replay started: {path} ({len(reader)} ticks, seed={reader.seed}, params={reader.params})")
+    log_world_event("REPLAY_START", f"{path}: {len(reader)} ticks")
+
+    frame_count = 0
+    last_time = time.time()
+    try:
+        while True:
+            loop_start_time = time.time()
+            event_result = world.handle_events()
+            if event_result == False:
+                logger.info("Replay terminated by user")
+                break
+            player.handle_event(event_result)
+
+            # シミュレーションはせず、経過時間に応じたティックを表示する
+            player.advance(loop_start_time - last_time)
+            last_time = loop_start_time
+
+            world.draw_background()
+            school.draw_all_fish(world.screen, world.camera)
+            world.draw_info(school)
+            world.draw_vision_areas(school)
+            world.draw_school_center(school)
+            world.draw_replay_status(player.status())
+            world.update_display()
+            PROFILER.add('frame', time.time() - loop_start_time)
+            world.tick()
+            PROFILER.end_frame()
+
+            frame_count += 1
+            if frame_count % 60 == 0:
+                log_performance("Replay loop", time.time() - loop_start_time)
+    finally:
+        reader.close()
+    return frame_count
@@ -2,30 +2,61 @@ import random
 import math
 import logging
 import time
-from fish import Fish
+import numpy as np
+from fish import Fish, reserve_fish_ids
 from constants import *
+from spatial import SpatialHash, OccupancyGrid, NeighborIndex, get_vision_probes
+from school_stats import SchoolStatistics
+from profiler import PROFILER
+import utils
 from utils import log_school_state, log_performance
 
+# 更新方式: sequential はリスト順に1匹ずつ更新（後のメダカは先に動いたメダカの新しい位置を見る）、
+# synchronous は全員がティック開始時の状態を読み、次のティックのバッファに書いてから一斉に入れ替える
+UPDATE_MODES = ('sequential', 'synchronous')
+# 視界検索の索引: spatial_hash はセルごとのメダカの辞書を候補ごとに判定、
+# occupancy は占有されたセルごとの添字リストから候補をまとめてベクトル演算で判定（密集した群れ向け）
+VISION_BACKENDS = {'spatial_hash': SpatialHash, 'occupancy': OccupancyGrid}
+
 class School:
-    def __init__(self, fish_count=DEFAULT_FISH_COUNT):
+    def __init__(self, fish_count=DEFAULT_FISH_COUNT, seed=None, update_mode='sequential', vision_backend='spatial_hash',
+                 world_size=None):
+        if update_mode not in UPDATE_MODES:
+            raise ValueError(f"Unknown update mode: {update_mode}")
+        if vision_backend not in VISION_BACKENDS:
+            raise ValueError(f"Unknown vision backend: {vision_backend}")
         self.fish_list = []
         self.fish_count = fish_count
         self.school_id = id(self)  # 群れのユニークID
+        # 群れごとの乱数生成器（同じシードなら同じ結果を再現できる）
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.update_mode = update_mode
+        self.vision_backend = vision_backend
+        # 世界（トーラス）の大きさ（画面の大きさとは別）
+        self.world_width, self.world_height = world_size or (WORLD_WIDTH, WORLD_HEIGHT)
+        self.renderer = None  # 初回の描画時に作成（pygameを使わない実行では作らない）
+        self.spatial_hash = None  # update_all_fish中のみ有効な視界検索の索引（vision_backendで選ぶ）
+        self.neighbor_index = None  # 近傍検索用のセルリスト（状態が変わるまで使い回す）
+        # 位置・体力・年齢・性別の累積和（メダカの追加・削除・移動ごとに差分更新）
+        self.statistics = SchoolStatistics(self.world_size)
         self.logger = logging.getLogger('FishSimulator.School')
         
-        self.logger.info(f"School {self.school_id} created with {fish_count} fish")
+        self.logger.info(f"School {self.school_id} created with {fish_count} fish (seed={seed})")
         self.initialize_fish()
     
     def initialize_fish(self):
         """メダカを初期化"""
         start_time = time.time()
         
-        for i in range(self.fish_count):
-            x = random.randint(0, SCREEN_WIDTH - 1)
-            y = random.randint(0, SCREEN_HEIGHT - 1)
-            fish = Fish(x, y)
+        xs = self.rng.integers(0, self.world_width, size=self.fish_count).tolist()
+        ys = self.rng.integers(0, self.world_height, size=self.fish_count).tolist()
+        for x, y in zip(xs, ys):
+            fish = Fish(x, y, rng=self.rng)
             self.fish_list.append(fish)
-            self.logger.debug(f"Fish {fish.id} added at position ({x}, {y})")
+            self.statistics.add(fish)
+            if utils.TRACE_ENABLED:
+                self.logger.debug(f"Fish {fish.id} added at position ({x}, {y})")
         
         duration = time.time() - start_time
         log_performance("School initialization", duration)
@@ -33,132 +64,227 @@ class School:
     
     def get_nearby_fish(self, fish, max_distance=50):
         """指定されたメダカの近くにいるメダカを取得"""
-        start_time = time.time()
+        if utils.TRACE_ENABLED:
+            start_time = time.time()
         nearby_fish = []
         
-        for other_fish in self.fish_list:
-            if other_fish != fish:
-                # 距離を計算（トーラス状の世界を考慮）
-                dx = abs(other_fish.x - fish.x)
-                dy = abs(other_fish.y - fish.y)
-                
-                # トーラス状の世界での最短距離を計算
-                dx = min(dx, SCREEN_WIDTH - dx)
-                dy = min(dy, SCREEN_HEIGHT - dy)
-                
-                distance = math.sqrt(dx**2 + dy**2)
-                
-                if distance <= max_distance:
-                    nearby_fish.append(other_fish)
+        # セルリストが作成済みなら、近くのセルだけを調べる
+        index = self.neighbor_index.fish_index.get(id(fish)) if self.neighbor_index is not None else None
+        if index is not None:
+            neighbors = self.neighbor_index.query_radius(max_distance, [index])[0]
+            nearby_fish = [self.fish_list[j] for j in neighbors.tolist()]
+        else:
+            for other_fish in self.fish_list:
+                if other_fish != fish:
+                    # 距離を計算（トーラス状の世界を考慮）
+                    dx = abs(other_fish.x - fish.x)
+                    dy = abs(other_fish.y - fish.y)
+                    
+                    # トーラス状の世界での最短距離を計算
+                    dx = min(dx, self.world_width - dx)
+                    dy = min(dy, self.world_height - dy)
+                    
+                    distance = math.sqrt(dx**2 + dy**2)
+                    
+                    if distance <= max_distance:
+                        nearby_fish.append(other_fish)
+        
+        if utils.TRACE_ENABLED:
+            duration = time.time() - start_time
+            log_performance(f"Get nearby fish for {fish.id}", duration)
+            self.logger.debug(f"Fish {fish.id} has {len(nearby_fish)} nearby fish within {max_distance} distance")
         
-        duration = time.time() - start_time
-        log_performance(f"Get nearby fish for {fish.id}", duration)
-        self.logger.debug(f"Fish {fish.id} has {len(nearby_fish)} nearby fish within {max_distance} distance")
+        return nearby_fish
+    
+    @property
+    def world_size(self):
+        """世界の(幅, 高さ)"""
+        return (self.world_width, self.world_height)
+    
+    def get_neighbor_index(self):
+        """近傍検索用のセルリストを取得（状態が変わるまでは同じものを使い回す）"""
+        if self.neighbor_index is None:
+            self.neighbor_index = NeighborIndex.from_fish(self.fish_list, width=self.world_width, height=self.world_height)
+        return self.neighbor_index
+    
+    def _draw_index(self):
+        """描画の絞り込みに使える作り済みのセルリストと、実際の位置とのずれの上限（作っていなければNone）"""
+        return (self.neighbor_index, 0.0) if self.neighbor_index is not None else None
+    
+    def _draw_state(self, candidates=None):
+        """描画に使う状態の配列と、その中で調べるメダカの添字（candidatesを渡すと、その添字のメダカだけをリストから集める）"""
+        if candidates is None:
+            return self.get_state_arrays(), None
+        fish_list = self.fish_list
+        rows = [(fish.x, fish.y, fish.dx, fish.dy, fish.gender_code)
+                for fish in map(fish_list.__getitem__, candidates.tolist())]
+        data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        return {'x': data[:, 0], 'y': data[:, 1], 'dx': data[:, 2], 'dy': data[:, 3],
+                'gender': data[:, 4].astype(np.int8)}, None
+    
+    def get_all_nearby_fish(self, max_distance=50):
+        """全てのメダカについて、近くにいるメダカのリストをまとめて取得（get_all_fishと同じ順）"""
+        start_time = time.time()
+        fish_list = self.get_all_fish()
+        neighbors = self.get_neighbor_index().query_radius(max_distance)
+        nearby_fish = [[fish_list[j] for j in indices] for indices in map(np.ndarray.tolist, neighbors)]
         
+        duration = time.time() - start_time
+        if utils.TRACE_ENABLED:
+            log_performance(f"Get nearby fish for {len(fish_list)} fish", duration)
         return nearby_fish
     
+    def get_all_nearest_fish(self, max_distance=None):
+        """全てのメダカについて、最も近いメダカ（いなければNone）をまとめて取得（get_all_fishと同じ順）"""
+        start_time = time.time()
+        fish_list = self.get_all_fish()
+        nearest, _ = self.get_neighbor_index().query_nearest(1, max_distance)
+        nearest_fish = [fish_list[j] if j >= 0 else None for j in nearest[:, 0].tolist()]
+        
+        duration = time.time() - start_time
+        if utils.TRACE_ENABLED:
+            log_performance(f"Get nearest fish for {len(fish_list)} fish", duration)
+        return nearest_fish
+    
     def get_fish_in_vision(self, fish, vision_range=None):
         """メダカの視界範囲内のメダカを取得（前方のマスをざっくり認識）"""
-        start_time = time.time()
-        fish_in_vision = []
+        if utils.TRACE_ENABLED:
+            start_time = time.time()
         
         # 視界範囲を取得（デフォルトはVISION_RANGE）
         if vision_range is None:
             vision_range = VISION_RANGE
         
-        # 魚の現在位置と方向を取得
-        fish_x, fish_y = fish.get_position()
-        dx, dy = fish.get_direction()
-        
-        # 方向を8方向に正規化（上下左右斜め）
-        if abs(dx) > abs(dy):
-            direction_x = 1 if dx > 0 else -1
-            direction_y = 0
-        elif abs(dy) > abs(dx):
-            direction_x = 0
-            direction_y = 1 if dy > 0 else -1
+        if self.spatial_hash is not None:
+            fish_in_vision = self.spatial_hash.query_vision(fish, vision_range)
         else:
-            direction_x = 1 if dx > 0 else -1
-            direction_y = 1 if dy > 0 else -1
-        
-        # 前方のマスをチェック（vision_range分）
-        for distance in range(1, vision_range + 1):
-            # 前方
-            check_x = fish_x + direction_x * distance
-            check_y = fish_y + direction_y * distance
-            
-            # 斜め前（左）
-            if direction_x != 0 and direction_y != 0:
-                check_left_x = fish_x + direction_x * distance
-                check_left_y = fish_y
-                check_right_x = fish_x
-                check_right_y = fish_y + direction_y * distance
-            elif direction_x != 0:  # 左右移動の場合
-                check_left_x = fish_x + direction_x * distance
-                check_left_y = fish_y - distance
-                check_right_x = fish_x + direction_x * distance
-                check_right_y = fish_y + distance
-            else:  # 上下移動の場合
-                check_left_x = fish_x - distance
-                check_left_y = fish_y + direction_y * distance
-                check_right_x = fish_x + distance
-                check_right_y = fish_y + direction_y * distance
-            
-            # 各チェック位置で他の魚を探す
-            check_positions = [
-                (check_x, check_y),
-                (check_left_x, check_left_y),
-                (check_right_x, check_right_y)
-            ]
-            
-            for other_fish in self.fish_list:
-                if other_fish != fish:
-                    other_x, other_y = other_fish.get_position()
-                    
-                    # チェック位置の近くにいるかを確認（グリッドサイズ考慮）
-                    for check_pos_x, check_pos_y in check_positions:
-                        if abs(other_x - check_pos_x) <= 10 and abs(other_y - check_pos_y) <= 10:
-                            if other_fish not in fish_in_vision:
-                                fish_in_vision.append(other_fish)
+            fish_in_vision = self._scan_fish_in_vision(fish, vision_range)
         
-        duration = time.time() - start_time
-        log_performance(f"Get fish in vision for {fish.id}", duration)
-        self.logger.debug(f"Fish {fish.id} sees {len(fish_in_vision)} fish in vision area")
+        if utils.TRACE_ENABLED:
+            duration = time.time() - start_time
+            log_performance(f"Get fish in vision for {fish.id}", duration)
+            self.logger.debug(f"Fish {fish.id} sees {len(fish_in_vision)} fish in vision area")
         
         return fish_in_vision
     
+    def _scan_fish_in_vision(self, fish, vision_range):
+        """全てのメダカを走査して視界範囲内のメダカを取得（空間ハッシュ未構築時の参照実装）"""
+        others = [other_fish for other_fish in self.fish_list if other_fish != fish]
+        if not others:
+            return []
+        
+        # 前方・斜め前（左右）のチェック位置（vision_range分）は、向きの区分ごとの表から引く
+        fish_x, fish_y = fish.get_position()
+        probes = get_vision_probes(fish.dx, fish.dy, vision_range)
+        check_x = fish_x + probes[:, :, 0]
+        check_y = fish_y + probes[:, :, 1]
+        
+        # チェック位置の近くにいるかを確認（グリッドサイズ考慮）し、最初に見つかった距離の順に並べる
+        positions = np.array([other_fish.get_position() for other_fish in others], dtype=np.float64)
+        near = ((np.abs(positions[:, 0, None, None] - check_x) <= VISION_TOLERANCE) &
+                (np.abs(positions[:, 1, None, None] - check_y) <= VISION_TOLERANCE)).any(axis=2)
+        seen = np.flatnonzero(near.any(axis=1))
+        first = near[seen].argmax(axis=1)
+        return [others[index] for index in seen[np.lexsort((seen, first))].tolist()]
+    
     def update_all_fish(self, params=None):
         """全てのメダカを更新"""
         start_time = time.time()
-        
-        for fish in self.fish_list:
-            # 視界範囲内のメダカを取得
-            vision_range = params.get('vision_range', VISION_RANGE) if params else VISION_RANGE
-            nearby_fish = self.get_fish_in_vision(fish, vision_range)
-            
-            # メダカを更新
-            fish.update(nearby_fish, params)
+        # プロファイラが有効なときだけ、視界内の検索にかかった時間を分けて計る
+        profiling = PROFILER.enabled
+        self._neighbor_time = 0.0
+        
+        # ランダム成分はティックごとに群れ全体分をArraySchoolと同じ形(2, メダカ数)でまとめて引き、
+        # IDの小さい順に割り当てる（リストの順序に依存しない）
+        drawn = self.rng.uniform(-1, 1, size=(2, len(self.fish_list)))
+        ranks = np.argsort(np.argsort([fish.id for fish in self.fish_list], kind='stable'))
+        noise = drawn[:, ranks].T.tolist()
+        
+        # 視界検索の索引をティックごとに1回構築する
+        self.spatial_hash = VISION_BACKENDS[self.vision_backend](self.world_width, self.world_height)
+        self.spatial_hash.rebuild(self.fish_list)
+        if profiling:
+            self._neighbor_time = time.time() - start_time
+        vision_range = params.get('vision_range', VISION_RANGE) if params else VISION_RANGE
+        try:
+            if self.update_mode == 'synchronous':
+                self._update_synchronous(params, noise, vision_range, profiling)
+            else:
+                for fish, fish_noise in zip(self.fish_list, noise):
+                    # 視界範囲内のメダカを取得
+                    if profiling:
+                        search_start = time.perf_counter()
+                        nearby_fish = self.get_fish_in_vision(fish, vision_range)
+                        self._neighbor_time += time.perf_counter() - search_start
+                    else:
+                        nearby_fish = self.get_fish_in_vision(fish, vision_range)
+                    
+                    # メダカを更新（移動したメダカだけ空間ハッシュと統計量を差分更新する）
+                    old_state = (fish.x, fish.y, fish.energy, fish.age)
+                    fish.update(nearby_fish, params, fish_noise, world_size=self.world_size)
+                    self.spatial_hash.move(fish)
+                    self.statistics.update(old_state, fish)
+        finally:
+            self.spatial_hash = None
+            self.neighbor_index = None
         
         duration = time.time() - start_time
         log_performance("Update all fish", duration)
+        PROFILER.add('neighbors', self._neighbor_time)
+        PROFILER.add('update', duration - self._neighbor_time)
         
-        # 群れの状態をログに記録
+        # 群れの状態をログに記録（密度はこのティックで1回だけ計算され、以降はキャッシュを使う）
+        stats_start = time.time()
         density = self.get_school_density()
         center = self.get_school_center()
         log_school_state(self.school_id, self.fish_count, density, center)
+        PROFILER.add('stats', time.time() - stats_start)
         
-        self.logger.debug(f"Updated all {self.fish_count} fish in {duration:.4f}s")
+        if utils.TRACE_ENABLED:
+            self.logger.debug(f"Updated all {self.fish_count} fish in {duration:.4f}s")
+    
+    def _update_synchronous(self, params, noise, vision_range, profiling=False):
+        """ダブルバッファで全てのメダカを更新（結果はリストの順序に依存しない）"""
+        # ティックtの状態だけを読んで、ティックt+1の状態をバッファに書く
+        next_states = []
+        world_size = self.world_size
+        for fish, fish_noise in zip(self.fish_list, noise):
+            if profiling:
+                search_start = time.perf_counter()
+                nearby_fish = self.get_fish_in_vision(fish, vision_range)
+                self._neighbor_time += time.perf_counter() - search_start
+            else:
+                nearby_fish = self.get_fish_in_vision(fish, vision_range)
+            next_states.append(fish.compute_next_state(nearby_fish, params, fish_noise, world_size=world_size))
+        
+        # バッファを入れ替える
+        for fish, state in zip(self.fish_list, next_states):
+            old_state = (fish.x, fish.y, fish.energy, fish.age)
+            fish.set_state(state)
+            self.statistics.update(old_state, fish)
+    
+    def steer(self, force_x, force_y):
+        """外からの力（get_all_fishと同じ順の配列）を全てのメダカの向きに加えて正規化する（位置は変えない）"""
+        for fish, fx, fy in zip(self.fish_list, np.asarray(force_x).tolist(), np.asarray(force_y).tolist()):
+            if fx == 0 and fy == 0:
+                continue
+            dx, dy = fish.dx + fx, fish.dy + fy
+            length = math.sqrt(dx**2 + dy**2)
+            if length > 0:
+                fish.dx, fish.dy = dx / length, dy / length
     
     def add_fish(self, x=None, y=None):
         """新しいメダカを追加"""
         if x is None:
-            x = random.randint(0, SCREEN_WIDTH - 1)
+            x = int(self.rng.integers(0, self.world_width))
         if y is None:
-            y = random.randint(0, SCREEN_HEIGHT - 1)
+            y = int(self.rng.integers(0, self.world_height))
         
-        fish = Fish(x, y)
+        fish = Fish(x, y, rng=self.rng)
         self.fish_list.append(fish)
         self.fish_count += 1
+        self.statistics.add(fish)
+        self.neighbor_index = None
         
         self.logger.info(f"Added fish {fish.id} at position ({x}, {y}). Total fish: {self.fish_count}")
     
@@ -167,6 +293,8 @@ class School:
         if fish in self.fish_list:
             self.fish_list.remove(fish)
             self.fish_count -= 1
+            self.statistics.remove(fish)
+            self.neighbor_index = None
             self.logger.info(f"Removed fish {fish.id}. Total fish: {self.fish_count}")
         else:
             self.logger.warning(f"Attempted to remove fish {fish.id} that is not in the school")
@@ -176,16 +304,24 @@ class School:
         import time
         start_time = time.time()
         
-        for fish in self.fish_list:
+        self.neighbor_index = None
+        count = len(self.fish_list)
+        xs = self.rng.integers(0, self.world_width, size=count).tolist()
+        ys = self.rng.integers(0, self.world_height, size=count).tolist()
+        directions = self.rng.uniform(-1, 1, size=(count, 2)).tolist()
+        for fish, x, y, (dx, dy) in zip(self.fish_list, xs, ys, directions):
             # ランダムな位置に再配置
-            fish.x = random.randint(0, SCREEN_WIDTH - 1)
-            fish.y = random.randint(0, SCREEN_HEIGHT - 1)
+            old_state = (fish.x, fish.y, fish.energy, fish.age)
+            fish.x = x
+            fish.y = y
             # 方向もリセット
-            fish.dx = random.uniform(-1, 1)
-            fish.dy = random.uniform(-1, 1)
+            fish.dx = dx
+            fish.dy = dy
             fish._normalize_direction()
+            self.statistics.update(old_state, fish)
             
-            self.logger.debug(f"Reset fish {fish.id} to position ({fish.x}, {fish.y}) with direction ({fish.dx:.2f}, {fish.dy:.2f})")
+            if utils.TRACE_ENABLED:
+                self.logger.debug(f"Reset fish {fish.id} to position ({fish.x}, {fish.y}) with direction ({fish.dx:.2f}, {fish.dy:.2f})")
         
         duration = time.time() - start_time
         log_performance("Fish position reset", duration)
@@ -208,78 +344,85 @@ class School:
         """全てのメダカの方向を取得"""
         return [fish.get_direction() for fish in self.fish_list]
     
-    def draw_all_fish(self, screen):
-        """全てのメダカを描画"""
+    def get_state_arrays(self):
+        """全てのメダカの状態をNumPy配列の辞書で取得（genderは0: male, 1: female）"""
+        rows = [(fish.x, fish.y, fish.dx, fish.dy, fish.energy, fish.age, fish.gender_code, fish.id)
+                for fish in self.fish_list]
+        data = np.array(rows, dtype=np.float64).reshape(-1, 8)
+        return {
+            'x': data[:, 0],
+            'y': data[:, 1],
+            'dx': data[:, 2],
+            'dy': data[:, 3],
+            'energy': data[:, 4],
+            'age': data[:, 5].astype(np.int64),
+            'gender': data[:, 6].astype(np.int8),
+            'id': data[:, 7].astype(np.int64)
+        }
+    
+    def load_state(self, state):
+        """get_state_arraysと同じ形式の状態で全てのメダカを置き換える（メダカ単位のログは出さない）"""
+        columns = [np.asarray(state[name]).tolist() for name in ('x', 'y', 'dx', 'dy', 'energy', 'age', 'gender', 'id')]
+        self.fish_list = [Fish.from_state(*values) for values in zip(*columns)]
+        self.fish_count = len(self.fish_list)
+        if self.fish_count:
+            reserve_fish_ids(max(columns[7]) + 1)
+        self.invalidate_statistics()
+        self.logger.info(f"School {self.school_id} loaded {self.fish_count} fish")
+    
+    def draw_all_fish(self, screen, camera=None):
+        """全てのメダカを描画（向きごとのスプライトをまとめて転送。cameraを渡すと画面に映るメダカだけを画面座標で描き、
+        拡大率と混み具合に応じて点やヒートマップに切り替える）"""
+        from renderer import FishRenderer, choose_lod
         start_time = time.time()
         
-        for fish in self.fish_list:
-            fish.draw(screen)
+        if self.renderer is None:
+            self.renderer = FishRenderer()
+        if camera is None:
+            state = self.get_state_arrays()
+            self.renderer.draw(screen, state['x'], state['y'], state['dx'], state['dy'], state['gender'])
+        else:
+            # 世界の一部だけを映しているときは、作り済みのセルリストから画面付近のメダカだけを候補にし、
+            # 候補の状態だけを集める（全員の状態を作らない）
+            candidates = None
+            cached = self._draw_index() if camera.view_fraction() < CULL_INDEX_FRACTION else None
+            if cached is not None:
+                index, drift = cached
+                candidates = index.query_rect(*camera.visible_rect(FISH_SIZE * 2 + drift * camera.zoom))
+            state, candidates = self._draw_state(candidates)
+            visible, screen_x, screen_y = camera.project(state['x'], state['y'], candidates=candidates)
+            # 向きは三角形で描くときだけ、性別はヒートマップ以外で使うため、必要なものだけを取り出す
+            lod = choose_lod(len(visible), camera.zoom, screen.get_width() * screen.get_height())
+            everyone = len(visible) == len(state['x'])
+            dx = dy = gender = None
+            if lod == 'sprites':
+                dx, dy = (state['dx'], state['dy']) if everyone else (state['dx'][visible], state['dy'][visible])
+            if lod != 'heatmap':
+                gender = np.asarray(state['gender']) if everyone else np.asarray(state['gender'])[visible]
+            self.renderer.draw(screen, screen_x, screen_y, dx, dy, gender, zoom=camera.zoom, lod=lod)
         
         duration = time.time() - start_time
         log_performance("Draw all fish", duration)
+        PROFILER.add('fish_draw', duration)
     
     def get_school_center(self):
-        """群れの中心を計算"""
-        if not self.fish_list:
-            return (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-        
-        avg_x = sum(fish.x for fish in self.fish_list) / len(self.fish_list)
-        avg_y = sum(fish.y for fish in self.fish_list) / len(self.fish_list)
-        
-        return (avg_x, avg_y)
+        """群れの中心を取得（累積和から計算するため走査しない）"""
+        return self.statistics.center()
     
     def get_school_density(self):
-        """群れの密度を計算"""
-        if not self.fish_list:
-            return 0
-        
-        # 群れの中心を計算
-        center_x, center_y = self.get_school_center()
-        
-        # 中心からの平均距離を計算
-        total_distance = 0
-        for fish in self.fish_list:
-            dx = fish.x - center_x
-            dy = fish.y - center_y
-            distance = math.sqrt(dx**2 + dy**2)
-            total_distance += distance
-        
-        avg_distance = total_distance / len(self.fish_list)
-        
+        """群れの密度を取得（状態が変わった後の最初の呼び出しでのみ計算し、以降はキャッシュを返す）"""
         # 密度は距離の逆数（距離が小さいほど密度が高い）
-        density = 1.0 / (avg_distance + 1)  # +1でゼロ除算を防ぐ
-        
-        return density
+        return self.statistics.compute_density(self.fish_list)
+    
+    def invalidate_statistics(self):
+        """メダカの属性を直接書き換えた後に、統計量を全体から計算し直す（近傍検索用のセルリストも作り直す）"""
+        self.statistics.rebuild(self.fish_list)
+        self.neighbor_index = None
     
     def get_school_statistics(self):
         """群れの統計情報を取得"""
-        if not self.fish_list:
-            return {
-                'count': 0,
-                'density': 0,
-                'center': (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2),
-                'avg_energy': 0,
-                'avg_age': 0,
-                'gender_ratio': {'male': 0, 'female': 0}
-            }
-        
-        # 基本統計
-        total_energy = sum(fish.energy for fish in self.fish_list)
-        total_age = sum(fish.age for fish in self.fish_list)
-        male_count = sum(1 for fish in self.fish_list if fish.gender == 'male')
-        female_count = len(self.fish_list) - male_count
-        
-        stats = {
-            'count': self.fish_count,
-            'density': self.get_school_density(),
-            'center': self.get_school_center(),
-            'avg_energy': total_energy / self.fish_count,
-            'avg_age': total_age / self.fish_count,
-            'gender_ratio': {
-                'male': male_count / self.fish_count,
-                'female': female_count / self.fish_count
-            }
-        }
+        stats = self.statistics.as_dict(self.get_school_density())
         
-        self.logger.debug(f"School statistics: {stats}")
+        if utils.TRACE_ENABLED:
+            self.logger.debug(f"School statistics: {stats}")
         return stats
@@ -0,0 +1,97 @@
+import numpy as np
+from constants import *
+
+
+class SchoolStatistics:
+    """群れの統計量を累積和で保持し、メダカの追加・削除・移動ごとに差分更新する"""
+
+    def __init__(self, world_size=None):
+        # 空の群れの中心に使う世界（トーラス）の大きさ
+        self.world_width, self.world_height = world_size or (WORLD_WIDTH, WORLD_HEIGHT)
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_energy = 0.0
+        self.sum_age = 0
+        self.male_count = 0
+        # ティックごとに1回だけ計算する派生値（Noneは未計算）
+        self.density = None
+
+    def rebuild(self, fish_list):
+        """全てのメダカから累積和を計算し直す（浮動小数点誤差の蓄積もここで解消される）"""
+        self.__init__((self.world_width, self.world_height))
+        for fish in fish_list:
+            self.add(fish)
+
+    def add(self, fish):
+        """メダカの追加を反映"""
+        self.count += 1
+        self.sum_x += fish.x
+        self.sum_y += fish.y
+        self.sum_energy += fish.energy
+        self.sum_age += fish.age
+        if fish.gender_code == 0:
+            self.male_count += 1
+        self.density = None
+
+    def remove(self, fish):
+        """メダカの削除を反映"""
+        self.count -= 1
+        self.sum_x -= fish.x
+        self.sum_y -= fish.y
+        self.sum_energy -= fish.energy
+        self.sum_age -= fish.age
+        if fish.gender_code == 0:
+            self.male_count -= 1
+        self.density = None
+
+    def update(self, old_state, fish):
+        """メダカの状態変化を反映（old_stateは変化前の(x, y, energy, age)）"""
+        old_x, old_y, old_energy, old_age = old_state
+        self.sum_x += fish.x - old_x
+        self.sum_y += fish.y - old_y
+        self.sum_energy += fish.energy - old_energy
+        self.sum_age += fish.age - old_age
+        self.density = None
+
+    def center(self):
+        """群れの中心（空の群れでは世界の中央）"""
+        if self.count == 0:
+            return (self.world_width // 2, self.world_height // 2)
+        return (self.sum_x / self.count, self.sum_y / self.count)
+
+    def compute_density(self, fish_list):
+        """中心からの平均距離の逆数を計算してキャッシュする（次の変化までは再計算しない。群れ全体を1つの値にまとめた
+        目安で、トーラス上の複数の群れの様子はanalytics.pyの秩序変数で見る）"""
+        if self.density is None:
+            if self.count == 0:
+                self.density = 0
+            else:
+                center_x, center_y = self.center()
+                xs = np.fromiter((fish.x for fish in fish_list), dtype=np.float64)
+                ys = np.fromiter((fish.y for fish in fish_list), dtype=np.float64)
+                self.density = 1.0 / (float(np.hypot(xs - center_x, ys - center_y).sum()) / self.count + 1)
+        return self.density
+
+    def as_dict(self, density):
+        """get_school_statistics形式の辞書"""
+        if self.count == 0:
+            return {
+                'count': 0,
+                'density': 0,
+                'center': self.center(),
+                'avg_energy': 0,
+                'avg_age': 0,
+                'gender_ratio': {'male': 0, 'female': 0}
+            }
+        return {
+            'count': self.count,
+            'density': density,
+            'center': self.center(),
+            'avg_energy': self.sum_energy / self.count,
+            'avg_age': self.sum_age / self.count,
+            'gender_ratio': {
+                'male': self.male_count / self.count,
+                'female': (self.count - self.male_count) / self.count
+            }
+        }
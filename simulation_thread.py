@@ -0,0 +1,274 @@
+import time
+import queue
+import logging
+import threading
+import numpy as np
+from snapshot import SnapshotSchool
+from constants import *
+from profiler import PROFILER
+from utils import log_world_event, log_performance
+
+# 処理が遅れたときに追いつこうとする最大ティック数（これ以上遅れたら予定を捨てる）
+MAX_CATCH_UP_TICKS = 5
+# 体力・年齢などの統計量をスナップショットに添える間隔（秒）
+STATISTICS_INTERVAL = 1.0
+
+
+class Snapshot(SnapshotSchool):
+    """シミュレーションスレッドが1ティックごとに公開する群れの状態（公開後は書き換えない）"""
+
+    def __init__(self, state, gender, tick, published, generation, statistics=None, world_size=None):
+        super().__init__(state, gender, tick=tick, statistics=statistics, world_size=world_size)
+        self.published = published    # 公開した時刻（time.perf_counter）
+        self.generation = generation  # メダカの追加・削除・配置リセットのたびに増える番号
+
+
+def interpolate_snapshots(previous, latest, alpha):
+    """2つのスナップショットの間の位置を求める（世界の端の折り返しを考慮し、メダカの並びが違えばlatestを返す）"""
+    if (previous is None or alpha >= 1 or previous.generation != latest.generation
+            or previous.fish_count != latest.fish_count):
+        return latest
+    alpha = max(0.0, alpha)
+    before = previous.get_state_arrays()
+    after = latest.get_state_arrays()
+    state = np.empty((latest.fish_count, 4))
+    drift = 0.0  # 補間した位置とlatestの位置の、軸ごとのずれの最大
+    for column, (name, size) in enumerate((('x', latest.world_width), ('y', latest.world_height))):
+        delta = after[name] - before[name]
+        delta -= size * np.round(delta / size)  # 端をまたいだ移動は短い方向に
+        state[:, column] = (before[name] + delta * alpha) % size
+        if len(delta):
+            drift = max(drift, float(np.abs(delta).max()) * (1 - alpha))
+    state[:, 2] = after['dx']
+    state[:, 3] = after['dy']
+    snapshot = SnapshotSchool(state, after['gender'], tick=latest.tick, statistics=latest.statistics,
+                              world_size=latest.world_size)
+    # 描画の絞り込みにはlatestのセルリストを、ずれの分だけ広げて使う
+    cached = latest._draw_index()
+    if cached is not None:
+        snapshot._derived['draw_index'] = (cached[0], cached[1] + drift)
+    return snapshot
+
+
+class SimulationThread:
+    """群れの更新を固定ティックレートで別スレッドに任せ、描画側には最新のスナップショットを渡す
+
+    スナップショットは毎ティック新しく確保して公開後は書き換えず、(前回, 最新)の組を1回の代入で差し替えるため、
+    描画スレッドはロックを取らずに読める。メダカの追加などの操作はキューで渡し、ティックの合間に反映する。
+    """
+
+    def __init__(self, school, params, tick_rate=FPS, recorder=None, max_ticks=None):
+        self.school = school
+        self.params = dict(params)
+        self.tick_rate = tick_rate
+        self.interval = 1.0 / tick_rate
+        self.recorder = recorder
+        self.max_ticks = max_ticks
+        self.logger = logging.getLogger('FishSimulator.SimulationThread')
+
+        self.ticks = 0
+        self.dropped_ticks = 0
+        self.ticks_per_sec = 0.0
+        self.error = None
+        self.generation = 0
+        self._commands = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._statistics = None
+        self._statistics_time = None
+        self._snapshots = (None, self._make_snapshot())
+
+    def _make_snapshot(self):
+        """群れの現在の状態をコピーしてスナップショットを作る"""
+        arrays = self.school.get_state_arrays()
+        state = np.column_stack((arrays['x'], arrays['y'], arrays['dx'], arrays['dy'])).astype(np.float64)
+        now = time.perf_counter()
+        if self._statistics_time is None or now - self._statistics_time >= STATISTICS_INTERVAL:
+            self._statistics = self.school.get_school_statistics()
+            self._statistics_time = now
+        snapshot = Snapshot(state, np.array(arrays['gender'], dtype=np.int8), self.ticks, now,
+                            self.generation, self._statistics, self.school.world_size)
+        # 描画側が画面付近のメダカだけを引けるように、セルリストはシミュレーションスレッドで作っておく
+        snapshot.get_neighbor_index()
+        return snapshot
+
+    def start(self):
+        """シミュレーションスレッドを開始"""
+        self._thread = threading.Thread(target=self._run, name='SimulationThread', daemon=True)
+        self._thread.start()
+        self.logger.info(f"Simulation thread started at {self.tick_rate} ticks/s")
+        log_world_event("SIMULATION_THREAD_START", f"Tick rate: {self.tick_rate}")
+        return self
+
+    def stop(self, timeout=None):
+        """シミュレーションスレッドを止めて終了を待つ"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.logger.info(f"Simulation thread stopped after {self.ticks} ticks ({self.dropped_ticks} dropped)")
+        log_world_event("SIMULATION_THREAD_STOP", f"Ticks: {self.ticks}, Dropped: {self.dropped_ticks}")
+
+    def join(self, timeout=None):
+        """止めずにスレッドの終了（max_ticksに達するまで）を待つ"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_parameters(self, params):
+        """次のティックから使うパラメータを設定（辞書ごと差し替える）"""
+        self.params = dict(params)
+
+    def send(self, command):
+        """World.handle_eventsの操作（add_fish・reset_positions・save_checkpoint・replace_school）を次のティックの前に反映する"""
+        self._commands.put(command)
+
+    def latest(self):
+        """最新のスナップショット"""
+        return self._snapshots[1]
+
+    def snapshot_at(self, now=None, interpolate=True):
+        """描画するスナップショット（interpolateなら前回と最新の間を経過時間で補間し、1ティック遅れで滑らかに見せる）"""
+        previous, latest = self._snapshots
+        if not interpolate:
+            return latest
+        now = time.perf_counter() if now is None else now
+        return interpolate_snapshots(previous, latest, (now - latest.published) / self.interval)
+
+    def _apply_commands(self):
+        """キューに溜まった操作を反映"""
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            if command[0] == "add_fish":
+                _, x, y = command
+                self.school.add_fish(x, y)
+                self.logger.info(f"Fish added at position ({x}, {y})")
+            elif command[0] == "reset_positions":
+                self.school.reset_fish_positions()
+                self.logger.info(f"Fish positions reset for {self.school.get_fish_count()} fish")
+            elif command[0] == "save_checkpoint":
+                # ティックの合間に保存するため、保存中に状態が変わらない
+                from checkpoint import save_checkpoint
+                _, path, params = command
+                try:
+                    save_checkpoint(path, self.school, params, {'tick': self.ticks})
+                except OSError as e:
+                    self.logger.warning(f"Failed to save checkpoint {path}: {e}")
+                continue
+            elif command[0] == "replace_school":
+                self.school = command[1]
+                self.logger.info(f"School replaced with {self.school.get_fish_count()} fish")
+            else:
+                self.logger.warning(f"Unknown simulation command: {command}")
+                continue
+            self.generation += 1
+
+    def step(self):
+        """1ティック進めてスナップショットを公開"""
+        start_time = time.perf_counter()
+        self._apply_commands()
+        self.school.update_all_fish(self.params)
+        if self.recorder is not None:
+            self.recorder.append(self.school)
+        self.ticks += 1
+        snapshot = self._make_snapshot()
+        self._snapshots = (self._snapshots[1], snapshot)
+        log_performance("Simulation tick", time.perf_counter() - start_time)
+        return snapshot
+
+    def _run(self):
+        """固定ティックレートのループ（遅れたらMAX_CATCH_UP_TICKSまで待たずに続けて進め、それ以上は捨てる）"""
+        next_time = time.perf_counter()
+        rate_start, rate_ticks = next_time, 0
+        try:
+            while not self._stop.is_set():
+                if self.max_ticks is not None and self.ticks >= self.max_ticks:
+                    break
+                self.step()
+                rate_ticks += 1
+
+                now = time.perf_counter()
+                if now - rate_start >= 1.0:
+                    self.ticks_per_sec = rate_ticks / (now - rate_start)
+                    rate_start, rate_ticks = now, 0
+
+                next_time += self.interval
+                if now < next_time:
+                    self._stop.wait(next_time - now)
+                elif now - next_time > self.interval * MAX_CATCH_UP_TICKS:
+                    behind = int((now - next_time) / self.interval)
+                    self.dropped_ticks += behind
+                    self.logger.debug(f"Simulation is {behind} ticks behind; skipping ahead")
+                    next_time = now
+        except Exception as e:
+            self.error = e
+            self.logger.error(f"Simulation thread failed: {e}", exc_info=True)
+
+    def status(self):
+        """画面に表示するシミュレーションの状態"""
+        return (f"Simulation {self.ticks_per_sec:.1f}/{self.tick_rate:g} ticks/s, "
+                f"tick {self.ticks}, dropped {self.dropped_ticks}")
+
+
+def run_threaded(world, school, params, tick_rate=FPS, interpolate=True, recorder=None, checkpoint_path=None):
+    """シミュレーションを別スレッドで回し、描画ループは最新のスナップショットを描く（worldは初期化済み）"""
+    logger = logging.getLogger('FishSimulator.SimulationThread')
+    simulation = SimulationThread(school, params, tick_rate, recorder).start()
+
+    frame_count = 0
+    start_time = time.time()
+    last_stats_time = start_time
+    try:
+        while True:
+            loop_start_time = time.time()
+            event_result = world.handle_events()
+            if event_result == False:
+                logger.info("Game loop terminated by user")
+                break
+            if isinstance(event_result, tuple) and event_result[0] in ("add_fish", "reset_positions"):
+                simulation.send(event_result)
+            elif isinstance(event_result, tuple) and event_result[0] == "save_checkpoint" and checkpoint_path:
+                simulation.send(("save_checkpoint", checkpoint_path, world.get_simulation_parameters()))
+            elif isinstance(event_result, tuple) and event_result[0] == "load_checkpoint" and checkpoint_path:
+                # 読み込みは描画側で行い、できた群れをティックの合間に差し替える
+                from checkpoint import load_checkpoint
+                try:
+                    loaded, loaded_params, _ = load_checkpoint(checkpoint_path)
+                    world.set_parameters(loaded_params)
+                    world.set_world_size(*loaded.world_size)
+                    simulation.send(("replace_school", loaded))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Failed to load checkpoint {checkpoint_path}: {e}")
+            simulation.set_parameters(world.get_simulation_parameters())
+            if simulation.error is not None:
+                raise simulation.error
+
+            snapshot = simulation.snapshot_at(interpolate=interpolate)
+            world.draw_background()
+            snapshot.draw_all_fish(world.screen, world.camera)
+            world.draw_info(snapshot)
+            world.draw_vision_areas(snapshot)
+            world.draw_school_center(snapshot)
+            world.draw_status_lines([simulation.status()])
+            world.update_display()
+            PROFILER.add('frame', time.time() - loop_start_time)
+            world.tick()
+            PROFILER.end_frame()
+
+            frame_count += 1
+            current_time = time.time()
+            if current_time - last_stats_time >= 1.0:
+                print(f"FPS: {world.get_fps():.1f}, ティック/秒: {simulation.ticks_per_sec:.1f}, "
+                      f"経過時間: {current_time - start_time:.1f}秒, メダカ数: {snapshot.get_fish_count()}")
+                logger.info(f"Frame {frame_count}: FPS={world.get_fps():.1f}, {simulation.status()}, "
+                            f"Fish={snapshot.get_fish_count()}, Density={snapshot.get_school_density():.3f}")
+                last_stats_time = current_time
+            if frame_count % 60 == 0:
+                log_performance("Render loop", time.time() - loop_start_time)
+    finally:
+        simulation.stop()
+    return frame_count, simulation
@@ -0,0 +1,132 @@
+import logging
+import numpy as np
+from fish import Fish
+from school import School
+from spatial import NeighborIndex
+from constants import *
+
+
+class SnapshotFish:
+    """ある時点の1匹分の状態（描画・視界表示用にFishと同じ属性を提供）"""
+
+    __slots__ = ('x', 'y', 'dx', 'dy', 'id')
+
+    def __init__(self, x, y, dx, dy, index):
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.id = index  # スナップショット中のリスト上の位置
+
+    get_position = Fish.get_position
+    get_direction = Fish.get_direction
+
+
+class SnapshotSchool(School):
+    """ある時点の群れの状態（列x, y, dx, dyの配列）を、Schoolと同じ取得・描画メソッドで見せる読み取り専用の群れ"""
+
+    def __init__(self, state, gender=None, tick=None, statistics=None, world_size=None):
+        self.school_id = id(self)
+        self.world_width, self.world_height = world_size or (WORLD_WIDTH, WORLD_HEIGHT)
+        self.seed = None
+        self.renderer = None
+        self.logger = logging.getLogger('FishSimulator.Snapshot')
+        self.tick = tick
+        self.statistics = statistics  # 状態以外の統計量（体力・年齢など、あれば）
+        self.set_state(state, gender)
+
+    def set_state(self, state, gender=None):
+        """表示する状態を差し替える（gender省略時は全てmale）"""
+        self._derived = {
+            'state': state,
+            'gender': gender if gender is not None else np.zeros(len(state), dtype=np.int8)
+        }
+
+    @property
+    def fish_count(self):
+        return len(self._derived['state'])
+
+    @property
+    def fish_list(self):
+        """Fish互換の状態のリスト"""
+        state = self._derived['state'].tolist()
+        return [SnapshotFish(x, y, dx, dy, index) for index, (x, y, dx, dy) in enumerate(state)]
+
+    def get_state_arrays(self):
+        """状態を配列で取得"""
+        state = self._derived['state']
+        return {
+            'x': state[:, 0],
+            'y': state[:, 1],
+            'dx': state[:, 2],
+            'dy': state[:, 3],
+            'gender': self._derived['gender']
+        }
+
+    def get_neighbor_index(self):
+        """近傍検索用のセルリストを取得（状態を差し替えるまではキャッシュを返す）"""
+        if 'neighbor_index' not in self._derived:
+            state = self._derived['state']
+            self._derived['neighbor_index'] = NeighborIndex(state[:, 0], state[:, 1],
+                                                            width=self.world_width, height=self.world_height)
+        return self._derived['neighbor_index']
+
+    def _draw_index(self):
+        """描画の絞り込みに使えるセルリスト（補間した状態では元のスナップショットのものと位置のずれの上限）"""
+        if 'draw_index' in self._derived:
+            return self._derived['draw_index']
+        index = self._derived.get('neighbor_index')
+        return (index, 0.0) if index is not None else None
+
+    def _draw_state(self, candidates=None):
+        """描画に使う状態の配列と、その中で調べるメダカの添字（配列は添字で引けるため、全員分をそのまま渡す）"""
+        return self.get_state_arrays(), candidates
+
+    def get_school_center(self):
+        """群れの中心を取得（状態を差し替えるまではキャッシュを返す）"""
+        if 'center' not in self._derived:
+            state = self._derived['state']
+            if len(state) == 0:
+                self._derived['center'] = (self.world_width // 2, self.world_height // 2)
+            else:
+                self._derived['center'] = (float(state[:, 0].mean()), float(state[:, 1].mean()))
+        return self._derived['center']
+
+    def get_school_density(self):
+        """群れの密度を取得（状態を差し替えるまではキャッシュを返す）"""
+        if 'density' not in self._derived:
+            state = self._derived['state']
+            if len(state) == 0:
+                self._derived['density'] = 0
+            else:
+                center_x, center_y = self.get_school_center()
+                avg_distance = float(np.sqrt((state[:, 0] - center_x)**2 + (state[:, 1] - center_y)**2).mean())
+                self._derived['density'] = 1.0 / (avg_distance + 1)
+        return self._derived['density']
+
+    def get_school_statistics(self):
+        """群れの統計情報を取得（状態から計算できない値は、渡された統計量があればそれを使う）"""
+        stats = dict(self.statistics or {})
+        stats.update({
+            'count': self.fish_count,
+            'density': self.get_school_density(),
+            'center': self.get_school_center()
+        })
+        if self.tick is not None:
+            stats['tick'] = self.tick
+        return stats
+
+    def update_all_fish(self, params=None):
+        raise TypeError("SnapshotSchool is read-only")
+
+    def steer(self, force_x, force_y):
+        raise TypeError("SnapshotSchool is read-only")
+
+    def add_fish(self, x=None, y=None):
+        raise TypeError("SnapshotSchool is read-only")
+
+    def remove_fish(self, fish):
+        raise TypeError("SnapshotSchool is read-only")
+
+    def reset_fish_positions(self):
+        raise TypeError("SnapshotSchool is read-only")
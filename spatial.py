@@ -0,0 +1,625 @@
+import math
+from functools import lru_cache
+import numpy as np
+from constants import *
+
+
+def get_vision_rays(dx, dy):
+    """方向ベクトルを8方向に丸め、前方・斜め前（左右）の3本の視線方向を返す"""
+    # 方向を8方向に正規化（上下左右斜め）
+    if abs(dx) > abs(dy):
+        direction_x = 1 if dx > 0 else -1
+        direction_y = 0
+    elif abs(dy) > abs(dx):
+        direction_x = 0
+        direction_y = 1 if dy > 0 else -1
+    else:
+        direction_x = 1 if dx > 0 else -1
+        direction_y = 1 if dy > 0 else -1
+
+    front = (direction_x, direction_y)
+    if direction_x != 0 and direction_y != 0:
+        left = (direction_x, 0)
+        right = (0, direction_y)
+    elif direction_x != 0:  # 左右移動の場合
+        left = (direction_x, -1)
+        right = (direction_x, 1)
+    else:  # 上下移動の場合
+        left = (-1, direction_y)
+        right = (1, direction_y)
+
+    return [front, left, right]
+
+
+@lru_cache(maxsize=64)
+def vision_probe_offsets(front, vision_range):
+    """前方の視線方向frontの区分について、距離1〜vision_rangeの前方・左・右のチェック位置の相対座標（形状(vision_range, 3, 2)）"""
+    rays = np.array(get_vision_rays(*front), dtype=np.int64)
+    distances = np.arange(1, vision_range + 1, dtype=np.int64)
+    probes = distances[:, None, None] * rays[None, :, :]
+    probes.setflags(write=False)
+    return probes
+
+
+def get_vision_probes(dx, dy, vision_range):
+    """方向(dx, dy)の区分のチェック位置の表（視界範囲ごとに1回だけ計算して使い回す）"""
+    return vision_probe_offsets(get_vision_rays(dx, dy)[0], vision_range)
+
+
+@lru_cache(maxsize=64)
+def vision_mask(front, vision_range, tolerance=VISION_TOLERANCE):
+    """区分frontの視界（いずれかのチェック位置から±tolerance以内）を整数格子に塗った配列[x, y]と、メダカの位置の添字を返す"""
+    reach = vision_range + tolerance
+    mask = np.zeros((2 * reach + 1, 2 * reach + 1), dtype=bool)
+    for probe_x, probe_y in vision_probe_offsets(front, vision_range).reshape(-1, 2).tolist():
+        mask[probe_x + reach - tolerance:probe_x + reach + tolerance + 1,
+             probe_y + reach - tolerance:probe_y + reach + tolerance + 1] = True
+    mask.setflags(write=False)
+    return mask, reach
+
+
+def first_probe_hit(fish_x, fish_y, ray, other_x, other_y, vision_range, tolerance=VISION_TOLERANCE):
+    """視線上で他の魚が最初に検出される距離を返す（検出されなければNone）"""
+    ray_x, ray_y = ray
+    rel_x = other_x - fish_x
+    rel_y = other_y - fish_y
+
+    # 各軸で |rel - ray * d| <= tolerance を満たす d の範囲を解析的に求める
+    lo = 1
+    hi = vision_range
+    for rel, ray_c in ((rel_x, ray_x), (rel_y, ray_y)):
+        if ray_c == 0:
+            if abs(rel) > tolerance:
+                return None
+        else:
+            a = (rel - tolerance) * ray_c
+            b = (rel + tolerance) * ray_c
+            if a > b:
+                a, b = b, a
+            lo = max(lo, math.ceil(a))
+            hi = min(hi, math.floor(b))
+
+    # 浮動小数点の丸めに備え、境界の前後を元の判定式で確認する
+    start = max(1, lo - 1)
+    end = min(vision_range, hi + 1, lo + 1)
+    for distance in range(start, end + 1):
+        check_x = fish_x + ray_x * distance
+        check_y = fish_y + ray_y * distance
+        if abs(other_x - check_x) <= tolerance and abs(other_y - check_y) <= tolerance:
+            return distance
+    return None
+
+
+class SpatialHash:
+    """トーラス状の一様グリッドによる空間ハッシュ（視界チェックの近傍候補検索用）"""
+
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, tolerance=VISION_TOLERANCE):
+        self.tolerance = tolerance
+        # セルサイズは視界チェックの許容範囲（±tolerance）に合わせる
+        self.cell_size = max(1, 2 * tolerance)
+        self.cols = max(1, math.ceil(width / self.cell_size))
+        self.rows = max(1, math.ceil(height / self.cell_size))
+        self.cells = {}
+        self.fish_cells = {}
+        self.fish_index = {}
+
+    def _cell_of(self, x, y):
+        """座標が属するセルのキーを返す"""
+        return (int(x // self.cell_size) % self.cols, int(y // self.cell_size) % self.rows)
+
+    def rebuild(self, fish_list):
+        """全てのメダカを登録し直す"""
+        self.cells = {}
+        self.fish_cells = {}
+        self.fish_index = {}
+        for index, fish in enumerate(fish_list):
+            key = self._cell_of(fish.x, fish.y)
+            self.cells.setdefault(key, []).append(fish)
+            self.fish_cells[id(fish)] = key
+            self.fish_index[id(fish)] = index
+
+    def move(self, fish):
+        """移動したメダカのセルを更新"""
+        old_key = self.fish_cells.get(id(fish))
+        new_key = self._cell_of(fish.x, fish.y)
+        if old_key == new_key:
+            return
+        if old_key is not None:
+            self.cells[old_key].remove(fish)
+        self.cells.setdefault(new_key, []).append(fish)
+        self.fish_cells[id(fish)] = new_key
+
+    def query_vision(self, fish, vision_range=VISION_RANGE):
+        """3本の視線上で見えるメダカを、元の走査順（距離順・リスト順）で返す"""
+        fish_x, fish_y = fish.x, fish.y
+        rays = tuple(get_vision_rays(fish.dx, fish.dy))
+
+        # 視線のチェック範囲が掛かりうるセルの相対位置は、向きの区分と視界範囲ごとの表から引く
+        offset_x, offset_y = vision_cell_offsets(rays, vision_range, self.cell_size, self.tolerance)
+        cell_x = int(fish_x // self.cell_size)
+        cell_y = int(fish_y // self.cell_size)
+        keys = set(zip(((offset_x + cell_x) % self.cols).tolist(), ((offset_y + cell_y) % self.rows).tolist()))
+
+        hits = []
+        for key in keys:
+            for other_fish in self.cells.get(key, ()):
+                if other_fish is fish:
+                    continue
+                best = None
+                for ray in rays:
+                    distance = first_probe_hit(fish_x, fish_y, ray, other_fish.x, other_fish.y,
+                                               vision_range, self.tolerance)
+                    if distance is not None and (best is None or distance < best):
+                        best = distance
+                if best is not None:
+                    hits.append((best, self.fish_index[id(other_fish)], other_fish))
+
+        hits.sort(key=lambda hit: (hit[0], hit[1]))
+        return [hit[2] for hit in hits]
+
+
+def first_probe_hits(fish_x, fish_y, rays, other_x, other_y, vision_range, tolerance=VISION_TOLERANCE):
+    """first_probe_hitのベクトル版。3本の視線のうち最初に検出される距離の配列を返す（検出されなければ0）"""
+    rel_x = other_x - fish_x
+    rel_y = other_y - fish_y
+    best = np.zeros(len(other_x), dtype=np.int64)
+    for ray_x, ray_y in rays:
+        visible = np.ones(len(other_x), dtype=bool)
+        lo = np.ones(len(other_x))
+        hi = np.full(len(other_x), float(vision_range))
+        for rel, ray_c in ((rel_x, ray_x), (rel_y, ray_y)):
+            if ray_c == 0:
+                visible &= np.abs(rel) <= tolerance
+            else:
+                a = (rel - tolerance) * ray_c
+                b = (rel + tolerance) * ray_c
+                lo = np.maximum(lo, np.ceil(np.minimum(a, b)))
+                hi = np.minimum(hi, np.floor(np.maximum(a, b)))
+
+        # 浮動小数点の丸めに備え、境界の前後を元の判定式で確認する（first_probe_hitと同じ範囲）
+        start = np.maximum(1, lo - 1)
+        end = np.minimum(np.minimum(vision_range, hi + 1), lo + 1)
+        found = np.zeros(len(other_x), dtype=np.int64)
+        for step in range(3):
+            distance = start + step
+            check = (visible & (found == 0) & (distance <= end) &
+                     (np.abs(other_x - (fish_x + ray_x * distance)) <= tolerance) &
+                     (np.abs(other_y - (fish_y + ray_y * distance)) <= tolerance))
+            found[check] = distance[check]
+        best = np.where((found > 0) & ((best == 0) | (found < best)), found, best)
+    return best
+
+
+class OccupancyGrid:
+    """世界を許容範囲幅のセルに分け、占有されたセルごとにメダカの添字リストを持つ格子（SpatialHashと同じ使い方の視界検索）
+
+    セルの情報は占有されたセルの分だけ辞書に持つため、広い世界でも作り直しのコストは世界の面積ではなくメダカの数で決まる。
+    視線のチェック範囲が掛かりうるセルは向きの区分と視界範囲ごとの表から引き、占有されたセルのメダカだけを
+    ベクトル演算でまとめて判定するため、1匹あたりの検索は群れ全体の数ではなく視界内の混み具合にだけ依存する。
+    座標は画面内（0 <= x < width, 0 <= y < height）を前提とする。
+    """
+
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, tolerance=VISION_TOLERANCE):
+        self.tolerance = tolerance
+        self.cell_size = max(1, tolerance)
+        self.cols = max(1, math.ceil(width / self.cell_size))
+        self.rows = max(1, math.ceil(height / self.cell_size))
+        self.cells = {}  # 占有されたセルの番号 -> メダカの添字リスト
+        self.fish = []
+        self.fish_index = {}
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.keys = np.zeros(0, dtype=np.int64)
+
+    def _cell_xy(self, x, y):
+        """座標が属するセルの列・行（画面外の座標は端のセルに入れる）"""
+        return (min(max(int(x // self.cell_size), 0), self.cols - 1),
+                min(max(int(y // self.cell_size), 0), self.rows - 1))
+
+    def rebuild(self, fish_list):
+        """全てのメダカの位置を格子に書き込み直す"""
+        self.fish = list(fish_list)
+        self.fish_index = {id(fish): index for index, fish in enumerate(self.fish)}
+        self.x = np.array([fish.x for fish in self.fish], dtype=np.float64)
+        self.y = np.array([fish.y for fish in self.fish], dtype=np.float64)
+        cell_x = np.clip((self.x // self.cell_size).astype(np.int64), 0, self.cols - 1)
+        cell_y = np.clip((self.y // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        self.keys = cell_x * self.rows + cell_y
+        self.cells = {}
+        for index, key in enumerate(self.keys.tolist()):
+            self.cells.setdefault(key, []).append(index)
+
+    def move(self, fish):
+        """移動したメダカの位置とセルを更新"""
+        index = self.fish_index.get(id(fish))
+        if index is None:
+            return
+        self.x[index] = fish.x
+        self.y[index] = fish.y
+        cell_x, cell_y = self._cell_xy(fish.x, fish.y)
+        new_key = cell_x * self.rows + cell_y
+        old_key = int(self.keys[index])
+        if new_key == old_key:
+            return
+        self.cells[old_key].remove(index)
+        if not self.cells[old_key]:
+            del self.cells[old_key]
+        self.cells.setdefault(new_key, []).append(index)
+        self.keys[index] = new_key
+
+    def query_vision(self, fish, vision_range=VISION_RANGE):
+        """3本の視線上で見えるメダカを、元の走査順（距離順・リスト順）で返す"""
+        fish_x, fish_y = fish.x, fish.y
+        rays = tuple(get_vision_rays(fish.dx, fish.dy))
+
+        # チェック範囲が掛かりうるセルのうち、占有されているセルのメダカだけを候補にする
+        offset_x, offset_y = vision_cell_offsets(rays, vision_range, self.cell_size, self.tolerance)
+        cell_x, cell_y = self._cell_xy(fish_x, fish_y)
+        neighbor_x = offset_x + cell_x
+        neighbor_y = offset_y + cell_y
+        inside = (neighbor_x >= 0) & (neighbor_x < self.cols) & (neighbor_y >= 0) & (neighbor_y < self.rows)
+        keys = neighbor_x[inside] * self.rows + neighbor_y[inside]
+        # 結果は距離と添字の順に並べ直すため、候補の順序は問わない
+        cells = self.cells
+        candidates = [index for key in cells.keys() & keys.tolist() for index in cells[key]]
+        self_index = self.fish_index.get(id(fish))
+        candidates = np.array([index for index in candidates if index != self_index], dtype=np.int64)
+        if len(candidates) == 0:
+            return []
+
+        distances = first_probe_hits(fish_x, fish_y, rays, self.x[candidates], self.y[candidates],
+                                     vision_range, self.tolerance)
+        seen = distances > 0
+        candidates = candidates[seen]
+        order = np.lexsort((candidates, distances[seen]))
+        return [self.fish[index] for index in candidates[order].tolist()]
+
+
+def get_vision_rays_array(dx, dy):
+    """get_vision_raysのベクトル版。形状(n, 3, 2)の視線方向配列を返す"""
+    abs_dx = np.abs(dx)
+    abs_dy = np.abs(dy)
+    sign_x = np.where(dx > 0, 1, -1)
+    sign_y = np.where(dy > 0, 1, -1)
+    direction_x = np.where(abs_dy > abs_dx, 0, sign_x)
+    direction_y = np.where(abs_dx > abs_dy, 0, sign_y)
+
+    diagonal = (direction_x != 0) & (direction_y != 0)
+    horizontal = direction_y == 0
+
+    rays = np.empty((len(dx), 3, 2), dtype=np.int64)
+    rays[:, 0, 0] = direction_x
+    rays[:, 0, 1] = direction_y
+    # 斜め前（左）
+    rays[:, 1, 0] = np.where(diagonal | horizontal, direction_x, -1)
+    rays[:, 1, 1] = np.where(diagonal, 0, np.where(horizontal, -1, direction_y))
+    # 斜め前（右）
+    rays[:, 2, 0] = np.where(diagonal, 0, np.where(horizontal, direction_x, 1))
+    rays[:, 2, 1] = np.where(diagonal | ~horizontal, direction_y, 1)
+    return rays
+
+
+def rays_visible(rel_x, rel_y, ray_x, ray_y, vision_range, tolerance=VISION_TOLERANCE):
+    """相対位置(rel_x, rel_y)が視線(ray_x, ray_y)上のいずれかのチェック位置に入るかを判定"""
+    visible = np.ones(np.shape(rel_x), dtype=bool)
+    lo = np.ones(np.shape(rel_x))
+    hi = np.full(np.shape(rel_x), float(vision_range))
+    for rel, ray_c in ((rel_x, ray_x), (rel_y, ray_y)):
+        on_axis = ray_c == 0
+        visible &= ~on_axis | (np.abs(rel) <= tolerance)
+        a = (rel - tolerance) * ray_c
+        b = (rel + tolerance) * ray_c
+        lo = np.where(on_axis, lo, np.maximum(lo, np.ceil(np.minimum(a, b))))
+        hi = np.where(on_axis, hi, np.minimum(hi, np.floor(np.maximum(a, b))))
+    return visible & (lo <= hi)
+
+
+
+class CellGrid:
+    """メダカの位置を一様グリッドに振り分けた配列（メダカのいるセルだけの番号・開始位置・個数）
+
+    セルの配列はメダカのいるセルの数だけ確保するため、広い世界でもメモリは世界の面積ではなくメダカの数で決まる。
+    """
+
+    def __init__(self, x, y, cell_size):
+        self.cell_size = cell_size
+        self.cell_x = np.floor(np.asarray(x) / cell_size).astype(np.int64)
+        self.cell_y = np.floor(np.asarray(y) / cell_size).astype(np.int64)
+        # 左上のセルを(0, 0)にずらす（ずらした量はorigin_x, origin_y）
+        self.origin_x = int(self.cell_x.min()) if len(self.cell_x) else 0
+        self.origin_y = int(self.cell_y.min()) if len(self.cell_y) else 0
+        self.cell_x -= self.origin_x
+        self.cell_y -= self.origin_y
+        self.cols = int(self.cell_x.max()) + 1 if len(self.cell_x) else 1
+        self.rows = int(self.cell_y.max()) + 1 if len(self.cell_y) else 1
+
+        keys = self.cell_x * self.rows + self.cell_y
+        self.order = np.argsort(keys, kind='stable')
+        # メダカのいるセルの番号（昇順）と、セルごとの個数・並べ替え後の開始位置
+        self.cell_keys, self.counts = np.unique(keys, return_counts=True)
+        self.starts = np.cumsum(self.counts) - self.counts
+
+    def pairs(self, fish_indices, offset_x, offset_y, max_pairs=4_000_000):
+        """各メダカ（fish_indices）のセルから(offset_x, offset_y)ずらしたセルにいるメダカとの組を返す"""
+        neighbor_x = self.cell_x[fish_indices] + offset_x
+        neighbor_y = self.cell_y[fish_indices] + offset_y
+        valid = (neighbor_x >= 0) & (neighbor_x < self.cols) & (neighbor_y >= 0) & (neighbor_y < self.rows)
+        keys = neighbor_x * self.rows + neighbor_y
+        # 隣のセルがメダカのいるセルの何番目か（いなければ0匹）
+        positions = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        valid &= self.cell_keys[positions] == keys
+        counts = np.where(valid, self.counts[positions], 0)
+        yield from expand_cell_pairs(fish_indices, counts, self.starts[positions], self.order, max_pairs)
+
+
+def expand_cell_pairs(fish_indices, counts, starts, order, max_pairs=4_000_000):
+    """各メダカ（fish_indices）と、対応するセル（並べ替え後の開始位置starts・個数counts）にいるメダカの組(i, j)を返す"""
+    # 組の数がmax_pairsを超えないように区切って返す
+    cumulative = np.cumsum(counts)
+    block_start = 0
+    while block_start < len(counts):
+        base = cumulative[block_start - 1] if block_start > 0 else 0
+        block_end = int(np.searchsorted(cumulative, base + max_pairs, side='right'))
+        block_end = min(len(counts), max(block_end, block_start + 1))
+
+        block_counts = counts[block_start:block_end]
+        total = int(block_counts.sum())
+        if total > 0:
+            i_idx = np.repeat(fish_indices[block_start:block_end], block_counts)
+            run_starts = np.repeat(starts[block_start:block_end], block_counts)
+            run_offsets = np.arange(total) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+            j_idx = order[run_starts + run_offsets]
+            mask = i_idx != j_idx
+            yield i_idx[mask], j_idx[mask]
+        block_start = block_end
+
+
+@lru_cache(maxsize=256)
+def vision_cell_offsets(rays, vision_range, cell_size, tolerance=VISION_TOLERANCE):
+    """セル内のどこにいても視線のチェック範囲が掛かりうるセルの相対位置を返す"""
+    offsets = set()
+    for ray_x, ray_y in rays:
+        for distance in range(1, vision_range + 1):
+            # メダカはセル内[0, cell_size)のどこかにいる
+            min_x = math.floor((ray_x * distance - tolerance) / cell_size)
+            max_x = math.floor((cell_size + ray_x * distance + tolerance) / cell_size)
+            min_y = math.floor((ray_y * distance - tolerance) / cell_size)
+            max_y = math.floor((cell_size + ray_y * distance + tolerance) / cell_size)
+            for offset_x in range(min_x, max_x + 1):
+                for offset_y in range(min_y, max_y + 1):
+                    offsets.add((offset_x, offset_y))
+    offsets = np.array(sorted(offsets), dtype=np.int64)
+    offsets.setflags(write=False)
+    return offsets[:, 0], offsets[:, 1]
+
+
+def vision_candidate_pairs(x, y, dx, dy, vision_range, cell_size=VISION_TOLERANCE // 2, max_queries=2_000_000,
+                           query_indices=None):
+    """視界のチェック範囲に掛かるセルにいるメダカの組(i, j)を、向きの区分ごとにまとめて返す
+    （query_indicesを渡すと、iはそのメダカだけ。jは全員から探す）"""
+    grid = CellGrid(x, y, cell_size)
+    rays = get_vision_rays_array(dx, dy)
+    if query_indices is None:
+        query_indices = np.arange(len(x))
+    # 前方の視線方向で8区分に分ける
+    buckets = (rays[query_indices, 0, 0] + 1) * 3 + (rays[query_indices, 0, 1] + 1)
+    for bucket in np.unique(buckets):
+        fish_indices = query_indices[buckets == bucket]
+        ray_list = tuple(tuple(ray) for ray in rays[fish_indices[0]].tolist())
+        offset_x, offset_y = vision_cell_offsets(ray_list, vision_range, cell_size)
+
+        block = max(1, max_queries // len(offset_x))
+        for start in range(0, len(fish_indices), block):
+            block_fish = fish_indices[start:start + block]
+            query_fish = np.repeat(block_fish, len(offset_x))
+            yield from grid.pairs(query_fish, np.tile(offset_x, len(block_fish)),
+                                  np.tile(offset_y, len(block_fish)))
+
+
+def torus_distances(x1, y1, x2, y2, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """トーラス状の世界での2点間の最短距離を配列でまとめて計算（utils.distance_in_torusと同じ計算）"""
+    dx = np.abs(x2 - x1)
+    dy = np.abs(y2 - y1)
+    dx = np.minimum(dx, width - dx)
+    dy = np.minimum(dy, height - dy)
+    return np.sqrt(dx**2 + dy**2)
+
+
+class NeighborIndex:
+    """トーラス状の世界のセルリスト（ティックごとに1回作り、全メダカの半径検索・最近傍検索をまとめて行う）"""
+
+    def __init__(self, x, y, cell_size=NEIGHBOR_CELL_SIZE, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        # 作成時点の位置を写しておく（元の配列が更新されても検索結果が崩れない）
+        self.x = np.array(x, dtype=np.float64)
+        self.y = np.array(y, dtype=np.float64)
+        self.width = width
+        self.height = height
+        # 世界をちょうど割り切るようにセル数を決める（セルの幅・高さはcell_size以上）
+        self.cols = max(1, int(width // cell_size))
+        self.rows = max(1, int(height // cell_size))
+        self.cell_width = width / self.cols
+        self.cell_height = height / self.rows
+        self.cell_x = np.floor(self.x / self.cell_width).astype(np.int64) % self.cols
+        self.cell_y = np.floor(self.y / self.cell_height).astype(np.int64) % self.rows
+
+        keys = self.cell_x * self.rows + self.cell_y
+        self.order = np.argsort(keys, kind='stable')
+        self.counts = np.bincount(keys, minlength=self.cols * self.rows)
+        self.starts = np.cumsum(self.counts) - self.counts
+        self.fish_index = {}
+
+    @classmethod
+    def from_fish(cls, fish_list, cell_size=NEIGHBOR_CELL_SIZE, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        """メダカのリストから作成（fish_indexでメダカからリスト上の位置を引ける）"""
+        positions = np.array([(fish.x, fish.y) for fish in fish_list], dtype=np.float64).reshape(-1, 2)
+        index = cls(positions[:, 0], positions[:, 1], cell_size, width, height)
+        index.fish_index = {id(fish): i for i, fish in enumerate(fish_list)}
+        return index
+
+    def __len__(self):
+        return len(self.x)
+
+    @staticmethod
+    def _cell_span(low, high, cell_size, count):
+        """区間[low, high]（端をまたいでよい）に掛かるセルの番号"""
+        first = math.floor(low / cell_size)
+        last = math.floor(high / cell_size)
+        if last - first + 1 >= count:
+            return np.arange(count)
+        return np.arange(first, last + 1) % count
+
+    def query_rect(self, left, top, right, bottom):
+        """矩形（端をまたいでよい）に掛かるセルにいるメダカの添字を昇順で返す（矩形のすぐ外のメダカも含みうる）"""
+        cols = self._cell_span(left, right, self.cell_width, self.cols)
+        rows = self._cell_span(top, bottom, self.cell_height, self.rows)
+        keys = (cols[:, None] * self.rows + rows[None, :]).ravel()
+        counts = self.counts[keys]
+        total = int(counts.sum())
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.sort(self.order[np.repeat(self.starts[keys], counts) + offsets])
+
+    def _reach(self, max_distance):
+        """距離max_distance以内のメダカがいうるセルの、縦横それぞれの最大のずれ"""
+        return math.ceil(max_distance / self.cell_width), math.ceil(max_distance / self.cell_height)
+
+    def _new_offsets(self, candidates, seen):
+        """セルのずれのうち、まだseenに含まれないもの（折り返しで重なるものは1つにまとめる）"""
+        offsets = []
+        for offset_x, offset_y in candidates:
+            key = (offset_x % self.cols, offset_y % self.rows)
+            if key not in seen:
+                seen.add(key)
+                offsets.append(key)
+        return np.array(offsets, dtype=np.int64).reshape(-1, 2)
+
+    def _box_offsets(self, reach_x, reach_y):
+        """縦横それぞれ(reach_x, reach_y)までずらしたセル"""
+        reach_x = min(reach_x, self.cols)
+        reach_y = min(reach_y, self.rows)
+        return self._new_offsets(((offset_x, offset_y)
+                                  for offset_x in range(-reach_x, reach_x + 1)
+                                  for offset_y in range(-reach_y, reach_y + 1)), set())
+
+    def _ring_offsets(self, reach, seen):
+        """ちょうどreachだけずれた周上のセルのうち、まだ検索していないもの"""
+        if reach == 0:
+            return self._new_offsets([(0, 0)], seen)
+        ring = [(offset_x, offset_y) for offset_x in range(-reach, reach + 1) for offset_y in (-reach, reach)]
+        ring += [(offset_x, offset_y) for offset_x in (-reach, reach) for offset_y in range(-reach + 1, reach)]
+        return self._new_offsets(ring, seen)
+
+    def _pairs(self, fish_indices, offsets, max_pairs):
+        """各メダカのセルからoffsetsだけずらしたセルにいるメダカとの組(i, j)と距離を返す"""
+        if len(fish_indices) == 0 or len(offsets) == 0:
+            return
+        block = max(1, max_pairs // len(offsets))
+        for start in range(0, len(fish_indices), block):
+            block_fish = fish_indices[start:start + block]
+            query_fish = np.repeat(block_fish, len(offsets))
+            neighbor_x = (self.cell_x[query_fish] + np.tile(offsets[:, 0], len(block_fish))) % self.cols
+            neighbor_y = (self.cell_y[query_fish] + np.tile(offsets[:, 1], len(block_fish))) % self.rows
+            keys = neighbor_x * self.rows + neighbor_y
+            for i_idx, j_idx in expand_cell_pairs(query_fish, self.counts[keys], self.starts[keys],
+                                                  self.order, max_pairs):
+                distances = torus_distances(self.x[i_idx], self.y[i_idx], self.x[j_idx], self.y[j_idx],
+                                            self.width, self.height)
+                yield i_idx, j_idx, distances
+
+    def radius_pairs(self, max_distance=50, fish_indices=None, max_pairs=4_000_000):
+        """距離max_distance以内にいるメダカの組(i, j)と距離をまとめて返す（i != j、組の順序は不定）"""
+        if fish_indices is None:
+            fish_indices = np.arange(len(self))
+        fish_indices = np.asarray(fish_indices, dtype=np.int64)
+        offsets = self._box_offsets(*self._reach(max_distance))
+        for i_idx, j_idx, distances in self._pairs(fish_indices, offsets, max_pairs):
+            mask = distances <= max_distance
+            yield i_idx[mask], j_idx[mask], distances[mask]
+
+    def query_radius(self, max_distance=50, fish_indices=None):
+        """各メダカについて、距離max_distance以内にいるメダカの位置の配列（位置の昇順）のリストを返す"""
+        if fish_indices is None:
+            fish_indices = np.arange(len(self))
+        fish_indices = np.asarray(fish_indices, dtype=np.int64)
+        if len(fish_indices) == 0:
+            return []
+        query_rank = np.full(len(self), -1, dtype=np.int64)
+        query_rank[fish_indices] = np.arange(len(fish_indices))
+
+        # (問い合わせの順位, 位置)を1つの整数にまとめて並べ替え、各問い合わせの中では線形走査と同じ位置の昇順にする
+        keys = [query_rank[i_idx] * len(self) + j_idx
+                for i_idx, j_idx, distances in self.radius_pairs(max_distance, fish_indices)]
+        keys = np.sort(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+        counts = np.bincount(keys // len(self), minlength=len(fish_indices))
+        return np.split(keys % len(self), np.cumsum(counts)[:-1])
+
+    def query_nearest(self, k=1, max_distance=None, fish_indices=None, max_pairs=4_000_000):
+        """各メダカについて近い順にk匹の位置と距離を返す（見つからない分は位置-1・距離inf、同じ距離なら位置の昇順）"""
+        if fish_indices is None:
+            fish_indices = np.arange(len(self))
+        fish_indices = np.asarray(fish_indices, dtype=np.int64)
+        # メダカのいるセルに平均2k匹より多くいる（群れが密集している）場合は、平均k匹程度になる細かいセルリストで検索する
+        occupied = np.count_nonzero(self.counts)
+        if len(self) > 2 * k * occupied:
+            cell_size = min(self.cell_width, self.cell_height) * math.sqrt(k * occupied / len(self))
+            # 同じ位置に重なったメダカで際限なく細かくならないように1ピクセルで止める
+            if cell_size >= 1:
+                finer = NeighborIndex(self.x, self.y, cell_size, self.width, self.height)
+                return finer.query_nearest(k, max_distance, fish_indices, max_pairs)
+
+        best_index = np.full((len(fish_indices), k), -1, dtype=np.int64)
+        best_distance = np.full((len(fish_indices), k), np.inf)
+        query_rank = np.full(len(self), -1, dtype=np.int64)
+        query_rank[fish_indices] = np.arange(len(fish_indices))
+
+        # 自分のセルから外側へ1周ずつ広げ、k番目の距離より近いセルが残っていないメダカは打ち切る
+        max_reach = max(self.cols, self.rows)
+        if max_distance is not None:
+            max_reach = min(max_reach, max(self._reach(max_distance)))
+        seen = set()
+        pending = np.arange(len(fish_indices))
+        for reach in range(max_reach + 1):
+            offsets = self._ring_offsets(reach, seen)
+            for i_idx, j_idx, distances in self._pairs(fish_indices[pending], offsets, max_pairs):
+                if max_distance is not None:
+                    mask = distances <= max_distance
+                    i_idx, j_idx, distances = i_idx[mask], j_idx[mask], distances[mask]
+                self._merge_nearest(best_index, best_distance, query_rank[i_idx], j_idx, distances)
+
+            if len(seen) == self.cols * self.rows:
+                break
+            covered = reach * min(self.cell_width, self.cell_height)
+            pending = pending[best_distance[pending, -1] > covered]
+            if len(pending) == 0:
+                break
+        return best_index, best_distance
+
+    @staticmethod
+    def _merge_nearest(best_index, best_distance, ranks, indices, distances):
+        """候補を現在の上位k件に合わせ、(距離, 位置)の順で上位k件を残す"""
+        if len(ranks) == 0:
+            return
+        k = best_index.shape[1]
+        if k == 1:
+            # 最近傍1件だけなら並べ替えずに、最小の距離と、その距離の候補のうち最小の位置を求める
+            no_index = np.iinfo(np.int64).max
+            old_distance = best_distance[:, 0].copy()
+            np.minimum.at(best_distance[:, 0], ranks, distances)
+            new_distance = best_distance[:, 0]
+            candidate = np.where((new_distance == old_distance) & (best_index[:, 0] >= 0), best_index[:, 0], no_index)
+            tie = distances == new_distance[ranks]
+            np.minimum.at(candidate, ranks[tie], indices[tie])
+            best_index[:, 0] = np.where(candidate == no_index, best_index[:, 0], candidate)
+            return
+        queries = np.unique(ranks)
+        all_ranks = np.concatenate([np.repeat(queries, k), ranks])
+        all_indices = np.concatenate([best_index[queries].ravel(), indices])
+        all_distances = np.concatenate([best_distance[queries].ravel(), distances])
+        # 未使用の枠（位置-1）は最後に並ぶようにする
+        tie_break = np.where(all_indices < 0, np.iinfo(np.int64).max, all_indices)
+        order = np.lexsort((tie_break, all_distances, all_ranks))
+        all_ranks = all_ranks[order]
+        group_start = np.searchsorted(all_ranks, all_ranks, side='left')
+        slot = np.arange(len(all_ranks)) - group_start
+        keep = slot < k
+        best_index[all_ranks[keep], slot[keep]] = all_indices[order][keep]
+        best_distance[all_ranks[keep], slot[keep]] = all_distances[order][keep]
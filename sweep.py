@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+群れ行動パラメータのスイープ（グリッド・ランダムサンプリング）を全コアで実行するスクリプト
+"""
+
+import argparse
+import csv
+import itertools
+import logging
+import random
+from concurrent.futures import ProcessPoolExecutor
+from constants import *
+from utils import get_default_parameters
+from headless import ENGINES, PARAMETER_OPTIONS, create_school, run_headless
+from analytics import compute_analytics
+
+def parameter_grid(axes, base=None):
+    """各パラメータの候補値の全組み合わせをパラメータ辞書のリストで返す"""
+    base = dict(base or get_default_parameters())
+    names = list(axes)
+    for name in names:
+        if name not in PARAMETER_OPTIONS:
+            raise ValueError(f"Unknown parameter: {name}")
+
+    param_sets = []
+    for values in itertools.product(*(axes[name] for name in names)):
+        params = dict(base)
+        params.update(zip(names, values))
+        param_sets.append(params)
+    return param_sets
+
+def random_parameter_samples(ranges, count, seed=None, base=None):
+    """各パラメータを範囲(low, high)から一様にサンプリングしたパラメータ辞書のリストを返す"""
+    base = dict(base or get_default_parameters())
+    sampler = random.Random(seed)
+
+    param_sets = []
+    for i in range(count):
+        params = dict(base)
+        for name, (low, high) in ranges.items():
+            if name not in PARAMETER_OPTIONS:
+                raise ValueError(f"Unknown parameter: {name}")
+            if PARAMETER_OPTIONS[name] is int:
+                params[name] = sampler.randint(int(low), int(high))
+            else:
+                params[name] = sampler.uniform(low, high)
+        param_sets.append(params)
+    return param_sets
+
+def run_single(run_id, params, seed, fish_count, ticks, engine):
+    """1回分のシミュレーションを実行し、結果表の1行を返す（ワーカープロセスで実行）"""
+    school = create_school(fish_count, engine, seed)
+    result = run_headless(school, params, ticks)
+    stats = school.get_school_statistics()
+    state = school.get_state_arrays()
+    order = compute_analytics(state['x'], state['y'], state['dx'], state['dy'], *school.world_size,
+                              index=school.get_neighbor_index())
+
+    row = {'run_id': run_id, 'seed': seed, 'engine': engine, 'ticks': ticks}
+    row.update(params)
+    row.update({
+        'count': stats['count'],
+        'density': stats['density'],
+        'center_x': stats['center'][0],
+        'center_y': stats['center'][1],
+        'avg_energy': stats['avg_energy'],
+        'avg_age': stats['avg_age'],
+        'male_ratio': stats['gender_ratio']['male'],
+        'polarization': order['polarization'],
+        'angular_momentum': order['angular_momentum'],
+        'nn_mean': order['nn_mean'],
+        'clusters': order['clusters'],
+        'elapsed': result['elapsed'],
+        'ticks_per_sec': result['ticks_per_sec']
+    })
+    return row
+
+def run_sweep(param_sets, seeds, fish_count=DEFAULT_FISH_COUNT, ticks=100, engine='python', max_workers=None):
+    """パラメータ辞書とシードの全組み合わせをプロセスプールで並列実行し、結果表（行のリスト）を返す"""
+    logger = logging.getLogger('FishSimulator.Sweep')
+    tasks = [(params, seed) for params in param_sets for seed in seeds]
+    logger.info(f"Sweep started: {len(param_sets)} parameter sets x {len(seeds)} seeds = {len(tasks)} runs")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run_single, run_id, params, seed, fish_count, ticks, engine)
+            for run_id, (params, seed) in enumerate(tasks)
+        ]
+        rows = [future.result() for future in futures]
+
+    logger.info(f"Sweep finished: {len(rows)} runs")
+    return rows
+
+def write_results_csv(rows, path):
+    """結果表をCSVに書き出す"""
+    if not rows:
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _parse_axis(text):
+    """'name=v1,v2,...' を (name, [値...]) に変換"""
+    name, _, values = text.partition('=')
+    value_type = PARAMETER_OPTIONS.get(name, float)
+    return name, [value_type(value) for value in values.split(',')]
+
+def _parse_range(text):
+    """'name=low:high' を (name, (low, high)) に変換"""
+    name, _, bounds = text.partition('=')
+    low, _, high = bounds.partition(':')
+    return name, (float(low), float(high))
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Fish School Simulator parameter sweep")
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help="グリッド探索する値（複数指定で全組み合わせ）")
+    parser.add_argument('--range', action='append', default=[], metavar='NAME=LOW:HIGH',
+                        help="ランダムサンプリングする範囲")
+    parser.add_argument('--samples', type=int, default=10, help="ランダムサンプリングの件数")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0], help="各パラメータで実行するシード")
+    parser.add_argument('--fish', type=int, default=DEFAULT_FISH_COUNT, help="メダカの数")
+    parser.add_argument('--ticks', type=int, default=100, help="更新回数")
+    parser.add_argument('--engine', choices=ENGINES, default='python', help="計算エンジン")
+    parser.add_argument('--workers', type=int, default=None, help="ワーカープロセス数（省略時はCPUコア数）")
+    parser.add_argument('--output', default='sweep_results.csv', help="結果CSVの出力先")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """スイープ実行のエントリポイント"""
+    args = parse_args(argv)
+
+    if args.range:
+        param_sets = random_parameter_samples(dict(map(_parse_range, args.range)), args.samples,
+                                              seed=args.seeds[0])
+    else:
+        param_sets = parameter_grid(dict(map(_parse_axis, args.grid)))
+
+    rows = run_sweep(param_sets, args.seeds, args.fish, args.ticks, args.engine, args.workers)
+    write_results_csv(rows, args.output)
+    print(f"{len(rows)}件の実行結果を{args.output}に書き出しました")
+    return rows
+
+if __name__ == "__main__":
+    main()
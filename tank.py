@@ -0,0 +1,209 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from constants import *
+from spatial import NeighborIndex
+from profiler import PROFILER
+import utils
+from utils import log_world_event, log_performance, get_default_parameters
+
+
+class Tank:
+    """1つの水槽で複数の群れを動かす（群れごとにパラメータを持ち、他の群れのメダカを避ける）
+
+    ティックごとに全ての群れのメダカをまとめた近傍検索のセルリストを1つ作り、群れをまたぐ回避の組を
+    全体で1回の半径検索で求める（群れの数だけ総当たりしない）。回避の力を向きに加えた後、
+    各群れは自分の乱数生成器と状態だけを使うため、スレッドプールで並行に更新しても結果は変わらない。
+    """
+
+    def __init__(self, max_workers=None):
+        self.schools = []
+        self.params = []   # 群れごとのupdate_all_fishに渡すパラメータ（schoolsと同じ順）
+        self.colors = []   # 群れごとの色（オス, メス）
+        self.selected = 0  # 画面で操作している群れ
+        self.max_workers = max_workers
+        self.neighbor_index = None  # 直近のティックで作った全ての群れのセルリスト
+        self.school_of = np.empty(0, dtype=np.int64)  # セルリスト上の位置 -> 群れの番号
+        self.ticks = 0
+        self._executor = None
+        self.logger = logging.getLogger('FishSimulator.Tank')
+
+    def add_school(self, school, params=None, colors=None):
+        """群れを追加し、その番号を返す（params省略時は初期値、colors省略時はSCHOOL_COLORSから順に割り当てる）"""
+        if self.schools and school.world_size != self.schools[0].world_size:
+            raise ValueError(f"All schools must share the world size {self.schools[0].world_size}, got {school.world_size}")
+        school_params = get_default_parameters()
+        school_params.update({'avoid_weight': AVOID_WEIGHT, 'avoid_range': AVOID_RANGE})
+        school_params.update(params or {})
+        self.schools.append(school)
+        self.params.append(school_params)
+        self.colors.append(colors or SCHOOL_COLORS[(len(self.schools) - 1) % len(SCHOOL_COLORS)])
+        self.logger.info(f"School {len(self.schools) - 1} added with {school.get_fish_count()} fish: {school_params}")
+        log_world_event("TANK_SCHOOL_ADDED", f"School {len(self.schools) - 1}: {school.get_fish_count()} fish")
+        return len(self.schools) - 1
+
+    def get_selected_school(self):
+        return self.schools[self.selected]
+
+    def select_next(self):
+        """操作する群れを次に切り替え、その番号を返す"""
+        self.selected = (self.selected + 1) % len(self.schools)
+        return self.selected
+
+    def get_fish_count(self):
+        """全ての群れのメダカの数"""
+        return sum(school.get_fish_count() for school in self.schools)
+
+    def build_neighbor_index(self):
+        """全ての群れのメダカの位置から近傍検索のセルリストを作る（位置は群れの順に連結する）"""
+        states = [school.get_state_arrays() for school in self.schools]
+        counts = [len(state['x']) for state in states]
+        x = np.concatenate([np.asarray(state['x'], dtype=np.float64) for state in states]) if states else np.empty(0)
+        y = np.concatenate([np.asarray(state['y'], dtype=np.float64) for state in states]) if states else np.empty(0)
+        self.school_of = np.repeat(np.arange(len(self.schools)), counts)
+        width, height = self.schools[0].world_size if self.schools else (WORLD_WIDTH, WORLD_HEIGHT)
+        self.neighbor_index = NeighborIndex(x, y, width=width, height=height)
+        return self.neighbor_index
+
+    def compute_avoidance(self):
+        """他の群れのメダカから離れる力を、群れごとの(力x, 力y)の配列のリストで返す
+
+        各メダカは自分の群れのavoid_range以内にいる他の群れのメダカから、距離によらない単位ベクトルで離れ、
+        その合計に自分の群れのavoid_weightを掛ける。
+        """
+        index = self.build_neighbor_index()
+        count = len(index)
+        force_x = np.zeros(count)
+        force_y = np.zeros(count)
+        ranges = np.array([params.get('avoid_range', AVOID_RANGE) for params in self.params], dtype=np.float64)
+        weights = np.array([params.get('avoid_weight', AVOID_WEIGHT) for params in self.params], dtype=np.float64)
+        if count and len(self.schools) > 1 and ranges.max() > 0 and weights.any():
+            for i_idx, j_idx, distances in index.radius_pairs(ranges.max()):
+                mask = ((self.school_of[i_idx] != self.school_of[j_idx]) & (distances > 0)
+                        & (distances <= ranges[self.school_of[i_idx]]))
+                i_idx, j_idx, distances = i_idx[mask], j_idx[mask], distances[mask]
+                # 端をまたいだ相手は近い方向にいるものとして扱う
+                rel_x = index.x[j_idx] - index.x[i_idx]
+                rel_y = index.y[j_idx] - index.y[i_idx]
+                rel_x -= index.width * np.round(rel_x / index.width)
+                rel_y -= index.height * np.round(rel_y / index.height)
+                force_x += np.bincount(i_idx, weights=-rel_x / distances, minlength=count)
+                force_y += np.bincount(i_idx, weights=-rel_y / distances, minlength=count)
+            force_x *= weights[self.school_of]
+            force_y *= weights[self.school_of]
+        bounds = np.cumsum([school.get_fish_count() for school in self.schools])[:-1]
+        return list(zip(np.split(force_x, bounds), np.split(force_y, bounds)))
+
+    def _update_school(self, number):
+        self.schools[number].update_all_fish(self.params[number])
+
+    def step(self):
+        """全ての群れを1ティック進める（回避の力をティック開始時の位置から求めてから、各群れを並行に更新）"""
+        start_time = time.time()
+        search_start = time.perf_counter()
+        forces = self.compute_avoidance()
+        for school, (force_x, force_y) in zip(self.schools, forces):
+            school.steer(force_x, force_y)
+        PROFILER.add('neighbors', time.perf_counter() - search_start)
+
+        if len(self.schools) > 1 and self.max_workers != 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers or len(self.schools),
+                                                    thread_name_prefix='TankWorker')
+            # 例外はresultで呼び出し側に伝える
+            for future in [self._executor.submit(self._update_school, number) for number in range(len(self.schools))]:
+                future.result()
+        else:
+            for number in range(len(self.schools)):
+                self._update_school(number)
+        self.ticks += 1
+
+        duration = time.time() - start_time
+        log_performance("Tank step", duration)
+        if utils.TRACE_ENABLED:
+            self.logger.debug(f"Tank tick {self.ticks}: {len(self.schools)} schools, {self.get_fish_count()} fish in {duration:.4f}s")
+
+    def draw_all_fish(self, screen, camera=None):
+        """全ての群れを、それぞれの色で描画"""
+        from renderer import FishRenderer
+        for school, colors in zip(self.schools, self.colors):
+            if school.renderer is None:
+                school.renderer = FishRenderer(colors=colors)
+            school.draw_all_fish(screen, camera)
+
+    def status_lines(self):
+        """画面に表示する群れごとの状態（操作中の群れに印を付ける）"""
+        lines = []
+        for number, (school, params) in enumerate(zip(self.schools, self.params)):
+            mark = '>' if number == self.selected else ' '
+            lines.append(f"{mark} School {number + 1}/{len(self.schools)}: {school.get_fish_count()} fish, "
+                         f"density {school.get_school_density():.3f}, avoid {params.get('avoid_weight', AVOID_WEIGHT):.1f}"
+                         f"@{params.get('avoid_range', AVOID_RANGE)}")
+        return lines
+
+    def close(self):
+        """並行更新用のスレッドプールを終了"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def run_tank(world, tank):
+    """複数の群れを1つの画面で動かす（TABで操作する群れを切り替え、パラメータのキーはその群れに効く。worldは初期化済み）"""
+    logger = logging.getLogger('FishSimulator.Tank')
+    world.set_parameters(tank.params[tank.selected])
+
+    frame_count = 0
+    start_time = time.time()
+    last_stats_time = start_time
+    try:
+        while True:
+            loop_start_time = time.time()
+            event_result = world.handle_events()
+            if event_result == False:
+                logger.info("Game loop terminated by user")
+                break
+            elif isinstance(event_result, tuple) and event_result[0] == "select_school":
+                number = tank.select_next()
+                world.set_parameters(tank.params[number])
+                logger.info(f"School {number} selected")
+            elif isinstance(event_result, tuple) and event_result[0] == "add_fish":
+                _, x, y = event_result
+                tank.get_selected_school().add_fish(x, y)
+                logger.info(f"Fish added to school {tank.selected} at position ({x}, {y})")
+            elif isinstance(event_result, tuple) and event_result[0] == "reset_positions":
+                for school in tank.schools:
+                    school.reset_fish_positions()
+                logger.info(f"Fish positions reset for {tank.get_fish_count()} fish")
+            elif isinstance(event_result, tuple) and event_result[0] in ("save_checkpoint", "load_checkpoint"):
+                logger.warning("Checkpoints are not supported with multiple schools")
+            # 画面のパラメータは操作中の群れにだけ反映する（回避の設定などは残す）
+            tank.params[tank.selected].update(world.get_simulation_parameters())
+            tank.step()
+
+            selected = tank.get_selected_school()
+            world.draw_background()
+            tank.draw_all_fish(world.screen, world.camera)
+            world.draw_info(selected)
+            world.draw_vision_areas(selected)
+            world.draw_school_center(selected)
+            world.draw_status_lines(tank.status_lines() + ["TAB - Select School"])
+            world.update_display()
+            PROFILER.add('frame', time.time() - loop_start_time)
+            world.tick()
+            PROFILER.end_frame()
+
+            frame_count += 1
+            current_time = time.time()
+            if current_time - last_stats_time >= 1.0:
+                print(f"FPS: {world.get_fps():.1f}, 経過時間: {current_time - start_time:.1f}秒, "
+                      f"群れ: {len(tank.schools)}, メダカ数: {tank.get_fish_count()}")
+                logger.info(f"Frame {frame_count}: FPS={world.get_fps():.1f}, Schools={len(tank.schools)}, "
+                            f"Fish={tank.get_fish_count()}")
+                last_stats_time = current_time
+            if frame_count % 60 == 0:
+                log_performance("Tank loop", time.time() - loop_start_time)
+    finally:
+        tank.close()
+    return frame_count
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+秩序変数（analytics）のテストスクリプト
+"""
+
+import sys
+import os
+import csv
+import json
+import tempfile
+import numpy as np
+sys.path.append(os.path.dirname(__file__))
+
+from analytics import SchoolAnalytics, cluster_labels, compute_analytics, density_histogram, polarization
+from array_school import ArraySchool
+
+def _mill(center_x, center_y, radius, count):
+    """中心の周りを反時計回りに回る円周上のメダカ"""
+    angle = np.linspace(0.0, 2 * np.pi, count, endpoint=False)
+    x = center_x + radius * np.cos(angle)
+    y = center_y + radius * np.sin(angle)
+    return x, y, -np.sin(angle), np.cos(angle)
+
+def test_polarization_and_milling():
+    """揃った群れは分極1、回転する群れ（世界の端をまたぐものを含む）は回転の強さが1に近いことをテスト"""
+    assert np.isclose(polarization(np.ones(50), np.zeros(50)), 1.0)
+    first, second = _mill(400.0, 300.0, 60.0, 60), _mill(1590.0, 450.0, 60.0, 60)
+    x, y, dx, dy = (np.concatenate(pair) for pair in zip(first, second))
+    result = compute_analytics(x % 1600, y % 900, dx, dy, 1600, 900)
+    assert result['clusters'] == 2 and result['largest_cluster'] == 60
+    assert result['angular_momentum'] > 0.99 and result['polarization'] < 0.1
+    assert np.isclose(result['nn_median'], 2 * 60.0 * np.sin(np.pi / 60))
+    assert result['nn_histogram'].sum() == 120 and result['isolated'] == 0.0
+
+def test_cluster_labels_wrap_around_edges():
+    """端をまたいでつながるメダカを1つの集まりにし、大きい集まりほど小さい番号を付けることをテスト"""
+    x = np.array([5.0, 1590.0, 1575.0, 800.0, 810.0, 300.0])
+    y = np.array([10.0, 10.0, 890.0, 450.0, 450.0, 100.0])
+    labels = cluster_labels(x, y, 1600, 900, link_distance=30)
+    assert labels.tolist() == [0, 0, 0, 1, 1, 2]
+
+def test_density_histogram_counts_every_fish():
+    """密度のヒストグラムの合計がメダカの数になることをテスト"""
+    school = ArraySchool(500, seed=4)
+    state = school.get_state_arrays()
+    density = density_histogram(state['x'], state['y'], *school.world_size, bins=(16, 9))
+    assert density.shape == (16, 9) and density.sum() == 500
+
+def test_interval_sampling_and_export():
+    """intervalティックごとにだけ計算し、CSVとJSONに書き出せることをテスト"""
+    school = ArraySchool(200, seed=5)
+    analytics = SchoolAnalytics(interval=3)
+    results = [analytics.observe(school) for tick in range(7)]
+    assert [result is not None for result in results] == [False, False, True, False, False, True, False]
+    assert [row['tick'] for row in analytics.history] == [3, 6]
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'analytics.csv')
+        json_path = os.path.join(directory, 'analytics.json')
+        analytics.export(csv_path)
+        analytics.export(json_path)
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        with open(json_path, encoding='utf-8') as f:
+            report = json.load(f)
+    assert [int(row['count']) for row in rows] == [200, 200]
+    assert len(report['history']) == 2 and np.array(report['latest']['density']).sum() == 200
+
+def test_headless_analytics():
+    """ヘッドレス実行の--analyticsで時系列を書き出せることをテスト"""
+    from headless import main
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'analytics.json')
+        main(['--fish', '50', '--ticks', '20', '--seed', '1', '--engine', 'numpy',
+              '--analytics', path, '--analytics-every', '5'])
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+    assert [row['tick'] for row in report['history']] == [5, 10, 15, 20]
+
+if __name__ == "__main__":
+    test_polarization_and_milling()
+    test_cluster_labels_wrap_around_edges()
+    test_density_histogram_counts_every_fish()
+    test_interval_sampling_and_export()
+    test_headless_analytics()
+    print("テスト成功")
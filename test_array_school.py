@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+NumPy配列版の群れ（ArraySchool）のテストスクリプト
+"""
+
+import sys
+import os
+import math
+sys.path.append(os.path.dirname(__file__))
+
+from array_school import ArraySchool
+from school import School
+from constants import SCREEN_WIDTH, SCREEN_HEIGHT
+
+PARAMS = {
+    'separation_weight': 1.5,
+    'alignment_weight': 1.0,
+    'cohesion_weight': 0.8,
+    'random_weight': 0.0,
+    'inertia_weight': 20.0,
+    'fish_speed': 20,
+    'vision_range': 100
+}
+
+def _copy_to_school(array_school):
+    """ArraySchoolと同じ状態のFishを持つSchoolを作成"""
+    school = School(array_school.get_fish_count())
+    for fish, view in zip(school.fish_list, array_school.get_all_fish()):
+        fish.x, fish.y, fish.dx, fish.dy = view.x, view.y, view.dx, view.dy
+    return school
+
+def test_vectorized_step_matches_fish_update():
+    """ベクトル演算の1ティックがFishの計算（ティック開始時の状態を参照）と一致することをテスト"""
+    array_school = ArraySchool(400)
+    school = _copy_to_school(array_school)
+
+    expected = []
+    for fish in school.fish_list:
+        nearby_fish = school._scan_fish_in_vision(fish, PARAMS['vision_range'])
+        sep_x, sep_y = fish.calculate_separation(nearby_fish)
+        align_x, align_y = fish.calculate_alignment(nearby_fish)
+        coh_x, coh_y = fish.calculate_cohesion(nearby_fish)
+        new_dx = sep_x * 1.5 + align_x * 1.0 + coh_x * 0.8 + fish.dx * 20.0
+        new_dy = sep_y * 1.5 + align_y * 1.0 + coh_y * 0.8 + fish.dy * 20.0
+        length = math.sqrt(new_dx**2 + new_dy**2)
+        if length > 0:
+            new_dx, new_dy = new_dx / length, new_dy / length
+        else:
+            new_dx, new_dy = fish.dx, fish.dy
+        expected.append((new_dx, new_dy))
+
+    array_school.update_all_fish(PARAMS)
+
+    for view, (new_dx, new_dy) in zip(array_school.get_all_fish(), expected):
+        assert math.isclose(view.dx, new_dx, abs_tol=1e-9)
+        assert math.isclose(view.dy, new_dy, abs_tol=1e-9)
+        assert 0 <= view.x < SCREEN_WIDTH and 0 <= view.y < SCREEN_HEIGHT
+        assert view.age == 1
+
+def test_views_add_and_remove():
+    """Fish互換ビューと追加・削除をテスト"""
+    array_school = ArraySchool(10)
+    array_school.add_fish(100, 200)
+    assert array_school.get_fish_count() == 11
+    last = array_school.get_all_fish()[-1]
+    assert last.get_position() == (100.0, 200.0)
+    assert last.gender in ('male', 'female')
+
+    first_id = array_school.get_all_fish()[0].id
+    array_school.remove_fish(array_school.get_all_fish()[0])
+    assert array_school.get_fish_count() == 10
+    assert first_id not in [fish.id for fish in array_school.get_all_fish()]
+
+    stats = array_school.get_school_statistics()
+    assert stats['count'] == 10
+    assert math.isclose(stats['gender_ratio']['male'] + stats['gender_ratio']['female'], 1.0)
+
+if __name__ == "__main__":
+    test_vectorized_step_matches_fish_update()
+    test_views_add_and_remove()
+    print("テスト成功")
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+ベンチマークスイートのテストスクリプト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from benchmark import run_benchmarks, compare_results
+
+def test_run_and_compare_benchmarks():
+    """結果の形式と基準値との比較をテスト"""
+    results = run_benchmarks(sizes=[30], engines=['python', 'numpy'],
+                             names=['update_all_fish', 'get_school_statistics'], repeat=2, budget=0.5)
+    assert len(results) == 4
+    assert {row['engine'] for row in results} == {'python', 'numpy'}
+    assert all(row['fish'] == 30 and row['median'] > 0 for row in results)
+
+    # 基準値の半分の速さになった項目だけが検出される
+    baseline = [dict(row) for row in results]
+    slower = [dict(row, median=row['median'] * 2) for row in results[:1]] + results[1:]
+    regressions = compare_results(slower, baseline, tolerance=0.25)
+    assert [(row['name'], row['engine']) for row in regressions] == [(results[0]['name'], results[0]['engine'])]
+    assert compare_results(results, baseline) == []
+
+if __name__ == "__main__":
+    test_run_and_compare_benchmarks()
+    print("テスト成功")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+表示範囲（Camera）と画面より大きな世界のテストスクリプト
+"""
+
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.dirname(__file__))
+
+from camera import Camera
+from snapshot import SnapshotSchool
+from school import School
+from array_school import ArraySchool
+
+PARAMS = {
+    'separation_weight': 1.5,
+    'alignment_weight': 1.0,
+    'cohesion_weight': 0.8,
+    'random_weight': 0.1,
+    'inertia_weight': 20.0,
+    'fish_speed': 20,
+    'vision_range': 100
+}
+
+def test_identity_when_world_matches_screen():
+    """世界と画面が同じ大きさなら、世界座標がそのまま画面座標になることをテスト"""
+    camera = Camera(800, 600, 800, 600)
+    screen_x, screen_y = camera.world_to_screen(np.array([0.0, 399.5, 799.0]), np.array([0.0, 300.0, 599.0]))
+    assert np.allclose(screen_x, [0.0, 399.5, 799.0]) and np.allclose(screen_y, [0.0, 300.0, 599.0])
+    assert camera.screen_to_world(10, 20) == (10, 20)
+
+def test_projection_wraps_and_culls():
+    """端をまたいだメダカをカメラに近い側に映し、画面外のメダカを除くことをテスト"""
+    camera = Camera(800, 600, 20000, 20000)
+    camera.center_x, camera.center_y = 50.0, 10000.0
+    x = np.array([19990.0, 50.0, 5000.0])
+    y = np.array([10000.0, 10100.0, 10000.0])
+    visible, screen_x, screen_y = camera.project(x, y)
+    assert visible.tolist() == [0, 1]
+    assert np.allclose(screen_x, [340.0, 400.0]) and np.allclose(screen_y, [300.0, 400.0])
+
+def test_zoom_keeps_point_under_cursor():
+    """拡大縮小してもカーソルの下の世界座標が動かず、拡大率が範囲内に収まることをテスト"""
+    camera = Camera(1600, 900, 20000, 20000)
+    before = camera.screen_to_world(1200, 200)
+    camera.zoom_at(2.0, 1200, 200)
+    assert np.allclose(camera.screen_to_world(1200, 200), before)
+    camera.zoom_at(1e-6, 0, 0)
+    assert np.isclose(camera.zoom, camera.min_zoom) and np.isclose(camera.zoom, 900 / 20000)
+    # ドラッグした方向に世界が動く（中心の世界座標は逆向きにずれる）
+    center_x = camera.center_x
+    camera.pan(90, 0)
+    assert np.isclose(camera.center_x, (center_x - 90 / camera.zoom) % 20000)
+
+def test_index_culling_matches_full_scan():
+    """セルリストから引いた候補で絞り込んでも、全件を調べたときと同じメダカが映ることをテスト（端をまたぐ表示範囲を含む）"""
+    school = ArraySchool(20000, seed=8, world_size=(20000, 20000))
+    state = school.get_state_arrays()
+    index = school.get_neighbor_index()
+    camera = Camera(1600, 900, 20000, 20000)
+    for center in ((10000.0, 10000.0), (100.0, 19950.0)):
+        camera.center_x, camera.center_y = center
+        for zoom in (1.0, 3.0):
+            camera.zoom = zoom
+            expected = camera.project(state['x'], state['y'])
+            candidates = index.query_rect(*camera.visible_rect())
+            assert len(candidates) < len(state['x'])
+            actual = camera.project(state['x'], state['y'], candidates=candidates)
+            assert np.array_equal(actual[0], expected[0]) and len(actual[0]) > 0
+            assert np.allclose(actual[1], expected[1]) and np.allclose(actual[2], expected[2])
+
+def test_interpolated_snapshot_keeps_culling_index():
+    """補間したスナップショットが、元のセルリストを位置のずれの分だけ広げて使うことをテスト"""
+    from simulation_thread import Snapshot, interpolate_snapshots
+    gender = np.zeros(2, dtype=np.int8)
+    previous = Snapshot(np.array([[100.0, 100.0, 1.0, 0.0], [5000.0, 5000.0, 1.0, 0.0]]), gender, 0, 0.0, 0,
+                        world_size=(10000, 10000))
+    latest = Snapshot(np.array([[130.0, 100.0, 1.0, 0.0], [5000.0, 5010.0, 1.0, 0.0]]), gender, 1, 1.0, 0,
+                      world_size=(10000, 10000))
+    index = latest.get_neighbor_index()
+    middle = interpolate_snapshots(previous, latest, 0.5)
+    assert middle._draw_index() == (index, 15.0)
+    assert SnapshotSchool(np.zeros((0, 4)))._draw_index() is None
+
+def test_schools_use_world_size():
+    """群れが画面ではなく世界の大きさで配置・折り返しをすることをテスト"""
+    for school in (School(200, seed=3, world_size=(5000, 4000)), ArraySchool(200, seed=3, world_size=(5000, 4000))):
+        for tick in range(3):
+            school.update_all_fish(PARAMS)
+        state = school.get_state_arrays()
+        assert state['x'].max() > 1600 and state['y'].max() > 900
+        assert (state['x'] >= 0).all() and (state['x'] < 5000).all()
+        assert (state['y'] >= 0).all() and (state['y'] < 4000).all()
+
+if __name__ == "__main__":
+    test_identity_when_world_matches_screen()
+    test_projection_wraps_and_culls()
+    test_zoom_keeps_point_under_cursor()
+    test_index_culling_matches_full_scan()
+    test_interpolated_snapshot_keeps_culling_index()
+    test_schools_use_world_size()
+    print("テスト成功")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+チェックポイントの保存・復元のテストスクリプト
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+from checkpoint import save_checkpoint, load_checkpoint
+from headless import create_school
+from utils import get_default_parameters
+
+def _run(school, params, ticks):
+    for tick in range(ticks):
+        school.update_all_fish(params)
+    return school.get_state_arrays()
+
+def test_resume_matches_uninterrupted_run():
+    """保存した時点から再開した結果が、中断しなかった場合と一致することをテスト"""
+    params = get_default_parameters()
+    params['separation_weight'] = 2.0
+    for engine in ('python', 'numpy'):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.npz')
+            school = create_school(80, engine, seed=11)
+            _run(school, params, 3)
+            school.add_fish(10, 20)
+            save_checkpoint(path, school, params, {'tick': 3})
+            expected = _run(school, params, 4)
+            assert os.listdir(directory) == ['run.npz']
+
+            restored, restored_params, header = load_checkpoint(path)
+            assert restored_params == params and header['tick'] == 3
+            assert type(restored) is type(school) and restored.get_fish_count() == 81
+            actual = _run(restored, params, 4)
+            for name in ('x', 'y', 'dx', 'dy', 'energy', 'age', 'gender', 'id'):
+                assert np.allclose(actual[name], expected[name]), (engine, name)
+
+            # 復元した群れに追加したメダカのIDは重ならない
+            restored.add_fish(0, 0)
+            ids = restored.get_state_arrays()['id']
+            assert len(set(ids.tolist())) == len(ids)
+
+def test_save_syncs_file_and_directory():
+    """保存したファイルと、置き換えたディレクトリのエントリの両方をfsyncすることをテスト"""
+    import stat
+    import checkpoint
+    synced = []
+    original_fsync = checkpoint.os.fsync
+
+    def recording_fsync(fd):
+        synced.append(stat.S_ISDIR(os.fstat(fd).st_mode))
+        original_fsync(fd)
+    checkpoint.os.fsync = recording_fsync
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            save_checkpoint(os.path.join(directory, 'run.npz'), create_school(10, 'numpy', seed=1),
+                            get_default_parameters())
+    finally:
+        checkpoint.os.fsync = original_fsync
+    assert synced == ([False] if os.name == 'nt' else [False, True])
+
+if __name__ == "__main__":
+    test_resume_matches_uninterrupted_run()
+    test_save_syncs_file_and_directory()
+    print("テスト成功")
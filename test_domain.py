@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+タイル分割・マルチプロセス版の群れ（DomainSchool）のテストスクリプト
+"""
+
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.dirname(__file__))
+
+from array_school import ArraySchool
+from domain import DomainSchool, TileLayout, tile_grid
+
+PARAMS = {
+    'separation_weight': 1.5,
+    'alignment_weight': 1.0,
+    'cohesion_weight': 0.8,
+    'random_weight': 0.1,
+    'inertia_weight': 20.0,
+    'fish_speed': 20,
+    'vision_range': 100
+}
+
+def _assert_same(first, second):
+    for name in ('x', 'y', 'dx', 'dy', 'energy', 'age', 'id'):
+        assert np.allclose(first.get_state_arrays()[name], second.get_state_arrays()[name], rtol=0, atol=1e-9), name
+
+def test_domain_matches_array_school():
+    """タイルに分けて更新してもArraySchoolと同じ結果になることをテスト（メダカの追加でワーカーを作り直した後も）"""
+    array_school = ArraySchool(400, seed=11)
+    domain_school = DomainSchool(400, seed=11, workers=4)
+    try:
+        for tick in range(6):
+            array_school.update_all_fish(PARAMS)
+            domain_school.update_all_fish(PARAMS)
+        _assert_same(array_school, domain_school)
+
+        array_school.add_fish(800, 450)
+        domain_school.add_fish(800, 450)
+        for tick in range(2):
+            array_school.update_all_fish(dict(PARAMS, vision_range=60))
+            domain_school.update_all_fish(dict(PARAMS, vision_range=60))
+        _assert_same(array_school, domain_school)
+    finally:
+        domain_school.close()
+    # 止めた後も状態は読める
+    assert domain_school.get_fish_count() == 401
+
+def test_fish_migrate_across_wrapped_tiles():
+    """画面端をまたいで隣のタイルに移ったメダカを、移った先のタイルが担当することをテスト"""
+    school = DomainSchool(2, seed=0, workers=2)
+    try:
+        school.x[:] = (1595.0, 10.0)
+        school.y[:] = (450.0, 200.0)
+        school.dx[:] = (1.0, 0.0)
+        school.dy[:] = (0.0, -1.0)
+        school.invalidate_statistics()
+        domain = school._domain
+        assert domain.layout.columns == 2
+        assert domain.tile_members(0).tolist() == [1] and domain.tile_members(1).tolist() == [0]
+
+        school.update_all_fish(dict(PARAMS, random_weight=0.0))
+        assert 0 <= school.x[0] < 800
+        assert domain.arrays['offsets'].tolist() == [0, 2, 2]
+        assert domain.tile_members(0).tolist() == [0, 1] and len(domain.tile_members(1)) == 0
+    finally:
+        school.close()
+
+def test_tile_layout():
+    """タイルの分け方・ハローの計算をテスト"""
+    assert tile_grid(4) == (2, 2)
+    assert tile_grid(3, 1600, 900) == (3, 1)
+    layout = TileLayout(4, 2)
+    assert layout.tile_of(np.array([0.0, 399.9, 400.0, 1599.9]), np.array([0.0, 449.9, 450.0, 899.9])).tolist() == [0, 0, 3, 7]
+    # 視界は端で折り返さない
+    assert layout.halo_tiles(0, 110) == [1, 2, 3]
+
+if __name__ == "__main__":
+    test_domain_matches_array_school()
+    test_fish_migrate_across_wrapped_tiles()
+    test_tile_layout()
+    print("テスト成功")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+メダカクラス（__slots__・性別コード・ID）のテストスクリプト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from fish import Fish
+from school import School
+from benchmark import measure_memory
+
+def test_compact_fish():
+    """__dict__を持たず、性別はコードで保持しつつ文字列でも読み書きできることをテスト"""
+    fish = Fish(10, 20, 3, 4)
+    assert not hasattr(fish, '__dict__')
+    assert fish.get_position() == (10, 20) and fish.get_direction() == (0.6, 0.8)
+
+    fish.gender = 'female'
+    assert fish.gender_code == 1 and fish.gender == 'female'
+    fish.gender_code = 0
+    assert fish.gender == 'male'
+
+def test_fish_ids_are_not_reused():
+    """削除したメダカのIDが新しいメダカに再利用されないことをテスト"""
+    school = School(20, seed=1)
+    removed_ids = set()
+    for round in range(5):
+        fish = school.fish_list[0]
+        removed_ids.add(fish.id)
+        school.remove_fish(fish)
+        school.add_fish()
+    ids = [fish.id for fish in school.fish_list]
+    assert len(set(ids)) == len(ids)
+    assert not removed_ids & set(ids)
+
+def test_measure_memory():
+    """メダカ1匹あたりのメモリ使用量を測れることをテスト"""
+    rows = measure_memory(sizes=[1000], engines=['python', 'numpy'])
+    assert [row['engine'] for row in rows] == ['python', 'numpy']
+    assert all(0 < row['bytes_per_fish'] < 1000 for row in rows)
+
+if __name__ == "__main__":
+    test_compact_fish()
+    test_fish_ids_are_not_reused()
+    test_measure_memory()
+    print("テスト成功")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+ヘッドレス実行のテストスクリプト
+"""
+
+import sys
+import os
+import subprocess
+sys.path.append(os.path.dirname(__file__))
+
+from headless import create_school, run_headless
+from utils import get_default_parameters
+
+def test_run_headless():
+    """指定回数だけ更新してticks/secを返すことをテスト"""
+    for engine in ('python', 'numpy'):
+        school = create_school(20, engine)
+        result = run_headless(school, get_default_parameters(), 5)
+        assert result['ticks'] == 5
+        assert result['fish_count'] == 20
+        assert result['ticks_per_sec'] > 0
+        assert school.get_all_fish()[0].age == 5
+
+def test_headless_does_not_import_pygame():
+    """ヘッドレス実行でpygameが読み込まれないことをテスト"""
+    code = ("import sys, headless; "
+            "headless.main(['--fish', '10', '--ticks', '2']); "
+            "sys.exit(1 if 'pygame' in sys.modules else 0)")
+    completed = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    assert 'ticks/sec' in completed.stdout
+
+if __name__ == "__main__":
+    test_run_headless()
+    test_headless_does_not_import_pygame()
+    print("テスト成功")
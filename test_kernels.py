@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+コンパイル済みカーネル（Numba）のテストスクリプト
+"""
+
+import sys
+import os
+import copy
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+import kernels
+from array_school import ArraySchool
+from utils import get_default_parameters
+
+PARAMS = dict(get_default_parameters(), random_weight=0.5)
+
+def test_kernel_logic_matches_numpy_engine():
+    """カーネルの処理（コンパイルしないPython版）がNumPyのベクトル演算と同じ結果になることをテスト"""
+    school = ArraySchool(150, seed=4)
+    x, y, dx, dy = (array.copy() for array in (school.x, school.y, school.dx, school.dy))
+    noise = copy.deepcopy(school.rng).uniform(-1, 1, size=(2, school.fish_count))
+
+    school.update_all_fish(PARAMS)
+    result = kernels.run_boids_step(kernels.boids_step, x, y, dx, dy, noise, PARAMS)
+    for actual, expected in zip(result, (school.x, school.y, school.dx, school.dy)):
+        assert np.allclose(actual, expected, rtol=0, atol=1e-9)
+
+def test_compiled_kernels_match_numpy_engine():
+    """Numbaのカーネル（逐次・並列）がNumPyのベクトル演算と同じ結果になることをテスト（Numbaが無ければNumPyに切り替わる）"""
+    reference = ArraySchool(300, seed=9)
+    schools = [ArraySchool(300, seed=9, kernel=kernel) for kernel in ('numba', 'numba_parallel')]
+    for school, kernel in zip(schools, ('numba', 'numba_parallel')):
+        assert school.kernel == (kernel if kernels.NUMBA_AVAILABLE else 'numpy')
+
+    for tick in range(3):
+        reference.update_all_fish(PARAMS)
+        for school in schools:
+            school.update_all_fish(PARAMS)
+    for school in schools:
+        for name in ('x', 'y', 'dx', 'dy', 'age', 'energy'):
+            assert np.allclose(getattr(school, name), getattr(reference, name), rtol=0, atol=1e-6)
+
+if __name__ == "__main__":
+    test_kernel_logic_matches_numpy_engine()
+    test_compiled_kernels_match_numpy_engine()
+    print("テスト成功")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+トーラス状の世界のセルリスト（近傍検索）のテストスクリプト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+from spatial import NeighborIndex
+from school import School
+from array_school import ArraySchool
+from utils import get_nearest_fish, distance_in_torus
+from constants import *
+
+def _brute_force(x, y, i):
+    """線形走査での(距離, 位置)のリスト"""
+    return sorted((distance_in_torus(x[i], y[i], x[j], y[j], SCREEN_WIDTH, SCREEN_HEIGHT), j)
+                  for j in range(len(x)) if j != i)
+
+def test_queries_match_brute_force():
+    """半径検索・k近傍検索が線形走査と同じ結果になることをテスト（画面端での折り返しと密集した群れを含む）"""
+    rng = np.random.default_rng(5)
+    x = rng.uniform(0, SCREEN_WIDTH, 400)
+    y = rng.uniform(0, SCREEN_HEIGHT, 400)
+    x[:300] = rng.uniform(-5, 5, 300) % SCREEN_WIDTH  # 左右の端をまたぐ密集した群れ
+
+    for cell_size in (7, NEIGHBOR_CELL_SIZE, 1000):
+        index = NeighborIndex(x, y, cell_size)
+        nearby = index.query_radius(60)
+        nearest, distances = index.query_nearest(3)
+        limited, limited_distances = index.query_nearest(2, max_distance=20)
+        for i in range(0, len(x), 9):
+            expected = _brute_force(x, y, i)
+            assert nearby[i].tolist() == sorted(j for d, j in expected if d <= 60)
+            assert nearest[i].tolist() == [j for d, j in expected[:3]]
+            within = [j for d, j in expected if d <= 20][:2]
+            assert limited[i].tolist() == within + [-1] * (2 - len(within))
+
+def test_school_batch_queries():
+    """まとめて検索した結果が1匹ずつの検索と一致することをテスト"""
+    for school in (School(120, seed=6), ArraySchool(120, seed=6)):
+        fish_list = school.get_all_fish()
+        expected_nearby = [school.get_nearby_fish(fish, 80) for fish in fish_list]
+        expected_nearest = [get_nearest_fish(fish, fish_list, 40) for fish in fish_list]
+
+        assert school.get_all_nearby_fish(80) == expected_nearby
+        assert school.get_all_nearest_fish(40) == expected_nearest
+        # セルリストの作成後は1匹ずつの検索もセルリストを使う
+        assert [school.get_nearby_fish(fish, 80) for fish in fish_list] == expected_nearby
+
+    school = School(60, seed=7)
+    index = school.get_neighbor_index()
+    for fish in school.fish_list:
+        assert get_nearest_fish(fish, school.fish_list, neighbor_index=index) is get_nearest_fish(fish, school.fish_list)
+
+    # 状態が変わるとセルリストは作り直される
+    school.update_all_fish()
+    assert school.get_neighbor_index() is not index
+
+if __name__ == "__main__":
+    test_queries_match_brute_force()
+    test_school_batch_queries()
+    print("テスト成功")
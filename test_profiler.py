@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+段階ごとのプロファイラのテストスクリプト
+"""
+
+import sys
+import os
+import csv
+import json
+import tempfile
+sys.path.append(os.path.dirname(__file__))
+
+from profiler import Profiler, PROFILER
+from headless import create_school, run_headless
+from utils import get_default_parameters
+
+def test_rolling_percentiles_and_export():
+    """1フレーム内の加算・直近windowフレームのパーセンタイル・JSON/CSV出力をテスト"""
+    profiler = Profiler(window=100)
+    profiler.add('update', 1.0)
+    profiler.end_frame()
+    assert profiler.frames == 0 and profiler.summary() == {}  # 無効なら何も記録しない
+
+    profiler.enabled = True
+    for frame in range(300):
+        # 同じフレーム内の加算は1サンプルにまとまる
+        profiler.add('update', frame / 2000)
+        profiler.add('update', frame / 2000)
+        with profiler.stage('flip'):
+            pass
+        profiler.end_frame()
+    stats = profiler.summary()
+    assert list(stats) == ['update', 'flip']
+    # 直近100フレーム（200-299ms）だけが残る
+    assert stats['update']['count'] == 100
+    assert abs(stats['update']['p50_ms'] - 249.5) < 1e-6 and abs(stats['update']['max_ms'] - 299) < 1e-6
+    assert stats['update']['p50_ms'] < stats['update']['p95_ms'] < stats['update']['p99_ms']
+
+    with tempfile.TemporaryDirectory() as directory:
+        profiler.export(os.path.join(directory, 'profile.json'))
+        with open(os.path.join(directory, 'profile.json'), encoding='utf-8') as f:
+            report = json.load(f)
+        assert report['frames'] == 300 and report['stages']['update']['count'] == 100
+        profiler.export(os.path.join(directory, 'profile.csv'))
+        with open(os.path.join(directory, 'profile.csv'), encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        assert [row['stage'] for row in rows] == ['update', 'flip']
+
+def test_headless_run_records_stages():
+    """有効なときは群れの更新が近傍検索・更新・統計の段階に分けて記録されることをテスト"""
+    PROFILER.reset()
+    PROFILER.enabled = True
+    try:
+        for engine in ('python', 'numpy'):
+            run_headless(create_school(50, engine, seed=2), get_default_parameters(), 5)
+        stats = PROFILER.summary()
+        assert {'neighbors', 'update', 'stats', 'frame'} <= set(stats)
+        assert stats['frame']['count'] == 10
+    finally:
+        PROFILER.enabled = False
+        PROFILER.reset()
+
+def test_overlay_restores_previous_state():
+    """Oキーで表示している間だけ計測し、隠すと表示前の状態（--profile指定時は有効のまま）に戻すことをテスト"""
+    import pygame
+    from world import World
+    key_o = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_o, mod=0)
+    try:
+        for enabled in (False, True):
+            PROFILER.enabled = enabled
+            world = World()
+            world._handle_keydown_event(key_o)
+            assert world.show_profiler and PROFILER.enabled
+            world._handle_keydown_event(key_o)
+            assert not world.show_profiler and PROFILER.enabled == enabled
+    finally:
+        PROFILER.enabled = False
+        PROFILER.reset()
+
+if __name__ == "__main__":
+    test_rolling_percentiles_and_export()
+    test_headless_run_records_stages()
+    test_overlay_restores_previous_state()
+    print("テスト成功")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+まとめて描画するレンダラーのテストスクリプト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+import pygame
+from renderer import FishRenderer, choose_lod
+from camera import Camera
+from school import School
+from constants import *
+
+def test_batched_drawing_matches_fish_draw():
+    """スプライトでの描画がFish.drawと同じ位置・色になることをテスト"""
+    school = School(2, seed=0)
+    for fish, (x, y, dx, dy, gender) in zip(school.fish_list, [(100, 100, 1, 0, 'male'), (300, 200, 0, -1, 'female')]):
+        fish.x, fish.y, fish.dx, fish.dy, fish.gender = x, y, dx, dy, gender
+
+    batched = pygame.Surface((400, 300))
+    school.draw_all_fish(batched)
+    reference = pygame.Surface((400, 300))
+    for fish in school.fish_list:
+        fish.draw(reference)
+
+    # 三角形の内部は同じ色、離れた場所は背景のまま
+    assert batched.get_at((103, 100)) == reference.get_at((103, 100)) == LIGHT_BLUE
+    assert batched.get_at((300, 197)) == reference.get_at((300, 197)) == BLUE
+    assert batched.get_at((200, 150)) == BLACK
+
+    # 画面の端にはみ出すメダカも描画できる
+    FishRenderer().draw(batched, [0, 399], [0, 299], [1, -1], [1, 0], [0, 1])
+
+def test_level_of_detail():
+    """拡大率と混み具合で三角形・点・ヒートマップを切り替え、点とヒートマップがメダカの位置だけを塗ることをテスト"""
+    assert choose_lod(100, 1.0, 1600 * 900) == 'sprites'
+    assert choose_lod(100, 0.1, 1600 * 900) == 'points'
+    assert choose_lod(50000, 1.0, 1600 * 900) == 'points'
+    assert choose_lod(1000000, 1.0, 1600 * 900) == 'heatmap'
+
+    renderer = FishRenderer()
+    surface = pygame.Surface((400, 300))
+    renderer.draw(surface, [10.5, 399.0, -3.0], [20.0, 299.0, 5.0], None, None, [0, 1, 0], lod='points')
+    assert surface.get_at((10, 20)) == LIGHT_BLUE and surface.get_at((399, 299)) == BLUE
+    assert surface.get_at((11, 20)) == BLACK
+
+    surface.fill(BLACK)
+    renderer.draw(surface, [10.0, 11.0, 12.0, 200.0], [10.0, 10.0, 10.0, 200.0], None, None, lod='heatmap')
+    dense, sparse = surface.get_at((9, 9)), surface.get_at((201, 201))
+    assert sum(dense[:3]) > sum(sparse[:3]) > 0
+    assert surface.get_at((100, 100)) == BLACK
+
+def test_camera_drawing_switches_to_points_when_zoomed_out():
+    """大きな世界を縮小して映すと点で描き、拡大すると三角形で描くことをテスト"""
+    school = School(200, seed=1, world_size=(6400, 3600))
+    camera = Camera(1600, 900, 6400, 3600)
+    surface = pygame.Surface((1600, 900))
+    camera.fit()
+    school.draw_all_fish(surface, camera)
+    assert school.renderer.last_lod == 'points'
+    camera.reset()
+    school.draw_all_fish(surface, camera)
+    assert school.renderer.last_lod == 'sprites'
+
+def test_index_culling_gathers_only_candidates():
+    """セルリストがあれば全員の状態を作らずに候補だけを集め、全員を調べたときと同じ絵を描くことをテスト"""
+    school = School(3000, seed=2, world_size=(4000, 4000))
+    camera = Camera(1600, 900, 4000, 4000)
+    camera.center_x, camera.center_y = 3900.0, 100.0
+    reference = pygame.Surface((1600, 900))
+    school.draw_all_fish(reference, camera)
+    school.get_neighbor_index()
+
+    def full_scan():
+        raise AssertionError("get_state_arrays should not be called")
+    school.get_state_arrays = full_scan
+    culled = pygame.Surface((1600, 900))
+    school.draw_all_fish(culled, camera)
+    assert school.renderer.last_lod == 'sprites'
+    pixels = pygame.image.tobytes(culled, 'RGB')
+    assert any(pixels) and pixels == pygame.image.tobytes(reference, 'RGB')
+
+if __name__ == "__main__":
+    test_batched_drawing_matches_fish_draw()
+    test_level_of_detail()
+    test_camera_drawing_switches_to_points_when_zoomed_out()
+    test_index_culling_gathers_only_candidates()
+    print("テスト成功")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+軌跡ファイルの再生のテストスクリプト
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+import pygame
+from replay import ReplaySchool, ReplayPlayer
+from trajectory import TrajectoryWriter, TrajectoryReader
+from headless import create_school
+from utils import get_default_parameters
+from constants import *
+
+def test_replay_player():
+    """シーク・一時停止・再生速度・コマ飛ばしと、記録した状態の表示をテスト"""
+    params = get_default_parameters()
+    school = create_school(50, 'numpy', seed=4)
+    centers = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.traj')
+        with TrajectoryWriter(path, 50, params, seed=4, dtype='float64') as writer:
+            for tick in range(100):
+                school.update_all_fish(params)
+                writer.append(school)
+                centers.append(school.get_school_center())
+
+        reader = TrajectoryReader(path)
+        replay = ReplaySchool(reader)
+        player = ReplayPlayer(replay, fps=FPS, speed=1.0)
+        assert replay.get_fish_count() == 50 and replay.get_school_center() == centers[0]
+
+        # 1フレーム分の時間で1ティック、4倍速では4ティック進む（途中のティックは描画しない）
+        assert player.advance(1 / FPS) == 1
+        player.change_speed(4)
+        assert player.advance(1 / FPS) == 5
+        assert np.allclose(replay.get_school_center(), centers[5])
+
+        # 一時停止中は進まず、コマ送りとシークはできる
+        player.handle_event(("replay_pause",))
+        assert player.advance(1.0) == 5
+        player.handle_event(("replay_step", -2))
+        assert player.tick == 3 and player.paused
+        player.handle_event(("replay_seek", -1))
+        assert player.tick == 99
+        assert not player.handle_event(("add_fish", 10, 10))
+
+        # 最後まで再生すると止まり、再開すると最初から
+        player.handle_event(("replay_pause",))
+        assert player.tick == 0 and not player.paused
+        player.advance(1000.0)
+        assert player.tick == 99 and player.paused
+
+        # Schoolと同じ描画メソッドで描ける
+        surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        replay.draw_all_fish(surface)
+        fish = replay.get_all_fish()[0]
+        assert surface.get_at((int(fish.x), int(fish.y))) == LIGHT_BLUE
+        reader.close()
+
+def test_replay_does_not_create_school_or_recording():
+    """再生モードでは群れを作らず、再生中のファイルを記録で上書きしないことをテスト"""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import main
+    import replay
+    params = get_default_parameters()
+    school = create_school(20, 'numpy', seed=5)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.traj')
+        with TrajectoryWriter(path, 20, params, seed=5) as writer:
+            for tick in range(3):
+                school.update_all_fish(params)
+                writer.append(school)
+        size = os.path.getsize(path)
+        try:
+            main.parse_args(['--replay', path, '--record', path])
+        except SystemExit as e:
+            assert e.code == 2
+        else:
+            assert False, "expected SystemExit"
+
+        created, replayed = [], []
+        original_create, original_run = main.create_school, replay.run_replay
+        main.create_school = lambda *args, **kwargs: created.append(args)
+        replay.run_replay = lambda world, replay_path, speed=1.0: replayed.append(replay_path) or 0
+        try:
+            main.main(['--replay', path, '--fish', '100000', '--engine', 'domain'])
+        finally:
+            main.create_school, replay.run_replay = original_create, original_run
+        assert replayed == [path] and created == []
+        assert os.path.getsize(path) == size
+
+if __name__ == "__main__":
+    test_replay_player()
+    test_replay_does_not_create_school_or_recording()
+    print("テスト成功")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+群れの統計量の差分更新のテストスクリプト
+"""
+
+import sys
+import os
+import math
+sys.path.append(os.path.dirname(__file__))
+
+from school import School
+from array_school import ArraySchool
+from utils import get_default_parameters
+
+def _full_statistics(fish_list):
+    """全てのメダカを走査して統計量を計算する（比較用）"""
+    count = len(fish_list)
+    center_x = sum(fish.x for fish in fish_list) / count
+    center_y = sum(fish.y for fish in fish_list) / count
+    avg_distance = sum(math.hypot(fish.x - center_x, fish.y - center_y) for fish in fish_list) / count
+    return {
+        'count': count,
+        'center': (center_x, center_y),
+        'density': 1.0 / (avg_distance + 1),
+        'avg_energy': sum(fish.energy for fish in fish_list) / count,
+        'avg_age': sum(fish.age for fish in fish_list) / count,
+        'male': sum(1 for fish in fish_list if fish.gender == 'male') / count
+    }
+
+def _assert_matches(school):
+    stats = school.get_school_statistics()
+    expected = _full_statistics(school.get_all_fish())
+    assert stats['count'] == expected['count']
+    assert all(math.isclose(a, b, rel_tol=1e-9) for a, b in zip(stats['center'], expected['center']))
+    for key in ('density', 'avg_energy', 'avg_age'):
+        assert math.isclose(stats[key], expected[key], rel_tol=1e-9)
+    assert math.isclose(stats['gender_ratio']['male'], expected['male'])
+
+def test_incremental_statistics_match_full_scan():
+    """更新・追加・削除・リセット後も差分更新の統計量が全体の計算と一致することをテスト"""
+    params = get_default_parameters()
+    for school in (School(80, seed=4), ArraySchool(80, seed=4)):
+        _assert_matches(school)
+        for tick in range(3):
+            school.update_all_fish(params)
+        _assert_matches(school)
+
+        school.add_fish(10, 20)
+        school.remove_fish(school.get_all_fish()[5])
+        _assert_matches(school)
+
+        school.reset_fish_positions()
+        _assert_matches(school)
+
+def test_density_is_cached_until_state_changes():
+    """密度は状態が変わるまで再計算されないことをテスト"""
+    school = School(50, seed=2)
+    density = school.get_school_density()
+    school.fish_list[0].x += 100  # 直接書き換えた変更は反映されない
+    assert school.get_school_density() == density
+
+    school.invalidate_statistics()
+    assert school.get_school_density() != density
+    _assert_matches(school)
+
+def test_empty_school_center_uses_world_size():
+    """空の群れの中心と統計量が、定数ではなく群れ自身の世界の中央になることをテスト"""
+    school = School(3, seed=1, world_size=(4000, 3000))
+    for fish in list(school.get_all_fish()):
+        school.remove_fish(fish)
+    assert school.get_school_center() == (2000, 1500)
+    assert school.get_school_statistics()['center'] == (2000, 1500)
+
+    school.invalidate_statistics()  # 計算し直しても世界の大きさは保たれる
+    assert school.statistics.center() == (2000, 1500)
+
+if __name__ == "__main__":
+    test_incremental_statistics_match_full_scan()
+    test_density_is_cached_until_state_changes()
+    test_empty_school_center_uses_world_size()
+    print("テスト成功")
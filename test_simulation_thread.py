@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+シミュレーションスレッドとスナップショット補間のテストスクリプト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+import time
+import numpy as np
+import kernels
+from simulation_thread import SimulationThread, Snapshot, interpolate_snapshots
+from headless import create_school
+from school import School
+from utils import get_default_parameters
+
+def test_thread_matches_direct_updates():
+    """別スレッドで進めた結果が同じシードで直接更新した結果と一致し、操作がティックの合間に反映されることをテスト"""
+    params = get_default_parameters()
+    direct = create_school(100, 'numpy', seed=6)
+    direct.add_fish(50, 60)
+    for tick in range(5):
+        direct.update_all_fish(params)
+
+    simulation = SimulationThread(create_school(100, 'numpy', seed=6), params, tick_rate=1000, max_ticks=5)
+    simulation.send(("add_fish", 50, 60))
+    simulation.start()
+    simulation.join(timeout=30)
+    assert simulation.error is None and not simulation.is_running()
+
+    snapshot = simulation.latest()
+    assert snapshot.tick == 5 and snapshot.generation == 1 and snapshot.get_fish_count() == 101
+    expected = direct.get_state_arrays()
+    actual = snapshot.get_state_arrays()
+    for name in ('x', 'y', 'dx', 'dy', 'gender'):
+        assert np.allclose(actual[name], expected[name])
+    assert snapshot.get_school_statistics()['avg_energy'] > 0
+
+def test_interpolation_wraps_around_edges():
+    """補間が画面端をまたぐ移動を短い方向に補間し、メダカの並びが変わったときは補間しないことをテスト"""
+    gender = np.zeros(2, dtype=np.int8)
+    previous = Snapshot(np.array([[795.0, 10.0, 1.0, 0.0], [100.0, 100.0, 0.0, 1.0]]), gender, 0, 0.0, 0,
+                        world_size=(800, 600))
+    latest = Snapshot(np.array([[5.0, 10.0, 1.0, 0.0], [100.0, 120.0, 0.0, 1.0]]), gender, 1, 1.0, 0,
+                      world_size=(800, 600))
+
+    middle = interpolate_snapshots(previous, latest, 0.5).get_state_arrays()
+    assert np.allclose(middle['x'], [0.0, 100.0]) and np.allclose(middle['y'], [10.0, 110.0])
+    assert interpolate_snapshots(previous, latest, 1.5) is latest
+
+    latest.generation = 1
+    assert interpolate_snapshots(previous, latest, 0.5) is latest
+
+def _render_gaps(simulation, frame_time=0.005):
+    """シミュレーションスレッドが止まるまで描画ループの代わりに短い間隔で回り、フレームの間隔を返す"""
+    simulation.start()
+    gaps = []
+    last = time.perf_counter()
+    while simulation.is_running():
+        time.sleep(frame_time)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+    assert simulation.error is None
+    return gaps
+
+def test_slow_step_does_not_stall_rendering():
+    """1ティックが遅くても、計算している間に描画ループが止まらないことをテスト（numbaのカーネルはGILを解放する）"""
+    params = get_default_parameters()
+    if kernels.NUMBA_AVAILABLE:
+        school = create_school(20000, 'numba', seed=1, world_size=(800, 600))
+        school.update_all_fish(params)  # コンパイルを済ませておく
+        start = time.perf_counter()
+        school.update_all_fish(params)
+        step_time = time.perf_counter() - start
+        gaps = _render_gaps(SimulationThread(school, params, tick_rate=1000, max_ticks=2))
+        assert max(gaps) < max(0.1, step_time / 2)
+        assert len(gaps) >= step_time / 0.05
+
+    # pure Pythonの更新はGILを持つが、インタプリタが一定間隔で描画スレッドに譲る
+    class SlowSchool(School):
+        def update_all_fish(self, params=None):
+            deadline = time.perf_counter() + 0.3
+            while time.perf_counter() < deadline:
+                pass
+    gaps = _render_gaps(SimulationThread(SlowSchool(10, seed=1), params, tick_rate=1000, max_ticks=2))
+    assert max(gaps) < 0.1 and len(gaps) >= 10
+
+if __name__ == "__main__":
+    test_thread_matches_direct_updates()
+    test_interpolation_wraps_around_edges()
+    test_slow_step_does_not_stall_rendering()
+    print("テスト成功")
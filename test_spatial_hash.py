@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+空間ハッシュによる視界検索のテストスクリプト
+"""
+
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(__file__))
+
+from school import School
+import numpy as np
+from spatial import SpatialHash, OccupancyGrid, CellGrid, get_vision_probes, vision_mask, get_vision_rays_array, rays_visible
+from constants import SCREEN_WIDTH, SCREEN_HEIGHT
+
+def test_spatial_hash_matches_scan():
+    """空間ハッシュ・占有格子の視界検索が全走査と同じ結果（順序含む）を返すことをテスト"""
+    random.seed(1234)
+    school = School(120, seed=1234)
+
+    # 密集した群れと画面端の魚も含める
+    for i in range(30):
+        school.add_fish(random.uniform(400, 440), random.uniform(300, 340))
+    school.add_fish(0, 0)
+    school.add_fish(SCREEN_WIDTH - 1, SCREEN_HEIGHT - 1)
+
+    for index_class in (SpatialHash, OccupancyGrid):
+        spatial_hash = index_class()
+        spatial_hash.rebuild(school.fish_list)
+
+        for vision_range in (10, 35, 100):
+            for fish in school.fish_list:
+                expected = school._scan_fish_in_vision(fish, vision_range)
+                actual = spatial_hash.query_vision(fish, vision_range)
+                assert actual == expected
+
+def test_update_all_fish_matches_scan():
+    """update_all_fishの結果が空間ハッシュ導入前と一致することをテスト"""
+    hashed = School(120, seed=42)
+    scanned = School(120, seed=42)
+    occupancy = School(120, seed=42, vision_backend='occupancy')
+
+    # 空間ハッシュを使わない参照実装で更新する
+    def scan_update(params):
+        for fish in scanned.fish_list:
+            nearby_fish = scanned._scan_fish_in_vision(fish, params['vision_range'])
+            fish.update(nearby_fish, params)
+
+    params = {
+        'separation_weight': 1.5,
+        'alignment_weight': 1.0,
+        'cohesion_weight': 0.8,
+        'random_weight': 0.0,
+        'inertia_weight': 20.0,
+        'fish_speed': 20,
+        'vision_range': 100
+    }
+    for tick in range(5):
+        hashed.update_all_fish(params)
+        occupancy.update_all_fish(params)
+        scan_update(params)
+
+    for a, b, c in zip(hashed.fish_list, scanned.fish_list, occupancy.fish_list):
+        assert (a.x, a.y, a.dx, a.dy) == (b.x, b.y, b.dx, b.dy) == (c.x, c.y, c.dx, c.dy)
+
+def test_vision_tables_match_visibility():
+    """チェック位置の表と視界の塗りつぶしが、視界判定（rays_visible）と同じ範囲を表すことをテスト"""
+    for dx, dy in ((1, 0), (0.6, -0.8), (-1, -1), (0, 1)):
+        probes = get_vision_probes(dx, dy, 30)
+        rays = get_vision_rays_array(np.array([dx]), np.array([dy]))[0]
+        assert probes.shape == (30, 3, 2) and (probes[4] == 5 * rays).all()
+
+        mask, reach = vision_mask(tuple(rays[0].tolist()), 30)
+        rel_x, rel_y = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1), indexing='ij')
+        visible = np.zeros(mask.shape, dtype=bool)
+        for ray_x, ray_y in rays.tolist():
+            visible |= rays_visible(rel_x, rel_y, np.full(mask.shape, ray_x), np.full(mask.shape, ray_y), 30)
+        assert (mask == visible).all()
+
+def test_cell_grid_is_sparse_in_large_world():
+    """広い世界のセルグリッドがメダカのいるセルの分だけ配列を確保し、隣のセルの組も正しく引けることをテスト"""
+    x = np.array([0.0, 6.0, 19995.0, 19990.0])
+    y = np.array([0.0, 1.0, 19995.0, 19999.0])
+    grid = CellGrid(x, y, 5)
+    assert grid.cols * grid.rows == 4000 * 4000
+    assert len(grid.cell_keys) == len(grid.counts) == len(grid.starts) == 4
+    pairs = [(int(i), int(j)) for block in grid.pairs(np.arange(4), np.ones(4, dtype=np.int64), np.zeros(4, dtype=np.int64))
+             for i, j in zip(*block)]
+    # 右隣のセルにメダカがいるのは0番（1番のセル）と3番（2番のセル）だけ
+    assert sorted(pairs) == [(0, 1), (3, 2)]
+
+def test_occupancy_grid_is_sparse_in_large_world():
+    """広い世界の占有格子がセル数の配列を確保せず、端をまたがない範囲で全走査と同じ結果を返すことをテスト"""
+    school = School(300, seed=5, world_size=(20000, 20000))
+    # 世界の片隅に集めて、視界に入るメダカがいるようにする
+    for fish in school.fish_list:
+        fish.x, fish.y = fish.x % 400, fish.y % 400
+    grid = OccupancyGrid(20000, 20000)
+    grid.rebuild(school.fish_list)
+    assert grid.cols * grid.rows == 2000 * 2000
+    arrays = [value for value in vars(grid).values() if isinstance(value, np.ndarray)]
+    assert all(value.size <= len(school.fish_list) for value in arrays)
+    assert len(grid.cells) <= len(school.fish_list)
+    seen = [grid.query_vision(fish, 100) for fish in school.fish_list[:50]]
+    assert seen == [school.get_fish_in_vision(fish, 100) for fish in school.fish_list[:50]]
+    assert sum(map(len, seen)) > 0
+
+if __name__ == "__main__":
+    test_spatial_hash_matches_scan()
+    test_update_all_fish_matches_scan()
+    test_vision_tables_match_visibility()
+    test_cell_grid_is_sparse_in_large_world()
+    test_occupancy_grid_is_sparse_in_large_world()
+    print("テスト成功")
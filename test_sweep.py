@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+パラメータスイープのテストスクリプト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from sweep import parameter_grid, random_parameter_samples, run_sweep
+
+def test_parameter_grid_and_samples():
+    """グリッドとランダムサンプリングのパラメータ辞書をテスト"""
+    grid = parameter_grid({'separation_weight': [1.0, 2.0], 'vision_range': [50, 100, 150]})
+    assert len(grid) == 6
+    assert {(p['separation_weight'], p['vision_range']) for p in grid} == {
+        (s, v) for s in (1.0, 2.0) for v in (50, 100, 150)}
+    assert all(p['cohesion_weight'] == grid[0]['cohesion_weight'] for p in grid)
+
+    samples = random_parameter_samples({'inertia_weight': (5, 30), 'vision_range': (20, 120)}, 5, seed=3)
+    assert samples == random_parameter_samples({'inertia_weight': (5, 30), 'vision_range': (20, 120)}, 5, seed=3)
+    assert all(5 <= p['inertia_weight'] <= 30 and isinstance(p['vision_range'], int) for p in samples)
+
+def test_run_sweep():
+    """プロセスプールで実行した結果表と、同じシードでの再現性をテスト"""
+    param_sets = parameter_grid({'alignment_weight': [0.5, 1.5]})
+    rows = run_sweep(param_sets, seeds=[7, 7], fish_count=15, ticks=3, max_workers=2)
+    assert len(rows) == 4
+    assert [row['run_id'] for row in rows] == [0, 1, 2, 3]
+    assert rows[0]['alignment_weight'] == 0.5 and rows[2]['alignment_weight'] == 1.5
+    assert all(row['count'] == 15 and row['avg_age'] == 3 for row in rows)
+    # 同じパラメータ・シードなら同じ結果になる
+    assert rows[0]['center_x'] == rows[1]['center_x']
+    assert rows[0]['density'] == rows[1]['density']
+
+if __name__ == "__main__":
+    test_parameter_grid_and_samples()
+    test_run_sweep()
+    print("テスト成功")
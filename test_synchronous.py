@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+ダブルバッファ（同時更新）モードのテストスクリプト
+"""
+
+import sys
+import os
+import math
+sys.path.append(os.path.dirname(__file__))
+
+from school import School
+from array_school import ArraySchool
+
+PARAMS = {
+    'separation_weight': 1.5,
+    'alignment_weight': 1.0,
+    'cohesion_weight': 0.8,
+    'random_weight': 0.5,
+    'inertia_weight': 20.0,
+    'fish_speed': 20,
+    'vision_range': 100
+}
+
+def _states(school):
+    """メダカのID順の状態を返す"""
+    return sorted((fish.id, fish.x, fish.y, fish.dx, fish.dy) for fish in school.get_all_fish())
+
+def _assert_close(first, second):
+    for a, b in zip(first, second):
+        assert a[0] == b[0]
+        assert all(math.isclose(u, v, abs_tol=1e-9) for u, v in zip(a[1:], b[1:]))
+
+def test_synchronous_update_is_order_independent():
+    """同時更新ではリストの順序を入れ替えても結果が変わらないことをテスト"""
+    forward = School(150, seed=8, update_mode='synchronous')
+    backward = School(150, seed=8, update_mode='synchronous')
+    # IDを揃えてから順序を逆にする
+    for a, b in zip(forward.fish_list, backward.fish_list):
+        b.id = a.id
+    backward.fish_list.reverse()
+
+    for tick in range(4):
+        forward.update_all_fish(PARAMS)
+        backward.update_all_fish(PARAMS)
+    _assert_close(_states(forward), _states(backward))
+
+    # 逐次更新では順序によって結果が変わる
+    sequential = School(150, seed=8)
+    for a, b in zip(forward.fish_list, sequential.fish_list):
+        b.id = a.id
+    for tick in range(4):
+        sequential.update_all_fish(PARAMS)
+    assert _states(sequential) != _states(forward)
+
+def test_synchronous_matches_array_school():
+    """同時更新のSchoolとArraySchoolが同じ結果になることをテスト"""
+    array_school = ArraySchool(200, seed=3)
+    school = School(200, seed=3, update_mode='synchronous')
+    for fish, view in zip(school.fish_list, array_school.get_all_fish()):
+        fish.x, fish.y, fish.dx, fish.dy = view.x, view.y, view.dx, view.dy
+        fish.id = view.id
+
+    for tick in range(3):
+        school.update_all_fish(PARAMS)
+        array_school.update_all_fish(PARAMS)
+    _assert_close(_states(school), _states(array_school))
+
+if __name__ == "__main__":
+    test_synchronous_update_is_order_independent()
+    test_synchronous_matches_array_school()
+    print("テスト成功")
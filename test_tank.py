@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+複数の群れ（Tank）のテストスクリプト
+"""
+
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.dirname(__file__))
+
+from school import School
+from array_school import ArraySchool
+from tank import Tank
+
+PARAMS = {
+    'separation_weight': 1.5,
+    'alignment_weight': 1.0,
+    'cohesion_weight': 0.8,
+    'random_weight': 0.1,
+    'inertia_weight': 20.0,
+    'fish_speed': 20,
+    'vision_range': 100
+}
+
+def _make_tank(max_workers=None):
+    tank = Tank(max_workers=max_workers)
+    tank.add_school(School(80, seed=1), PARAMS)
+    tank.add_school(ArraySchool(120, seed=2), dict(PARAMS, fish_speed=5, avoid_weight=2.0))
+    tank.add_school(School(60, seed=3, update_mode='synchronous'), dict(PARAMS, vision_range=40))
+    return tank
+
+def _states(tank):
+    return [np.column_stack([school.get_state_arrays()[name] for name in ('x', 'y', 'dx', 'dy')])
+            for school in tank.schools]
+
+def test_concurrent_step_matches_sequential():
+    """群れを並行に更新しても1つずつ更新したときと同じ結果になることをテスト"""
+    concurrent, sequential = _make_tank(), _make_tank(max_workers=1)
+    try:
+        for tick in range(3):
+            concurrent.step()
+            sequential.step()
+    finally:
+        concurrent.close()
+    for a, b in zip(_states(concurrent), _states(sequential)):
+        assert np.array_equal(a, b)
+
+def test_avoidance_only_between_schools():
+    """回避の力が他の群れのメダカとの間にだけ働き、群れごとの範囲と重みを使うことをテスト"""
+    tank = Tank()
+    first = ArraySchool(2, seed=0)
+    second = ArraySchool(1, seed=0)
+    first.x[:], first.y[:] = (100.0, 110.0), (100.0, 100.0)
+    second.x[:], second.y[:] = (100.0,), (130.0,)
+    tank.add_school(first, {'avoid_range': 50, 'avoid_weight': 2.0})
+    tank.add_school(second, {'avoid_range': 20, 'avoid_weight': 1.0})
+
+    (first_x, first_y), (second_x, second_y) = tank.compute_avoidance()
+    # 同じ群れの2匹は互いを避けず、他の群れ（下にいる）からだけ離れる
+    assert np.allclose(first_x, (0.0, 2.0 * 10 / np.hypot(10, 30)))
+    assert np.allclose(first_y, (-2.0, -2.0 * 30 / np.hypot(10, 30)))
+    # 2つ目の群れの範囲（20）には誰もいない
+    assert np.allclose(second_x, 0) and np.allclose(second_y, 0)
+    assert tank.school_of.tolist() == [0, 0, 1]
+
+def test_avoidance_wraps_around_edges():
+    """画面端をまたいだ相手からは近い方向に離れることをテスト"""
+    tank = Tank()
+    first, second = ArraySchool(1, seed=0), ArraySchool(1, seed=0)
+    first.x[:], first.y[:] = (5.0,), (300.0,)
+    second.x[:], second.y[:] = (first.x[0] - 15.0) % 1600, (300.0,)
+    tank.add_school(first, {'avoid_weight': 1.0})
+    tank.add_school(second, {'avoid_weight': 1.0})
+    (first_x, _), (second_x, _) = tank.compute_avoidance()
+    assert np.allclose(first_x, 1.0) and np.allclose(second_x, -1.0)
+
+def test_per_school_parameters():
+    """群れごとのパラメータ（速度）で更新されることをテスト"""
+    tank = Tank()
+    tank.add_school(ArraySchool(50, seed=4), dict(PARAMS, fish_speed=0))
+    tank.add_school(ArraySchool(50, seed=5), dict(PARAMS, fish_speed=20))
+    before = _states(tank)
+    tank.step()
+    tank.close()
+    after = _states(tank)
+    assert np.array_equal(before[0][:, :2], after[0][:, :2])
+    assert not np.array_equal(before[1][:, :2], after[1][:, :2])
+
+def test_multiple_schools_reject_recording():
+    """複数の群れで--recordを指定すると、空の記録ファイルを作らずに引数の段階で止めることをテスト"""
+    import tempfile
+    from main import parse_args
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.traj')
+        for extra in (['--record', path], ['--threaded']):
+            try:
+                parse_args(['--schools', '2'] + extra)
+            except SystemExit as e:
+                assert e.code == 2
+            else:
+                assert False, "expected SystemExit"
+        assert not os.path.exists(path)
+    assert parse_args(['--schools', '2']).schools == 2
+
+if __name__ == "__main__":
+    test_concurrent_step_matches_sequential()
+    test_avoidance_only_between_schools()
+    test_avoidance_wraps_around_edges()
+    test_per_school_parameters()
+    test_multiple_schools_reject_recording()
+    print("テスト成功")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+軌跡ファイル（メモリマップ）の記録・読み取りのテストスクリプト
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+from trajectory import TrajectoryWriter, TrajectoryReader
+from headless import create_school, run_headless
+from utils import get_default_parameters
+
+def test_record_and_seek():
+    """毎ティックの状態を記録し、任意のティックをコピーせずに読めることをテスト"""
+    params = get_default_parameters()
+    school = create_school(40, 'python', seed=11)
+    expected = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.traj')
+        # 確保済みの容量を超えて記録しても、ファイルが伸びて記録が続く
+        with TrajectoryWriter(path, max_fish=50, params=params, seed=11, capacity=2, dtype='float64') as writer:
+            for tick in range(6):
+                school.update_all_fish(params)
+                if tick == 3:
+                    school.add_fish(5, 5)
+                writer.append(school)
+                state = school.get_state_arrays()
+                expected.append(np.stack([state['x'], state['y'], state['dx'], state['dy']], axis=1))
+
+        reader = TrajectoryReader(path)
+        assert len(reader) == 6
+        assert reader.seed == 11 and reader.params == params
+        assert [len(reader[tick]) for tick in range(6)] == [40, 40, 40, 41, 41, 41]
+        for tick in (5, 0, 3, -1):
+            assert np.array_equal(reader[tick], expected[tick])
+        assert np.shares_memory(reader[2], reader.states)
+        assert np.array_equal(reader.tick_arrays(4)['dy'], expected[4][:, 3])
+        reader.close()
+
+def test_headless_recording():
+    """ヘッドレス実行の記録が途中のティックまで読めることをテスト"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.traj')
+        school = create_school(30, 'numpy', seed=2)
+        with TrajectoryWriter(path, 30, seed=2) as writer:
+            run_headless(school, get_default_parameters(), 4, writer)
+            # 閉じる前でも記録済みのティックは読める
+            writer.flush()
+            assert len(TrajectoryReader(path)) == 4
+        reader = TrajectoryReader(path)
+        assert np.allclose(reader[3][:, 0], school.x, atol=1e-3)
+        reader.close()
+
+if __name__ == "__main__":
+    test_record_and_seek()
+    test_headless_recording()
+    print("テスト成功")
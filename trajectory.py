@@ -0,0 +1,189 @@
+import json
+import time
+import logging
+import numpy as np
+from constants import *
+
+# ファイル先頭の識別子と、固定長ヘッダーの各値の位置
+TRAJECTORY_MAGIC = b'FSTRAJ01'
+# [識別子8バイト][記録済みティック数][確保済みティック数][最大メダカ数][JSONヘッダーの長さ][JSONヘッダー]...
+_FIXED_HEADER = np.dtype([('magic', 'S8'), ('ticks', '<u8'), ('capacity', '<u8'),
+                          ('max_fish', '<u8'), ('json_length', '<u8')])
+# 記録部分はページ境界から始める
+_ALIGNMENT = 4096
+# 1ティックに記録する値（列の順）
+TRAJECTORY_FIELDS = ('x', 'y', 'dx', 'dy')
+
+
+def _record_dtype(max_fish, dtype):
+    """1ティック分の記録（メダカ数と、最大max_fish匹分の状態）"""
+    return np.dtype([('count', '<u4'), ('reserved', '<u4'),
+                     ('state', np.dtype(dtype).newbyteorder('<'), (max_fish, len(TRAJECTORY_FIELDS)))])
+
+
+def _data_offset(json_length):
+    """記録部分の開始位置"""
+    header_size = _FIXED_HEADER.itemsize + json_length
+    return (header_size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class TrajectoryWriter:
+    """ティックごとの群れ全体の位置・方向を、事前に確保したメモリマップファイルに追記する"""
+
+    def __init__(self, path, max_fish, params=None, seed=None, metadata=None, capacity=1024, dtype='float32',
+                 world_size=None):
+        self.path = path
+        self.max_fish = max_fish
+        self.capacity = max(1, capacity)
+        self.ticks = 0
+        self.logger = logging.getLogger('FishSimulator.Trajectory')
+        self._warned_overflow = False
+
+        self.header = {
+            'version': 1,
+            'fields': list(TRAJECTORY_FIELDS),
+            'dtype': np.dtype(dtype).name,
+            'screen': [SCREEN_WIDTH, SCREEN_HEIGHT],
+            'world': list(world_size or (WORLD_WIDTH, WORLD_HEIGHT)),
+            'params': dict(params or {}),
+            'seed': seed,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        self.header.update(metadata or {})
+        header_json = json.dumps(self.header, ensure_ascii=False).encode('utf-8')
+        self._record = _record_dtype(max_fish, dtype)
+        self._offset = _data_offset(len(header_json))
+
+        # 固定長ヘッダーとJSONヘッダーを書き、記録部分を確保する
+        fixed = np.zeros(1, dtype=_FIXED_HEADER)
+        fixed['magic'] = TRAJECTORY_MAGIC
+        fixed['capacity'] = self.capacity
+        fixed['max_fish'] = max_fish
+        fixed['json_length'] = len(header_json)
+        with open(path, 'wb') as f:
+            f.write(fixed.tobytes())
+            f.write(header_json)
+            f.truncate(self._offset + self.capacity * self._record.itemsize)
+        self._open_maps()
+        self.logger.info(f"Trajectory recording started: {path} (max_fish={max_fish}, capacity={self.capacity} ticks)")
+
+    def _open_maps(self):
+        """ヘッダーと記録部分をメモリマップする"""
+        self._fixed = np.memmap(self.path, dtype=_FIXED_HEADER, mode='r+', shape=(1,))
+        self._records = np.memmap(self.path, dtype=self._record, mode='r+', offset=self._offset,
+                                  shape=(self.capacity,))
+
+    def _grow(self):
+        """確保済みのティック数を2倍に増やす"""
+        self._records.flush()
+        self._fixed.flush()
+        del self._records, self._fixed
+        self.capacity *= 2
+        with open(self.path, 'r+b') as f:
+            f.truncate(self._offset + self.capacity * self._record.itemsize)
+        self._open_maps()
+        self._fixed['capacity'] = self.capacity
+
+    def append_arrays(self, x, y, dx, dy):
+        """1ティック分の状態を配列で追記（max_fishを超えた分は記録しない）"""
+        count = len(x)
+        if count > self.max_fish:
+            if not self._warned_overflow:
+                self.logger.warning(f"Fish count {count} exceeds trajectory max_fish {self.max_fish}; "
+                                    f"recording only the first {self.max_fish} fish")
+                self._warned_overflow = True
+            count = self.max_fish
+        if self.ticks >= self.capacity:
+            self._grow()
+
+        self._records['count'][self.ticks] = count
+        state = self._records['state'][self.ticks]
+        for column, values in enumerate((x, y, dx, dy)):
+            state[:count, column] = values[:count]
+        self.ticks += 1
+        # 記録済みティック数は毎回更新する（途中で終了しても記録済みの分は読める）
+        self._fixed['ticks'] = self.ticks
+
+    def append(self, school):
+        """群れの現在の状態を追記"""
+        state = school.get_state_arrays()
+        self.append_arrays(state['x'], state['y'], state['dx'], state['dy'])
+
+    def flush(self):
+        """書き込んだ内容をファイルに反映"""
+        self._records.flush()
+        self._fixed.flush()
+
+    def close(self):
+        """ファイルを閉じる（確保したまま使わなかった部分は切り詰める）"""
+        if self._records is None:
+            return
+        self.flush()
+        del self._records, self._fixed
+        self._records = self._fixed = None
+        with open(self.path, 'r+b') as f:
+            f.truncate(self._offset + self.ticks * self._record.itemsize)
+        self.logger.info(f"Trajectory recording finished: {self.path} ({self.ticks} ticks)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TrajectoryReader:
+    """TrajectoryWriterで記録したファイルを読み取り専用でメモリマップし、任意のティックをコピーせずに読む"""
+
+    def __init__(self, path):
+        self.path = path
+        fixed = np.fromfile(path, dtype=_FIXED_HEADER, count=1)
+        if len(fixed) == 0 or fixed['magic'][0] != TRAJECTORY_MAGIC:
+            raise ValueError(f"Not a trajectory file: {path}")
+        fixed = fixed[0]
+        self.ticks = int(fixed['ticks'])
+        self.max_fish = int(fixed['max_fish'])
+        json_length = int(fixed['json_length'])
+        with open(path, 'rb') as f:
+            f.seek(_FIXED_HEADER.itemsize)
+            self.header = json.loads(f.read(json_length).decode('utf-8'))
+        self.params = self.header.get('params', {})
+        self.seed = self.header.get('seed')
+        # 世界の大きさ（記録していない古いファイルは画面と同じ）
+        self.world_size = tuple(self.header.get('world', self.header.get('screen', (WORLD_WIDTH, WORLD_HEIGHT))))
+
+        record = _record_dtype(self.max_fish, self.header['dtype'])
+        if self.ticks > 0:
+            self._records = np.memmap(path, dtype=record, mode='r', offset=_data_offset(json_length),
+                                      shape=(self.ticks,))
+        else:
+            self._records = np.zeros(0, dtype=record)
+        # 全ティック分の(ティック, メダカ, 値)の配列と、ティックごとのメダカ数（どちらもファイルのビュー）
+        self.states = self._records['state']
+        self.counts = self._records['count']
+
+    def __len__(self):
+        return self.ticks
+
+    def __getitem__(self, tick):
+        """ティックtickの状態（形状(メダカ数, 4)の列x, y, dx, dyのビュー）"""
+        if tick < 0:
+            tick += self.ticks
+        if not 0 <= tick < self.ticks:
+            raise IndexError(f"tick {tick} out of range (0-{self.ticks - 1})")
+        return self.states[tick, :int(self.counts[tick])]
+
+    def tick_arrays(self, tick):
+        """ティックtickの状態を、get_state_arraysと同じ名前の配列の辞書で返す"""
+        state = self[tick]
+        return {name: state[:, column] for column, name in enumerate(TRAJECTORY_FIELDS)}
+
+    def close(self):
+        """メモリマップを解放（返したビューが残っていれば、それが解放されたときに閉じられる）"""
+        self.states = self.counts = self._records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,31 +1,82 @@
 import math
 import random
 import logging
+import logging.handlers
+import queue
+import atexit
 import time
 from constants import *
 
+# メダカ単位の詳細ログ（トレース）を出力するか。呼び出し側でこのフラグを確認してから
+# メッセージを組み立てることで、無効時は書式化のコストもかからない
+TRACE_ENABLED = False
+
+_queue_listener = None
+
 # ログ設定
-def setup_logging():
-    """ログ設定を初期化"""
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('fish_simulator.log', encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+def setup_logging(trace=False, log_file='fish_simulator.log'):
+    """ログ設定を初期化（trace=Trueでメダカ単位の詳細ログをバックグラウンドで書き出す）"""
+    global TRACE_ENABLED, _queue_listener
+    shutdown_logging()
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    # コンソールには詳細ログを流さない
+    stream_handler.setLevel(logging.INFO)
+
+    # ファイル書き込みはキュー経由で別スレッドに任せ、シミュレーションを止めない
+    log_queue = queue.SimpleQueue()
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _queue_listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.DEBUG if trace else logging.INFO)
+
+    TRACE_ENABLED = trace
     return logging.getLogger('FishSimulator')
 
+def shutdown_logging():
+    """バックグラウンドのログ書き込みを停止し、残りのログを書き出す"""
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        for handler in _queue_listener.handlers:
+            handler.close()
+        _queue_listener = None
+
+atexit.register(shutdown_logging)
+
+def get_default_parameters():
+    """update_all_fishに渡すパラメータの初期値を取得"""
+    return {
+        'separation_weight': SEPARATION_WEIGHT,
+        'alignment_weight': ALIGNMENT_WEIGHT,
+        'cohesion_weight': COHESION_WEIGHT,
+        'random_weight': RANDOM_WEIGHT,
+        'inertia_weight': INERTIA_WEIGHT,
+        'fish_speed': FISH_SPEED,
+        'vision_range': VISION_RANGE
+    }
+
 def log_fish_behavior(fish_id, behavior_type, details):
-    """メダカの行動をログに記録"""
+    """メダカの行動をログに記録（TRACE_ENABLEDのときのみ）"""
+    if not TRACE_ENABLED:
+        return
     logger = logging.getLogger('FishSimulator.Fish')
     logger.debug(f"Fish {fish_id}: {behavior_type} - {details}")
 
 def log_school_state(school_id, fish_count, density, center):
     """群れの状態をログに記録"""
     logger = logging.getLogger('FishSimulator.School')
-    logger.info(f"School {school_id}: Count={fish_count}, Density={density:.3f}, Center={center}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"School {school_id}: Count={fish_count}, Density={density:.3f}, Center={center}")
 
 def log_world_event(event_type, details):
     """世界イベントをログに記録"""
@@ -34,6 +85,8 @@ def log_world_event(event_type, details):
 
 def log_performance(operation, duration):
     """パフォーマンス情報をログに記録"""
+    if not TRACE_ENABLED:
+        return
     logger = logging.getLogger('FishSimulator.Performance')
     logger.debug(f"Performance: {operation} took {duration:.4f}s")
 
@@ -72,9 +125,27 @@ def wrap_position(x, y, width, height):
     y = y % height
     return x, y
 
-def get_random_direction():
+def random_choice(seq, rng=None):
+    """シーケンスからランダムに1つ選ぶ（rngはnumpy.random.Generator、省略時はrandomモジュール）"""
+    if rng is None:
+        return random.choice(seq)
+    return seq[int(rng.integers(len(seq)))]
+
+def random_uniform(low, high, rng=None):
+    """[low, high)の一様乱数を取得（rngはnumpy.random.Generator、省略時はrandomモジュール）"""
+    if rng is None:
+        return random.uniform(low, high)
+    return float(rng.uniform(low, high))
+
+def random_int(low, high, rng=None):
+    """[low, high]の整数乱数を取得（rngはnumpy.random.Generator、省略時はrandomモジュール）"""
+    if rng is None:
+        return random.randint(low, high)
+    return int(rng.integers(low, high + 1))
+
+def get_random_direction(rng=None):
     """ランダムな方向ベクトルを取得"""
-    angle = random.uniform(0, 2 * math.pi)
+    angle = random_uniform(0, 2 * math.pi, rng)
     return math.cos(angle), math.sin(angle)
 
 def get_direction_from_angle(angle):
@@ -105,20 +176,27 @@ def smooth_step(t):
     """スムーズステップ関数"""
     return t * t * (3 - 2 * t)
 
-def get_nearest_fish(fish, fish_list, max_distance=None):
-    """最も近いメダカを取得"""
+def get_nearest_fish(fish, fish_list, max_distance=None, neighbor_index=None, world_size=None):
+    """最も近いメダカを取得（fish_listから作ったspatial.NeighborIndexを渡すと近くのセルだけを調べる。
+    world_sizeは世界の(幅, 高さ)）"""
     if not fish_list:
         return None
     
+    index = neighbor_index.fish_index.get(id(fish)) if neighbor_index is not None else None
+    if index is not None:
+        nearest, _ = neighbor_index.query_nearest(1, max_distance, [index])
+        return fish_list[nearest[0, 0]] if nearest[0, 0] >= 0 else None
+    
     nearest_fish = None
     min_distance = float('inf')
+    world_width, world_height = world_size or (WORLD_WIDTH, WORLD_HEIGHT)
     
     for other_fish in fish_list:
         if other_fish != fish:
             dist = distance_in_torus(
                 fish.x, fish.y, 
                 other_fish.x, other_fish.y, 
-                SCREEN_WIDTH, SCREEN_HEIGHT
+                world_width, world_height
             )
             
             if max_distance is None or dist <= max_distance:
@@ -131,7 +209,7 @@ def get_nearest_fish(fish, fish_list, max_distance=None):
 def calculate_school_center(fish_list):
     """群れの中心を計算"""
     if not fish_list:
-        return SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2
+        return WORLD_WIDTH // 2, WORLD_HEIGHT // 2
     
     avg_x = sum(fish.x for fish in fish_list) / len(fish_list)
     avg_y = sum(fish.y for fish in fish_list) / len(fish_list)
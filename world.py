@@ -1,13 +1,20 @@
 import pygame
 import logging
 import time
+import numpy as np
 from constants import *
 from utils import log_world_event, log_performance
+from profiler import PROFILER
+from spatial import get_vision_rays_array, vision_mask, vision_probe_offsets
+from camera import Camera
 
 class World:
-    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, world_size=None):
         self.width = width
         self.height = height
+        # 画面に映す範囲（世界の大きさは画面と別に決められる）
+        self.camera = Camera(width, height, *(world_size or (WORLD_WIDTH, WORLD_HEIGHT)))
+        self._panning = False  # 右ドラッグで映す範囲を動かしている間True
         self.screen = None
         self.clock = None
         self.font = None
@@ -28,12 +35,26 @@ class World:
         self.show_info = True
         self.show_vision = False
         self.show_center = True
+        self.show_profiler = False
+        self.profiler_was_enabled = False  # 表示する前のプロファイラの状態（隠すときに戻す）
+        self.show_analytics = False
+        # 視界表示用の向きの区分ごとの画像（視界範囲か拡大率が変わったら作り直す）
+        self._vision_surfaces = {}
+        self._vision_surfaces_key = None
         
         # 統計情報
         self.frame_count = 0
         self.start_time = None
         
-        self.logger.info(f"World {self.world_id} created with size {width}x{height}")
+        self.logger.info(f"World {self.world_id} created with size {width}x{height}, "
+                         f"world {self.camera.world_width}x{self.camera.world_height}")
+    
+    def set_world_size(self, world_width, world_height):
+        """表示する世界の大きさを変える（読み込んだ群れの世界が違うときなど。表示範囲は初期状態に戻る）"""
+        if (world_width, world_height) != (self.camera.world_width, self.camera.world_height):
+            self.camera.set_world_size(world_width, world_height)
+            self.logger.info(f"World size changed to {world_width}x{world_height}")
+            log_world_event("WORLD_SIZE", f"{world_width}x{world_height}")
     
     def initialize(self):
         """pygameを初期化"""
@@ -60,7 +81,15 @@ class World:
     def handle_events(self):
         """イベントを処理"""
         start_time = time.time()
+        result = self._process_events()
         
+        duration = time.time() - start_time
+        log_performance("Event handling", duration)
+        PROFILER.add('events', duration)
+        return result
+    
+    def _process_events(self):
+        """溜まったイベントを順に処理し、最初の操作結果（なければTrue）を返す"""
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.logger.info("Quit event received")
@@ -76,9 +105,14 @@ class World:
                 result = self._handle_mouse_event(event)
                 if result:
                     return result
-        
-        duration = time.time() - start_time
-        log_performance("Event handling", duration)
+            
+            # 表示範囲の操作（右ドラッグで移動、ホイールで拡大縮小）
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+                self._panning = False
+            elif event.type == pygame.MOUSEMOTION and self._panning:
+                self.camera.pan(*event.rel)
+            elif event.type == pygame.MOUSEWHEEL and event.y:
+                self.camera.zoom_at(CAMERA_ZOOM_STEP ** event.y, *pygame.mouse.get_pos())
         return True
     
     def _handle_keydown_event(self, event):
@@ -96,6 +130,22 @@ class World:
             self.show_vision = not self.show_vision
             self.logger.info(f"Vision display toggled: {self.show_vision}")
             log_world_event("TOGGLE_VISION", f"Vision display: {self.show_vision}")
+        # プロファイラ表示切り替え (O)
+        elif event.key == pygame.K_o:
+            self.show_profiler = not self.show_profiler
+            # 表示中だけ計測し、隠したら元の状態（--profile指定時は計測したまま）に戻す
+            if self.show_profiler:
+                self.profiler_was_enabled = PROFILER.enabled
+                PROFILER.enabled = True
+            else:
+                PROFILER.enabled = self.profiler_was_enabled
+            self.logger.info(f"Profiler overlay toggled: {self.show_profiler}")
+            log_world_event("TOGGLE_PROFILER", f"Profiler overlay: {self.show_profiler}")
+        # 秩序変数（密度のヒストグラム・分極など）の表示切り替え (L)
+        elif event.key == pygame.K_l:
+            self.show_analytics = not self.show_analytics
+            self.logger.info(f"Analytics overlay toggled: {self.show_analytics}")
+            log_world_event("TOGGLE_ANALYTICS", f"Analytics overlay: {self.show_analytics}")
         # 群れの中心表示切り替え (T)
         elif event.key == pygame.K_t:
             self.show_center = not self.show_center
@@ -106,6 +156,28 @@ class World:
             self.logger.info("Fish position reset requested")
             log_world_event("RESET_POSITIONS", "Fish position reset requested")
             return ("reset_positions",)
+        # チェックポイントの保存・読み込み (F5/F9)
+        elif event.key == pygame.K_F5:
+            self.logger.info("Checkpoint save requested")
+            log_world_event("SAVE_CHECKPOINT", "Checkpoint save requested")
+            return ("save_checkpoint",)
+        elif event.key == pygame.K_F9:
+            self.logger.info("Checkpoint load requested")
+            log_world_event("LOAD_CHECKPOINT", "Checkpoint load requested")
+            return ("load_checkpoint",)
+        # 表示範囲を世界全体に合わせる・元に戻す (N)
+        elif event.key == pygame.K_n:
+            if self.camera.zoom > self.camera.min_zoom:
+                self.camera.fit()
+            else:
+                self.camera.reset()
+            self.logger.info(f"Camera view changed: {self.camera.describe()}")
+            log_world_event("CAMERA_VIEW", self.camera.describe())
+        # 操作する群れの切り替え (TAB、複数の群れを動かすとき)
+        elif event.key == pygame.K_TAB:
+            self.logger.info("School selection requested")
+            log_world_event("SELECT_SCHOOL", "Next school selected")
+            return ("select_school",)
         # 分離パラメータ (Q/W)
         elif event.key == pygame.K_q:
             self.separation_weight = max(0, self.separation_weight - 0.1)
@@ -180,14 +252,31 @@ class World:
             self.vision_range = VISION_RANGE
             self.logger.info("Parameters reset to default values")
             log_world_event("PARAMETER_RESET", "All parameters reset to default")
+        # 再生操作（SPACE: 一時停止、←/→: コマ送り（Shiftで1秒分）、↑/↓: 再生速度、HOME/END: 先頭/末尾）
+        elif event.key == pygame.K_SPACE:
+            return ("replay_pause",)
+        elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+            step = FPS if event.mod & pygame.KMOD_SHIFT else 1
+            return ("replay_step", step if event.key == pygame.K_RIGHT else -step)
+        elif event.key == pygame.K_UP:
+            return ("replay_speed", 2.0)
+        elif event.key == pygame.K_DOWN:
+            return ("replay_speed", 0.5)
+        elif event.key == pygame.K_HOME:
+            return ("replay_seek", 0)
+        elif event.key == pygame.K_END:
+            return ("replay_seek", -1)
     
     def _handle_mouse_event(self, event):
         """マウスイベントを処理"""
-        if event.button == 1:  # 左クリック
-            x, y = event.pos
-            self.logger.info(f"Mouse click at position ({x}, {y})")
+        if event.button == 1:  # 左クリック（クリックした画面上の位置に映っている世界座標に追加）
+            world_x, world_y = self.camera.screen_to_world(*event.pos)
+            x, y = int(world_x), int(world_y)
+            self.logger.info(f"Mouse click at position {event.pos} -> world ({x}, {y})")
             log_world_event("MOUSE_CLICK", f"Position: ({x}, {y})")
             return ("add_fish", x, y)
+        if event.button == 3:  # 右ドラッグで表示範囲を移動
+            self._panning = True
         return None
     
     def draw_background(self):
@@ -196,14 +285,17 @@ class World:
         self.screen.fill(self.background_color)
         duration = time.time() - start_time
         log_performance("Background drawing", duration)
+        PROFILER.add('background', duration)
     
     def draw_info(self, school):
-        """情報を描画"""
+        """情報を描画（プロファイラ表示は情報表示と別に切り替える）"""
+        start_time = time.time()
+        if self.show_profiler:
+            self._draw_profiler()
         if not self.show_info:
+            PROFILER.add('overlays', time.time() - start_time)
             return
         
-        start_time = time.time()
-        
         # 基本情報
         info_lines = [
             f"Fish Count: {school.get_fish_count()}",
@@ -218,13 +310,20 @@ class World:
             f"Speed: {self.fish_speed:.1f} (G/H)",
             f"Vision: {self.vision_range} (J/K)",
             "",
+            self.camera.describe(),
+            f"Detail: {getattr(school.renderer, 'last_lod', None) or '-'}",
+            "",
             "Controls:",
             "I - Toggle Info",
             "V - Toggle Vision",
             "T - Toggle Center",
+            "O - Toggle Profiler",
+            "L - Toggle Analytics",
             "P - Reset Positions",
             "R - Reset Parameters",
+            "F5/F9 - Save/Load Checkpoint",
             "Mouse - Add Fish",
+            "Right Drag/Wheel - Pan/Zoom, N - Fit View",
             "ESC - Quit"
         ]
         
@@ -237,58 +336,67 @@ class World:
         
         duration = time.time() - start_time
         log_performance("Info drawing", duration)
+        PROFILER.add('overlays', duration)
+    
+    def _draw_profiler(self):
+        """段階ごとの処理時間（直近のp50/p95/p99、ミリ秒）を画面右上に描画"""
+        rows = [("Profile (ms)", "p50", "p95", "p99")]
+        rows += [(stage, f"{stats['p50_ms']:.2f}", f"{stats['p95_ms']:.2f}", f"{stats['p99_ms']:.2f}")
+                 for stage, stats in PROFILER.summary().items()]
+        x_offset = self.width - 320
+        for row, values in enumerate(rows):
+            color = GREEN if row == 0 else WHITE
+            for column, text in enumerate(values):
+                text_surface = self.font.render(text, True, color)
+                # 数値は列ごとに右揃え
+                x = x_offset if column == 0 else x_offset + 120 + column * 60 - text_surface.get_width()
+                self.screen.blit(text_surface, (x, 10 + row * 20))
+    
+    def _get_vision_surface(self, front):
+        """向きの区分frontの視界を描いた画像（視界範囲か拡大率が変わったら作り直す）"""
+        key = (self.vision_range, self.camera.zoom)
+        if self._vision_surfaces_key != key:
+            self._vision_surfaces = {}
+            self._vision_surfaces_key = key
+        if front not in self._vision_surfaces:
+            # 視界判定と同じ表から、見える範囲の輪郭を暗い緑で、チェック位置を点で描く（黒は透過）
+            mask, reach = vision_mask(front, self.vision_range)
+            inside = mask.copy()
+            inside[1:-1, 1:-1] &= mask[:-2, 1:-1] & mask[2:, 1:-1] & mask[1:-1, :-2] & mask[1:-1, 2:]
+            pixels = np.zeros(mask.shape + (3,), dtype=np.uint8)
+            pixels[mask & ~inside] = (0, 100, 0)
+            surface = pygame.surfarray.make_surface(pixels)
+            for probe_x, probe_y in vision_probe_offsets(front, self.vision_range).reshape(-1, 2).tolist():
+                pygame.draw.circle(surface, GREEN, (probe_x + reach, probe_y + reach), 1)
+            if self.camera.zoom != 1.0:
+                size = max(1, round(surface.get_width() * self.camera.zoom))
+                surface = pygame.transform.scale(surface, (size, size))
+                reach = size // 2
+            surface.set_colorkey(BLACK, pygame.RLEACCEL)
+            self._vision_surfaces[front] = (surface, reach)
+        return self._vision_surfaces[front]
     
     def draw_vision_areas(self, school):
-        """視界範囲を描画（前方のマスをざっくり表示）"""
+        """視界範囲を描画（群れの視界判定と同じチェック位置の表から作った画像を、向きの区分ごとに転送。画面外のメダカは除く）"""
         if not self.show_vision:
             return
         
         start_time = time.time()
         
-        for fish in school.get_all_fish():
-            fish_x, fish_y = fish.get_position()
-            dx, dy = fish.get_direction()
-            
-            # 方向を8方向に正規化
-            if abs(dx) > abs(dy):
-                direction_x = 1 if dx > 0 else -1
-                direction_y = 0
-            elif abs(dy) > abs(dx):
-                direction_x = 0
-                direction_y = 1 if dy > 0 else -1
-            else:
-                direction_x = 1 if dx > 0 else -1
-                direction_y = 1 if dy > 0 else -1
-            
-            # 前方のマスを小さな点で表示
-            for distance in range(1, min(self.vision_range, 20) + 1):  # 表示は20マスまでに制限
-                # 前方
-                check_x = fish_x + direction_x * distance
-                check_y = fish_y + direction_y * distance
-                pygame.draw.circle(self.screen, GREEN, (int(check_x), int(check_y)), 1)
-                
-                # 斜め前（左右）も表示
-                if direction_x != 0 and direction_y != 0:
-                    check_left_x = fish_x + direction_x * distance
-                    check_left_y = fish_y
-                    check_right_x = fish_x
-                    check_right_y = fish_y + direction_y * distance
-                elif direction_x != 0:
-                    check_left_x = fish_x + direction_x * distance
-                    check_left_y = fish_y - distance
-                    check_right_x = fish_x + direction_x * distance
-                    check_right_y = fish_y + distance
-                else:
-                    check_left_x = fish_x - distance
-                    check_left_y = fish_y + direction_y * distance
-                    check_right_x = fish_x + distance
-                    check_right_y = fish_y + direction_y * distance
-                
-                pygame.draw.circle(self.screen, GREEN, (int(check_left_x), int(check_left_y)), 1)
-                pygame.draw.circle(self.screen, GREEN, (int(check_right_x), int(check_right_y)), 1)
+        state = school.get_state_arrays()
+        visible, screen_x, screen_y = self.camera.project(state['x'], state['y'],
+                                                          margin=self.vision_range * self.camera.zoom)
+        rays = get_vision_rays_array(np.asarray(state['dx'])[visible], np.asarray(state['dy'])[visible])
+        blits = []
+        for fish_x, fish_y, front_x, front_y in zip(screen_x.tolist(), screen_y.tolist(),
+                                                    rays[:, 0, 0].tolist(), rays[:, 0, 1].tolist()):
+            surface, reach = self._get_vision_surface((front_x, front_y))
+            blits.append((surface, (int(fish_x) - reach, int(fish_y) - reach)))
+        self.screen.blits(blits, doreturn=False)
         
         duration = time.time() - start_time
         log_performance("Vision areas drawing", duration)
+        PROFILER.add('overlays', duration)
     
     def draw_school_center(self, school):
         """群れの中心を描画"""
@@ -297,11 +405,54 @@ class World:
         
         start_time = time.time()
         
-        center_x, center_y = school.get_school_center()
+        center_x, center_y = self.camera.world_to_screen(*school.get_school_center())
         pygame.draw.circle(self.screen, RED, (int(center_x), int(center_y)), 5)
         
         duration = time.time() - start_time
         log_performance("School center drawing", duration)
+        PROFILER.add('overlays', duration)
+    
+    def draw_analytics(self, analytics, map_width=256):
+        """秩序変数を画面右下に描画（世界全体の密度のヒストグラムを縦横比を保った小さな地図にし、その上に数値を並べる）"""
+        if not self.show_analytics:
+            return
+        
+        start_time = time.time()
+        lines = analytics.format_lines()
+        y_offset = self.height - 10
+        if analytics.latest is not None:
+            density = analytics.latest['density']
+            levels = np.log1p(density) / max(np.log1p(density.max()), 1e-9)
+            pixels = (levels[:, :, None] * np.array(GREEN, dtype=np.float64)).astype(np.uint8)
+            map_height = max(1, round(map_width * self.camera.world_height / self.camera.world_width))
+            surface = pygame.transform.scale(pygame.surfarray.make_surface(pixels), (map_width, map_height))
+            y_offset -= map_height
+            self.screen.blit(surface, (self.width - map_width - 10, y_offset))
+            pygame.draw.rect(self.screen, WHITE, (self.width - map_width - 10, y_offset, map_width, map_height), 1)
+        text_surfaces = [self.font.render(line, True, WHITE) for line in lines]
+        text_x = self.width - max([map_width] + [surface.get_width() for surface in text_surfaces]) - 10
+        y_offset -= 20 * len(lines) + 5
+        for text_surface in text_surfaces:
+            self.screen.blit(text_surface, (text_x, y_offset))
+            y_offset += 20
+        PROFILER.add('overlays', time.time() - start_time)
+    
+    def draw_status_lines(self, lines):
+        """状態表示の行を画面下に描画"""
+        if not self.show_info:
+            return
+        
+        start_time = time.time()
+        y_offset = self.height - 20 * len(lines) - 10
+        for line in lines:
+            text_surface = self.font.render(line, True, WHITE)
+            self.screen.blit(text_surface, (10, y_offset))
+            y_offset += 20
+        PROFILER.add('overlays', time.time() - start_time)
+    
+    def draw_replay_status(self, status):
+        """再生状態と再生操作を画面下に描画"""
+        self.draw_status_lines([status, "SPACE - Pause  LEFT/RIGHT - Step (Shift: 1s)  UP/DOWN - Speed  HOME/END - Seek"])
     
     def update_display(self):
         """画面を更新"""
@@ -309,6 +460,7 @@ class World:
         pygame.display.flip()
         duration = time.time() - start_time
         log_performance("Display update", duration)
+        PROFILER.add('flip', duration)
         
         self.frame_count += 1
         if self.frame_count % 60 == 0:  # 1秒ごと
@@ -346,6 +498,13 @@ class World:
             'inertia_weight': self.inertia_weight
         }
     
+    def get_simulation_parameters(self):
+        """群れの更新に渡すパラメータを取得（速度・視界範囲を含む）"""
+        params = self.get_parameters()
+        params['fish_speed'] = self.fish_speed
+        params['vision_range'] = self.vision_range
+        return params
+    
     def set_parameters(self, params):
         """パラメータを設定"""
         old_params = self.get_parameters()
@@ -355,6 +514,8 @@ class World:
         self.cohesion_weight = params.get('cohesion_weight', self.cohesion_weight)
         self.random_weight = params.get('random_weight', self.random_weight)
         self.inertia_weight = params.get('inertia_weight', self.inertia_weight)
+        self.fish_speed = params.get('fish_speed', self.fish_speed)
+        self.vision_range = params.get('vision_range', self.vision_range)
         
         self.logger.info(f"Parameters updated: {params}")
         log_world_event("PARAMETERS_SET", f"New parameters: {params}")